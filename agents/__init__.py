@@ -25,7 +25,7 @@ from .harmony import play_harmony
 
 from .drum import train_drum
 
-from .coplay import play_agents
+from .coplay import play_agents, warm_up_agents, save_example
 
 from .create_agents import create_agents
 
@@ -34,6 +34,8 @@ from .utils import (
     beats_to_seconds,
     seconds_to_beat,
     adjust_for_key,
+    Generation_Cancelled,
+    cancellable,
 )
 
 from .eval_all_agents import eval_all_agents
@@ -1,4 +1,4 @@
 from .bass_network import Bass_Network, Bass_Network_LSTM
-from .train_bass import train_bass
+from .train_bass import train_bass, create_bass_trainer
 from .eval_agent import predict_next_k_notes_bass, get_primer_sequence_bass
 from .play_bass import play_bass, play_known_bass
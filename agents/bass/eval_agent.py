@@ -3,7 +3,7 @@ import torch.nn.functional as F
 
 from config import DEVICE
 from data_processing import Bass_Dataset
-from ..utils import select_with_preference
+from ..utils import select_with_preference, check_cancelled
 
 
 def predict_next_k_notes_bass(model, dataset_primer, config) -> list[int, int]:
@@ -19,6 +19,7 @@ def predict_next_k_notes_bass(model, dataset_primer, config) -> list[int, int]:
 
     with torch.no_grad():
         while True:
+            check_cancelled()
             note_output, duration_output = model(note_sequence, duration_sequence)
 
             # Apply softmax to get probabilities for notes and durations
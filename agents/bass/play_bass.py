@@ -1,5 +1,4 @@
 import pretty_midi
-import torch
 import random
 from mido import MidiFile
 
@@ -7,7 +6,7 @@ from .eval_agent import predict_next_k_notes_bass
 from config import MODEL_PATH_BASS_LSTM, DEVICE
 from data_processing import Bass_Dataset
 from .bass_network import Bass_Network
-from ..utils import beats_to_seconds, seconds_to_beat, adjust_for_key
+from ..utils import beats_to_seconds, seconds_to_beat, adjust_for_key, load_cached
 
 
 def play_bass(
@@ -30,7 +29,7 @@ def play_bass(
         the bass instrument, and the predicted bass sequence.
     """
 
-    bass_agent: Bass_Network = torch.load(MODEL_PATH_BASS_LSTM, DEVICE)
+    bass_agent: Bass_Network = load_cached(MODEL_PATH_BASS_LSTM, DEVICE)
     bass_agent.eval()
 
     predicted_bass_sequence: list[int, int] = predict_next_k_notes_bass(
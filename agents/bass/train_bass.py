@@ -1,10 +1,18 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data._utils.collate import default_collate
 import matplotlib.pyplot as plt
 import numpy as np
 import json
 
+from ..training_data import create_dataloader
+from ..trainer import Trainer
+from ..mixed_precision import create_optimizer
+from ..distributed import is_main_process
+from data_processing import transpose_bass_batch, read_manifest
+
 from config import (
     BATCH_SIZE_BASS,
     LEARNING_RATE_BASS,
@@ -18,6 +26,7 @@ from config import (
     DEVICE,
     MODEL_PATH_BASS_LSTM,
     MODEL_PATH_BASS_LSTM_TEST,
+    TRANSPOSE_AUGMENTATION_BASS,
 )
 
 
@@ -30,61 +39,12 @@ def train_bass(model: nn.Module) -> None:
     model : nn.Module
         The bass model to be trained.
     """
-    bass_dataset_train = torch.load(TRAIN_DATASET_PATH_BASS)
-    bass_dataset_val = torch.load(VAL_DATASET_PATH_BASS)
-
-    # Create DataLoader
-    dataloader_train = DataLoader(
-        bass_dataset_train, batch_size=BATCH_SIZE_BASS, shuffle=True
-    )
-    dataloader_val = DataLoader(
-        bass_dataset_val, batch_size=BATCH_SIZE_BASS, shuffle=True
-    )
-
-    # Initialize model, loss function, and optimizer
-    criterion = nn.CrossEntropyLoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE_BASS)
-    loss_list = []
-    val_loss_list = []
-
-    # Training loop
-    for epoch in range(NUM_EPOCHS_BASS):
-        batch_loss = []
-        for batch_idx, (notes, durations, targets) in enumerate(dataloader_train):
-            if batch_idx > MAX_BATCHES_BASS:
-                break
-            notes = notes.to(DEVICE)
-            durations = durations.to(DEVICE)
-            targets = targets.to(DEVICE)
-
-            # Separate note and duration targets
-            note_targets, duration_targets = targets[:, 0], targets[:, 1]
-
-            # Zero gradients
-            optimizer.zero_grad()
-
-            # Forward pass
-            note_output, duration_output = model(notes, durations)
+    trainer = create_bass_trainer(model)
+    loss_list, val_loss_list = trainer.fit()
 
-            # Compute losses for both notes and durations
-            note_loss = criterion(note_output, note_targets)
-            duration_loss = criterion(duration_output, duration_targets)
-
-            # Combine the losses
-            combined_loss = note_loss * ALPHA1_BASS + duration_loss * ALPHA2_BASS
-
-            # Backward pass and optimize
-            combined_loss.backward()
-            optimizer.step()
-            batch_loss.append(combined_loss.item())
-
-        val_loss = get_validation_loss(model, dataloader_val, criterion)
-
-        loss_list.append(np.mean(batch_loss))
-        val_loss_list.append(val_loss)
-        print(
-            f"Epoch:  {epoch + 1} Loss: {round(loss_list[-1], 2)} Validation loss: {round(val_loss_list[-1],2)}"
-        )
+    # Only the main process saves the results of a distributed run
+    if not is_main_process():
+        return
 
     with open(
         "results/data/bass/training_data"
@@ -104,43 +64,91 @@ def train_bass(model: nn.Module) -> None:
         torch.save(model, MODEL_PATH_BASS)
 
 
-def get_validation_loss(model: nn.Module, dataloader: DataLoader, criterion) -> float:
+def create_bass_trainer(model: nn.Module) -> Trainer:
     """
-    Calculate the validation loss for a given model using the provided dataloader and criterion.
+    Creates the Trainer of the bass model, with its data, optimizer and loss.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The bass model to be trained.
+
+    Returns
+    -------
+    Trainer
+        The Trainer, ready to fit.
+    """
+    bass_dataset_train = torch.load(TRAIN_DATASET_PATH_BASS)
+    bass_dataset_val = torch.load(VAL_DATASET_PATH_BASS)
+
+    # Create DataLoader, the training samples are transposed at random if enabled
+    dataloader_train = create_dataloader(
+        bass_dataset_train,
+        BATCH_SIZE_BASS,
+        collate_fn=collate_transposed if TRANSPOSE_AUGMENTATION_BASS else None,
+    )
+    dataloader_val = create_dataloader(bass_dataset_val, BATCH_SIZE_BASS)
+
+    # Initialize optimizer
+    optimizer = create_optimizer(
+        torch.optim.Adam, model.parameters(), lr=LEARNING_RATE_BASS
+    )
+
+    return Trainer(
+        model,
+        optimizer,
+        get_loss,
+        dataloader_train,
+        dataloader_val,
+        NUM_EPOCHS_BASS,
+        MAX_BATCHES_BASS,
+        "bass_" + str(model),
+        signature=(
+            read_manifest().get("bass_and_chord"),
+            LEARNING_RATE_BASS,
+            BATCH_SIZE_BASS,
+            MAX_BATCHES_BASS,
+            ALPHA1_BASS,
+            ALPHA2_BASS,
+            TRANSPOSE_AUGMENTATION_BASS,
+        ),
+    )
+
+
+def collate_transposed(samples: list) -> list:
+    """
+    Collates Bass_Dataset samples and transposes each by a random number of half steps.
+    """
+    return transpose_bass_batch(default_collate(samples))
+
+
+def get_loss(model: nn.Module, batch) -> torch.Tensor:
+    """
+    Calculates the combined note and duration loss of the model on a batch.
 
     Args:
     ----------
-        model (nn.Module): The model to evaluate.
-        dataloader (DataLoader): The dataloader containing the validation data.
-        criterion: The loss criterion used for calculating the loss.
+        model (nn.Module): The bass model.
+        batch (tuple): The notes, durations and targets of the batch, on DEVICE.
 
     Returns:
     ----------
-        float: The average validation loss.
+        torch.Tensor: The combined loss.
     """
+    notes, durations, targets = batch
 
-    model.eval()
-    batch_loss = []
-    for batch_idx, (notes, durations, targets) in enumerate(dataloader):
-        if batch_idx > MAX_BATCHES_BASS / 10:
-            break
-        # Separate note and duration targets
-        note_targets, duration_targets = targets[:, 0], targets[:, 1]
-
-        # Forward pass
-        note_output, duration_output = model(notes, durations)
-
-        # Compute losses for both notes and durations
-        note_loss = criterion(note_output, note_targets)
-        duration_loss = criterion(duration_output, duration_targets)
+    # Separate note and duration targets
+    note_targets, duration_targets = targets[:, 0], targets[:, 1]
 
-        # Combine the losses
-        combined_loss = note_loss * ALPHA1_BASS + duration_loss * ALPHA2_BASS
+    # Forward pass
+    note_output, duration_output = model(notes, durations)
 
-        batch_loss.append(combined_loss.item())
+    # Compute losses for both notes and durations
+    note_loss = F.cross_entropy(note_output, note_targets)
+    duration_loss = F.cross_entropy(duration_output, duration_targets)
 
-    model.train()
-    return np.mean(batch_loss)
+    # Combine the losses
+    return note_loss * ALPHA1_BASS + duration_loss * ALPHA2_BASS
 
 
 import matplotlib.pyplot as plt
@@ -5,5 +5,5 @@ from .chord_network import (
     Chord_Network_Non_Coop,
     Chord_Network_Full,
 )
-from .train_chord import train_chord, train_chord_bass_model
+from .train_chord import train_chord, create_chord_trainer
 from .eval_agent import predict_next_k_notes_chords
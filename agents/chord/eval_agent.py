@@ -4,6 +4,7 @@ import torch.nn.functional as F
 import copy
 
 from .chord_network import Chord_Network
+from ..utils import check_cancelled
 
 
 def predict_next_k_notes_chords(
@@ -42,6 +43,7 @@ def predict_next_k_notes_chords(
     print("Generating chords uding ", str(model))
     with torch.no_grad():
         for i in range(len(full_bass_sequence)):
+            check_cancelled()
             # Predict chord type
             output = model(input_sequence)
 
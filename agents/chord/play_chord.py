@@ -4,7 +4,7 @@ import random
 import torch
 
 from .eval_agent import predict_next_k_notes_chords
-from ..utils import beats_to_seconds, adjust_for_key
+from ..utils import beats_to_seconds, adjust_for_key, load_cached
 
 from config import (
     MODEL_PATH_CHORD_LSTM,
@@ -291,7 +291,7 @@ def get_timed_chord_sequence(
     """
     # if config["NON_COOPERATIVE"]:
     #     chord_agent = torch.load(MODEL_NON_COOP_PATH_CHORD, DEVICE)
-    chord_agent = torch.load(MODEL_PATH_CHORD_LSTM, DEVICE)
+    chord_agent = load_cached(MODEL_PATH_CHORD_LSTM, DEVICE)
     chord_agent.eval()
 
     full_chord_sequence = predict_next_k_notes_chords(
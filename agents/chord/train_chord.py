@@ -1,10 +1,19 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data._utils.collate import default_collate
 import matplotlib.pyplot as plt
 import numpy as np
 import json
+from functools import partial
+
+from ..training_data import create_dataloader
+from ..trainer import Trainer
+from ..mixed_precision import create_optimizer
+from ..distributed import is_main_process
+from data_processing import transpose_chord_batch, read_manifest
 
 from config import (
     BATCH_SIZE_CHORD,
@@ -23,6 +32,7 @@ from config import (
     MODEL_CHORD_BASS_PATH,
     MODEL_PATH_CHORD_LSTM,
     MODEL_PATH_CHORD_LSTM_TEST1,
+    TRANSPOSE_AUGMENTATION_CHORD,
 )
 
 
@@ -34,67 +44,18 @@ def train_chord(model: nn.Module) -> None:
     ----------
     model : nn.Module
         The chord network model to be trained.
-    dataset : Dataset
-        The dataset to be used for training the model.
 
     Returns
     -------
     None
     """
-    if "full" in str(model):
-        train_chord_bass_model(model)
-        return
-
-    chord_dataset_train = torch.load(TRAIN_DATASET_PATH_CHORD)
-    chord_dataset_val = torch.load(VAL_DATASET_PATH_CHORD)
-
-    # Create DataLoader
-    dataloader_train = DataLoader(
-        chord_dataset_train, batch_size=BATCH_SIZE_CHORD, shuffle=True
-    )
-    dataloader_val = DataLoader(
-        chord_dataset_val, batch_size=BATCH_SIZE_CHORD, shuffle=True
-    )
-
-    # Initialize model, loss function, and optimizer
-    criterion = nn.CrossEntropyLoss()
-    optimizer = torch.optim.Adam(
-        model.parameters(), lr=LEARNING_RATE_CHORD, weight_decay=WEIGHT_DECAY_CHORD
-    )
-    loss_list = []
-    val_loss_list = []
-    model.to(DEVICE)
-
-    # Training loop
-    for epoch in range(NUM_EPOCHS_CHORD):
-        batch_loss = []
-        for batch_idx, (data, targets) in enumerate(dataloader_train):
-            if batch_idx > MAX_BATCHES_CHORD:
-                break
-            # Zero gradients
-            optimizer.zero_grad()
-            data = data.to(DEVICE)
-            targets = targets.to(DEVICE).squeeze()
-            # Forward pass
-            output = model(data)
-
-            # Compute loss
-            loss = criterion(output, targets)
+    trainer = create_chord_trainer(model)
+    loss_list, val_loss_list = trainer.fit()
 
-            # Backward pass and optimize
-            loss.backward()
-            optimizer.step()
-
-            batch_loss.append(loss.item())
-
-        val_loss = get_validation_loss(model, dataloader_val, criterion)
-
-        loss_list.append(np.mean(batch_loss))
-        val_loss_list.append(val_loss)
+    # Only the main process saves the results of a distributed run
+    if not is_main_process():
+        return
 
-        print(
-            f"Epoch:  {epoch + 1} Loss: {round(loss_list[-1], 6)} Validation loss: {round(val_loss_list[-1],6)}"
-        )
     with open(
         "results/data/chord/"
         + str(model)
@@ -107,7 +68,9 @@ def train_chord(model: nn.Module) -> None:
         json.dump(val_loss_list, file)
 
     plot_loss(loss_list, val_loss_list)
-    if "non_coop" in str(model):
+    if "full" in str(model):
+        torch.save(model, MODEL_CHORD_BASS_PATH)
+    elif "non_coop" in str(model):
         torch.save(model, MODEL_NON_COOP_PATH_CHORD)
     elif "lstm" in str(model):
         torch.save(model, MODEL_PATH_CHORD_LSTM_TEST1)
@@ -115,147 +78,128 @@ def train_chord(model: nn.Module) -> None:
         torch.save(model, MODEL_PATH_CHORD)
 
 
-def train_chord_bass_model(model: nn.Module) -> None:
-    chord_dataset_train = torch.load(TRAIN_DATASET_PATH_CHORD_BASS)
-    chord_dataset_train_2 = torch.load(TRAIN_DATASET_PATH_CHORD)
-    chord_dataset_val = torch.load(VAL_DATASET_PATH_CHORD_BASS)
-    chord_dataset_val_2 = torch.load(VAL_DATASET_PATH_CHORD)
+def create_chord_trainer(model: nn.Module) -> Trainer:
+    """
+    Creates the Trainer of the chord model, with its data, optimizer and loss.
+    The chord-bass model is trained on the chord-bass dataset, without weight decay.
+
+    Parameters
+    ----------
+    model : nn.Module
+        The chord network model to be trained.
 
-    # Create DataLoader
-    dataloader_train = DataLoader(
-        chord_dataset_train, batch_size=BATCH_SIZE_CHORD, shuffle=True
+    Returns
+    -------
+    Trainer
+        The Trainer, ready to fit.
+    """
+    if "full" in str(model):
+        chord_dataset_train = torch.load(TRAIN_DATASET_PATH_CHORD_BASS)
+        chord_dataset_val = torch.load(VAL_DATASET_PATH_CHORD_BASS)
+        loss_fn = get_loss_full
+        weight_decay = 0
+    else:
+        chord_dataset_train = torch.load(TRAIN_DATASET_PATH_CHORD)
+        chord_dataset_val = torch.load(VAL_DATASET_PATH_CHORD)
+        loss_fn = get_loss
+        weight_decay = WEIGHT_DECAY_CHORD
+
+    # Create DataLoader, the training samples are transposed at random if enabled
+    collate_fn = None
+    if TRANSPOSE_AUGMENTATION_CHORD:
+        # The labels of the chord-bass dataset start with the root too
+        collate_fn = partial(collate_transposed, transpose_labels="full" in str(model))
+    dataloader_train = create_dataloader(
+        chord_dataset_train, BATCH_SIZE_CHORD, collate_fn=collate_fn
     )
-    dataloader_val = DataLoader(
-        chord_dataset_val, batch_size=BATCH_SIZE_CHORD, shuffle=True
+    dataloader_val = create_dataloader(chord_dataset_val, BATCH_SIZE_CHORD)
+
+    # Initialize model and optimizer
+    optimizer = create_optimizer(
+        torch.optim.Adam,
+        model.parameters(),
+        lr=LEARNING_RATE_CHORD,
+        weight_decay=weight_decay,
     )
-
-    # Initialize model, loss function, and optimizer
-    criterion = nn.CrossEntropyLoss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE_CHORD)
-    loss_list = []
-    val_loss_list = []
     model.to(DEVICE)
 
-    # Training loop
-    for epoch in range(NUM_EPOCHS_CHORD):
-        batch_loss = []
-        for batch_idx, (data, targets) in enumerate(dataloader_train):
-            if batch_idx > MAX_BATCHES_CHORD:
-                break
-            # Zero gradients
-            optimizer.zero_grad()
-            data = data.to(DEVICE)
-            targets = targets.to(DEVICE)
-
-            root = data[:, :, 0]
-            chord = data[:, :, 1]
-            duration = data[:, :, 2]
-
-            target_root = targets[:, 0]
-            target_chord = targets[:, 1]
-            target_duration = targets[:, 2]
-
-            # Forward pass
-            output_root, output_chord, output_duration = model(root, chord, duration)
-
-            loss_root = criterion(output_root, target_root)
-            loss_chord = criterion(output_chord, target_chord)
-            loss_duration = criterion(output_duration, target_duration)
-
-            combined_loss = (loss_chord + loss_duration + loss_root) / 3
-
-            combined_loss.backward()
-            optimizer.step()
-
-            batch_loss.append(combined_loss.item())
-
-        val_loss = get_validation_loss_full(model, dataloader_val, criterion)
-
-        loss_list.append(np.mean(batch_loss))
-        val_loss_list.append(val_loss)
+    return Trainer(
+        model,
+        optimizer,
+        loss_fn,
+        dataloader_train,
+        dataloader_val,
+        NUM_EPOCHS_CHORD,
+        MAX_BATCHES_CHORD,
+        "chord_" + str(model),
+        loss_precision=6,
+        signature=(
+            read_manifest().get("bass_and_chord"),
+            LEARNING_RATE_CHORD,
+            weight_decay,
+            BATCH_SIZE_CHORD,
+            MAX_BATCHES_CHORD,
+            TRANSPOSE_AUGMENTATION_CHORD,
+        ),
+    )
 
-        print(
-            f"Epoch:  {epoch + 1} Loss: {round(loss_list[-1], 6)} Validation loss: {round(val_loss_list[-1],6)}"
-        )
 
-    with open(
-        "results/data/chord/"
-        + str(model)
-        + "/training_data"
-        + str(NUM_EPOCHS_CHORD)
-        + ".json",
-        "w",
-    ) as file:
-        json.dump(loss_list, file)
-        json.dump(val_loss_list, file)
-
-    plot_loss(loss_list, val_loss_list)
-    torch.save(model, MODEL_CHORD_BASS_PATH)
+def collate_transposed(samples: list, transpose_labels: bool = False) -> list:
+    """
+    Collates chord samples and transposes each by a random number of half steps.
+    """
+    return transpose_chord_batch(default_collate(samples), transpose_labels)
 
 
-def get_validation_loss(model: nn.Module, dataloader: DataLoader, criterion) -> float:
+def get_loss(model: nn.Module, batch) -> torch.Tensor:
     """
-    Calculate the validation loss for a given model using the provided dataloader and criterion.
+    Calculate the loss of the chord model on a batch.
 
     Args:
     ----------
-        model (nn.Module): The model to evaluate.
-        dataloader (DataLoader): The dataloader containing the validation data.
-        criterion: The loss criterion used for calculating the loss.
+        model (nn.Module): The chord model.
+        batch (tuple): The data and targets of the batch, on DEVICE.
 
     Returns:
     ----------
-        float: The average validation loss.
+        torch.Tensor: The loss.
     """
-    model.eval()
-    batch_loss = []
-    for batch_idx, (data, targets) in enumerate(dataloader):
-        if batch_idx > MAX_BATCHES_CHORD / 10:
-            break
-        targets = targets.to(DEVICE).squeeze()
-        output = model(data)
-
-        # Compute loss
-        loss = criterion(output, targets)
-
-        batch_loss.append(loss.item())
+    data, targets = batch
+    output = model(data)
+    return F.cross_entropy(output, targets.squeeze())
 
-    model.train()
-    return np.mean(batch_loss)
 
+def get_loss_full(model: nn.Module, batch) -> torch.Tensor:
+    """
+    Calculate the average of the root, chord and duration losses of the chord-bass model on a batch.
 
-def get_validation_loss_full(
-    model: nn.Module, dataloader: DataLoader, criterion
-) -> float:
-    model.eval()
-    batch_loss = []
-    for batch_idx, (data, targets) in enumerate(dataloader):
-        if batch_idx > MAX_BATCHES_CHORD / 10:
-            break
-        data = data.to(DEVICE)
-
-        root = data[:, :, 0]
-        chord = data[:, :, 1]
-        duration = data[:, :, 2]
+    Args:
+    ----------
+        model (nn.Module): The chord-bass model.
+        batch (tuple): The data and targets of the batch, on DEVICE.
 
-        targets = targets.to(DEVICE)
+    Returns:
+    ----------
+        torch.Tensor: The combined loss.
+    """
+    data, targets = batch
 
-        target_root = targets[:, 0]
-        target_chord = targets[:, 1]
-        target_duration = targets[:, 2]
+    root = data[:, :, 0]
+    chord = data[:, :, 1]
+    duration = data[:, :, 2]
 
-        output_root, output_chord, output_duration = model(root, chord, duration)
+    target_root = targets[:, 0]
+    target_chord = targets[:, 1]
+    target_duration = targets[:, 2]
 
-        loss_root = criterion(output_root, target_root)
-        loss_chord = criterion(output_chord, target_chord)
-        loss_duration = criterion(output_duration, target_duration)
-        total_loss = (loss_root + loss_chord + loss_duration) / 3
+    # Forward pass
+    output_root, output_chord, output_duration = model(root, chord, duration)
 
-        # Backward pass and optimize
-        batch_loss.append(total_loss.item())
+    loss_root = F.cross_entropy(output_root, target_root)
+    loss_chord = F.cross_entropy(output_chord, target_chord)
+    loss_duration = F.cross_entropy(output_duration, target_duration)
 
-    model.train()
-    return np.mean(batch_loss)
+    return (loss_chord + loss_duration + loss_root) / 3
 
 
 def plot_loss(loss_values: list[float], val_loss_values: list[float]) -> None:
@@ -1,9 +1,10 @@
 from .melody import play_melody, play_known_melody
 from .chord import play_chord, play_known_chord
 from .bass import play_bass, play_known_bass
-from .drum import play_drum, play_known_drums
+from .drum import play_drum, play_known_drums, get_play_drum_dataset
+from .drum.utils import load_model
 from .harmony import play_harmony
-from .utils import adjust_for_key
+from .utils import adjust_for_key, load_cached, check_cancelled
 import random
 import time
 import copy
@@ -21,6 +22,11 @@ from config import (
     SEQUENCE_LENGTH_BASS,
     SEQUENCE_LENGHT_MELODY,
     SAVE_RESULT_PATH,
+    DEVICE,
+    MODEL_PATH_BASS_LSTM,
+    MODEL_PATH_CHORD_LSTM,
+    MODEL_PATH_MELODY,
+    MODEL_PATH_DRUM,
     TEST_DATASET_PATH_MELODY,
     TEST_DATASET_PATH_BASS,
     TEST_DATASET_PATH_CHORD,
@@ -33,14 +39,10 @@ from config import (
     INT_TO_NOTE,
 )
 
-NEW_BASS_PRIMER = None
-NEW_CHORD_PRIMER = None
-NEW_MELODY_PRIMER = None
-
 
 def play_agents(
-    config: dict, kept_instruments: list
-) -> tuple[pretty_midi.PrettyMIDI, list, list]:
+    config: dict, kept_instruments: list, primers: tuple = None, deadline: float = None
+) -> tuple[pretty_midi.PrettyMIDI, list, list, tuple]:
     """
     Plays the different musical instruments (drum, bass, chord, melody, harmony) based on the given configuration and
     the previously kept instruments.
@@ -49,38 +51,36 @@ def play_agents(
     ----------
         config (dict): The configuration settings for the music generation.
         kept_instruments (list): The list of previously kept instruments.
+        primers (tuple): The chord, bass and melody primers returned by the previous
+            generation, or None to start from primers of the test datasets.
+        deadline (float): The time.time() after which the instruments of the previous
+            generation are kept instead of generating new ones, None to always generate.
 
     Returns:
     ----------
         pretty_midi.PrettyMIDI: The generated MIDI file.
         list: The list of instruments used in the generated MIDI file.
         chord_progression (list): The chord progression used in the generated MIDI file.
+        tuple: The chord, bass and melody primers of the next generation.
     """
-    global NEW_BASS_PRIMER, NEW_CHORD_PRIMER, NEW_MELODY_PRIMER
     TESTING = False
 
     # When testing, we always generate new random primer sequences
-    if TESTING:
+    if TESTING or primers is None:
         chord_primer, bass_primer, melody_primer = get_primer_sequences()
         chord_primer, melody_primer = chord_primer[0], melody_primer[0]
-
     else:
-        if NEW_BASS_PRIMER is None:
-            chord_primer, bass_primer, melody_primer = get_primer_sequences()
-            chord_primer, melody_primer = chord_primer[0], melody_primer[0]
-        else:
-            chord_primer = NEW_CHORD_PRIMER
-            bass_primer = NEW_BASS_PRIMER
-            melody_primer = NEW_MELODY_PRIMER
+        chord_primer, bass_primer, melody_primer = primers
 
     mid = None
 
     # ------------------------------------------------------
     #                   playing drum
     # ------------------------------------------------------
+    check_cancelled()
     print("    ----playing drum----")
     start = time.time()
-    if config["KEEP_DRUM"]:
+    if should_keep(config, "KEEP_DRUM", kept_instruments[0], deadline):
         # If it is the first time, there are no drums to keep
         if not kept_instruments[0]:
             new_mid, drum_tokens = play_drum(config)
@@ -98,9 +98,10 @@ def play_agents(
     # ------------------------------------------------------
     #                   playing bass
     # ------------------------------------------------------
+    check_cancelled()
     print("    ----playing bass----")
     start = time.time()
-    if config["KEEP_BASS"]:
+    if should_keep(config, "KEEP_BASS", kept_instruments[1], deadline):
         # If it is the first time, there are no bass to keep
         if not kept_instruments[1]:
             new_mid, bass_instrument, predicted_bass_sequence = play_bass(
@@ -121,9 +122,10 @@ def play_agents(
     # ------------------------------------------------------
     #                   playing chord
     # ------------------------------------------------------
+    check_cancelled()
     print("    ----playing chord----")
     start = time.time()
-    if config["KEEP_CHORD"]:
+    if should_keep(config, "KEEP_CHORD", kept_instruments[2], deadline):
         if not kept_instruments[2]:
             new_mid, chord_instrument, predicted_chord_sequence = play_chord(
                 new_mid, predicted_bass_sequence, chord_primer, config
@@ -144,9 +146,10 @@ def play_agents(
     # ------------------------------------------------------
     #                   playing melody
     # ------------------------------------------------------
+    check_cancelled()
     print("    ----playing melody----")
     start = time.time()
-    if config["KEEP_MELODY"]:
+    if should_keep(config, "KEEP_MELODY", kept_instruments[3], deadline):
         if not kept_instruments[3]:
             new_mid, melody_instrument, predicted_melody_sequence = play_melody(
                 new_mid, predicted_chord_sequence, melody_primer, config
@@ -166,6 +169,7 @@ def play_agents(
     # ------------------------------------------------------
     #                   playing harmony
     # ------------------------------------------------------
+    check_cancelled()
     print("    ----playing harmony----")
     start = time.time()
     new_mid = play_harmony(new_mid, predicted_melody_sequence, config)
@@ -177,7 +181,7 @@ def play_agents(
     else:
         mid = new_mid
 
-    NEW_BASS_PRIMER, NEW_CHORD_PRIMER, NEW_MELODY_PRIMER = get_new_primer_sequences(
+    new_bass_primer, new_chord_primer, new_melody_primer = get_new_primer_sequences(
         bass_primer,
         predicted_bass_sequence,
         chord_primer,
@@ -193,6 +197,22 @@ def play_agents(
         [melody_instrument, predicted_melody_sequence],
     ]
 
+    # mid.write(SAVE_RESULT_PATH)
+    chord_progression = get_chord_progression(predicted_chord_sequence, config)
+    primers = (new_chord_primer, new_bass_primer, new_melody_primer)
+    return mid, instruments, chord_progression, primers
+
+
+def save_example(mid: pretty_midi.PrettyMIDI, config: dict) -> str:
+    """
+    Saves a generation to results/coms_study, numbered after the examples of its
+    communication and melody temperature. Not safe to call from several processes at
+    once, the generation process saves the generations of its workers.
+
+    Returns:
+    ----------
+        str: The path of the example.
+    """
     og_path = "results/coms_study/example"
     coms = "_bc_" if config["BAD_COMS"] else "_gc_"
     print("NOTE_TEMPERATURE_MELODY: ", config["NOTE_TEMPERATURE_MELODY"])
@@ -211,9 +231,21 @@ def play_agents(
         path = og_path + coms + temp + str(version) + ".mid"
 
     mid.write(path)
-    # mid.write(SAVE_RESULT_PATH)
-    chord_progression = get_chord_progression(predicted_chord_sequence, config)
-    return mid, instruments, chord_progression
+    return path
+
+
+def should_keep(config: dict, key: str, kept_instrument, deadline: float) -> bool:
+    """
+    Returns True if the instrument of the previous generation is played again, because
+    <key> of the config asks for it, or because the generation is past its deadline and
+    there is a previous instrument to keep.
+    """
+    if config[key]:
+        return True
+    if deadline is not None and kept_instrument and time.time() > deadline:
+        print(f"      ----past the deadline, {key} instead of generating")
+        return True
+    return False
 
 
 def get_chord_progression(predicted_chord_sequence: list, config: dict) -> list:
@@ -501,9 +533,9 @@ def get_primer_sequences(attempt: int = 0) -> tuple[list, list, list]:
         tuple[list, list, list]: A tuple containing the chord primer, bass primer, and melody primer sequences.
     """
 
-    chord_dataset: Chord_Dataset = torch.load(TEST_DATASET_PATH_CHORD)
-    melody_dataset: Melody_Dataset = torch.load(TEST_DATASET_PATH_MELODY)
-    bass_dataset: Bass_Dataset = torch.load(TEST_DATASET_PATH_BASS)
+    chord_dataset: Chord_Dataset = load_cached(TEST_DATASET_PATH_CHORD)
+    melody_dataset: Melody_Dataset = load_cached(TEST_DATASET_PATH_MELODY)
+    bass_dataset: Bass_Dataset = load_cached(TEST_DATASET_PATH_BASS)
 
     primer_start = random.randint(0, len(melody_dataset) - 1)
     song_name_melody = melody_dataset[primer_start][0][0][6][0]
@@ -541,3 +573,22 @@ def get_primer_sequences(attempt: int = 0) -> tuple[list, list, list]:
     bass_primer = bass_dataset[primer_end_chord - SEQUENCE_LENGTH_CHORD]
     melody_primer = melody_dataset[primer_start]
     return chord_primer, bass_primer, melody_primer
+
+
+def warm_up_agents() -> None:
+    """
+    Loads the models of all agents, the drum dataset and the primer datasets, which the
+    agents keep for the lifetime of the process, so the first generation does not wait
+    for them.
+    """
+    load_cached(MODEL_PATH_BASS_LSTM, DEVICE)
+    load_cached(MODEL_PATH_CHORD_LSTM, DEVICE)
+    load_cached(MODEL_PATH_MELODY, DEVICE)
+    load_model(MODEL_PATH_DRUM, DEVICE)
+    get_play_drum_dataset()
+    for path in [
+        TEST_DATASET_PATH_CHORD,
+        TEST_DATASET_PATH_MELODY,
+        TEST_DATASET_PATH_BASS,
+    ]:
+        load_cached(path)
@@ -23,6 +23,7 @@ from data_processing.utils import load_yaml
 from .drum import drum_network_pipeline
 
 from agents import train_bass, train_chord, train_melody
+from .distributed import launch
 
 from config import (
     NOTE_VOCAB_SIZE_BASS,
@@ -37,6 +38,7 @@ from config import (
     NUM_LAYERS_CHORD,
     HIDDEN_SIZE_CHORD,
     DEVICE,
+    NUM_TRAINING_PROCESSES,
 )
 
 
@@ -70,7 +72,7 @@ def create_agents(
         print("  ----Creating bass agent----")
         bass_agent: Bass_Network = create_bass_agent()
         bass_agent.to(DEVICE)
-        train_bass(bass_agent)
+        launch(train_bass, NUM_TRAINING_PROCESSES, bass_agent)
         bass_agent.eval()
 
     # --- Creating chord agent ---
@@ -80,7 +82,7 @@ def create_agents(
             train_chord_agent, train_chord_non_coop_agent, train_chord_bass_agent
         )
         chord_agent.to(DEVICE)
-        train_chord(chord_agent)
+        launch(train_chord, NUM_TRAINING_PROCESSES, chord_agent)
         chord_agent.eval()
 
     # --- Creating drum agent ---
@@ -97,7 +99,7 @@ def create_agents(
             train_melody_agent, train_melody_non_coop_agent
         )
         melody_agent.to(DEVICE)
-        train_melody(melody_agent)
+        launch(train_melody, NUM_TRAINING_PROCESSES, melody_agent)
         melody_agent.eval()
 
 
@@ -112,7 +114,7 @@ def create_drum_agent():
     """
     drum_dataset = get_drum_dataset()
     conf = load_yaml("config/bumblebeat/params.yaml")
-    model = drum_network_pipeline(conf, drum_dataset)
+    model = launch(drum_network_pipeline, NUM_TRAINING_PROCESSES, conf, drum_dataset)
 
     return model
 
@@ -0,0 +1,143 @@
+import os
+import copy
+import random
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+
+from config import DEVICE, SEED, DISTRIBUTED_BACKEND, DISTRIBUTED_PORT
+
+
+class Distributed_Model(DistributedDataParallel):
+    """
+    DistributedDataParallel wrapper that keeps the name of the wrapped model, since the
+    training code selects inputs and paths with str(model).
+    """
+
+    def __str__(self) -> str:
+        return str(self.module)
+
+
+def launch(fn, world_size: int, *args):
+    """
+    Runs fn(*args) data-parallel in world_size processes on this machine, joined in a
+    torch.distributed process group. This process is rank 0, so a model passed in args is
+    trained in place, the other ranks are spawned and work on copies of the arguments.
+
+    Args:
+    ----------
+        fn (callable): The training function, importable from a module so it can be spawned.
+        world_size (int): The number of processes.
+        *args: The arguments of fn.
+
+    Returns:
+    ----------
+        The return value of fn on rank 0.
+    """
+    if world_size <= 1:
+        return fn(*args)
+
+    context = mp.get_context("spawn")
+    processes = [
+        context.Process(target=_run_rank, args=(rank, world_size, fn, args))
+        for rank in range(1, world_size)
+    ]
+    for process in processes:
+        process.start()
+
+    num_threads = torch.get_num_threads()
+    try:
+        result = _run_rank(0, world_size, fn, args)
+    finally:
+        torch.set_num_threads(num_threads)
+        for process in processes:
+            process.join()
+
+    failed = [process.exitcode for process in processes if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"{len(failed)} training processes failed")
+    return result
+
+
+def _run_rank(rank: int, world_size: int, fn, args):
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", str(DISTRIBUTED_PORT))
+    dist.init_process_group(DISTRIBUTED_BACKEND, rank=rank, world_size=world_size)
+
+    # Share the GPUs and cores between the ranks, and start every rank from the same random state
+    if torch.cuda.is_available():
+        torch.cuda.set_device(rank % torch.cuda.device_count())
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    random.seed(SEED)
+    np.random.seed(SEED)
+    torch.manual_seed(SEED)
+    if rank > 0:
+        # Tensors are passed to the spawned ranks in shared memory, every rank needs its own copy
+        args = copy.deepcopy(args)
+    try:
+        return fn(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """
+    Returns:
+    ----------
+        bool: True on rank 0, or when not training distributed. Only the main process saves and logs.
+    """
+    return get_rank() == 0
+
+
+def wrap_model(model: nn.Module, find_unused_parameters: bool = False) -> nn.Module:
+    """
+    Wraps the model in DistributedDataParallel when training distributed, so the gradients
+    are all-reduced between the ranks in the backward pass.
+
+    Args:
+    ----------
+        model (nn.Module): The model, on DEVICE.
+        find_unused_parameters (bool): Whether a forward pass may leave parameters out of the graph, e.g. a head used only for some inputs.
+
+    Returns:
+    ----------
+        nn.Module: The model to run the forward pass with.
+    """
+    if not is_distributed():
+        return model
+    return Distributed_Model(model, find_unused_parameters=find_unused_parameters)
+
+
+def all_reduce_mean(values: list[float]) -> float:
+    """
+    Averages values, e.g. the losses of the batches, over all ranks.
+
+    Args:
+    ----------
+        values (list[float]): The values on this rank, may be empty.
+
+    Returns:
+    ----------
+        float: The mean of the values of all ranks, or inf if no rank has any.
+    """
+    total, count = float(sum(values)), float(len(values))
+    if is_distributed():
+        tensor = torch.tensor([total, count], dtype=torch.float64, device=DEVICE)
+        dist.all_reduce(tensor)
+        total, count = tensor.tolist()
+    return total / count if count else float("inf")
@@ -1,4 +1,4 @@
 from .train_drum import train_drum
-from .play_drum import play_drum, play_known_drums
+from .play_drum import play_drum, play_known_drums, get_play_drum_dataset
 from .drum_network_pipeline import drum_network_pipeline
 from .drum_network import Drum_Network
@@ -10,11 +10,19 @@ import torch.optim as optim
 import torch.nn as nn
 
 from .drum_network import Drum_Network
+from ..mixed_precision import autocast, create_grad_scaler, create_optimizer
+from ..distributed import (
+    is_distributed,
+    is_main_process,
+    get_rank,
+    get_world_size,
+    wrap_model,
+)
 
 from data_processing import Drum_Dataset
 
 from config import WORK_DIR, MODEL_PATH_DRUM, DEVICE, VERSION
-from .utils import create_exp_dir, create_dir_if_not_exists
+from .utils import create_exp_dir, create_dir_if_not_exists, get_logger
 
 sys.path.append("utils")
 
@@ -47,7 +55,13 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
     )
     # logging = create_exp_dir(model_conf['work_dir'],
     #   scripts_to_save=['train.py', 'mem_transformer.py'], debug=model_conf['debug'])
-    logging = create_exp_dir(WORK_DIR, scripts_to_save=None, debug=model_conf["debug"])
+    if is_main_process():
+        logging = create_exp_dir(
+            WORK_DIR, scripts_to_save=None, debug=model_conf["debug"]
+        )
+    else:
+        # Only the main process logs when training distributed
+        logging = get_logger(log_path=None, print_=False, log_=False)
     loss_list = []
     val_loss_list = []
 
@@ -63,18 +77,6 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
             pass
             # torch.cuda.manual_seed_all(model_conf['seed'])
 
-    # Validate `--fp16` option
-    if model_conf["fp16"]:
-        if not model_conf["cuda"]:
-            print("WARNING: --fp16 requires --cuda, ignoring --fp16 option")
-            model_conf["fp16"] = False
-        else:
-            try:
-                from apex.fp16_utils import FP16_Optimizer
-            except:
-                print("WARNING: apex not installed, ignoring --fp16 option")
-                model_conf["fp16"] = False
-
     ###############################################################################
     # Load data
     ###############################################################################
@@ -91,6 +93,8 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
         model_conf["tgt_len"],
         device=DEVICE,
         ext_len=model_conf["ext_len"],
+        rank=get_rank(),
+        world_size=get_world_size(),
     )
     va_iter = drum_dataset.get_iterator(
         "valid",
@@ -177,8 +181,7 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
     if model_conf["restart"]:
         with open(os.path.join(model_conf["restart_dir"], "model.pt"), "rb") as f:
             model = torch.load(f)
-        if not model_conf["fp16"]:
-            model = model.float()
+        model = model.float()
         model.apply(update_dropout)
         model.apply(update_dropatt)
     else:
@@ -214,10 +217,10 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
         [p.nelement() for p in model.layers.parameters()]
     )
 
-    if model_conf["fp16"]:
-        model = model.half()
-
-    if model_conf["multi_gpu"]:
+    if is_distributed():
+        # Each rank trains on its own streams of the data, the gradients are all-reduced
+        para_model = wrap_model(model.to(DEVICE))
+    elif model_conf["multi_gpu"]:
         model = model.to(DEVICE)
         para_model = nn.DataParallel(model, dim=1).to(DEVICE)
     else:
@@ -235,11 +238,15 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
             optimizer_sparse = optim.SGD(
                 sparse_params, lr=model_conf["learning_rate"] * 2
             )
-            optimizer = optim.SGD(
-                dense_params, lr=model_conf["learning_rate"], momentum=model_conf["mom"]
+            optimizer = create_optimizer(
+                optim.SGD,
+                dense_params,
+                lr=model_conf["learning_rate"],
+                momentum=model_conf["mom"],
             )
         else:
-            optimizer = optim.SGD(
+            optimizer = create_optimizer(
+                optim.SGD,
                 model.parameters(),
                 lr=model_conf["learning_rate"],
                 momentum=model_conf["mom"],
@@ -255,11 +262,17 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
             optimizer_sparse = optim.SparseAdam(
                 sparse_params, lr=model_conf["learning_rate"]
             )
-            optimizer = optim.Adam(dense_params, lr=model_conf["learning_rate"])
+            optimizer = create_optimizer(
+                optim.Adam, dense_params, lr=model_conf["learning_rate"]
+            )
         else:
-            optimizer = optim.Adam(model.parameters(), lr=model_conf["learning_rate"])
+            optimizer = create_optimizer(
+                optim.Adam, model.parameters(), lr=model_conf["learning_rate"]
+            )
     elif model_conf["optim"].lower() == "adagrad":
-        optimizer = optim.Adagrad(model.parameters(), lr=model_conf["learning_rate"])
+        optimizer = create_optimizer(
+            optim.Adagrad, model.parameters(), lr=model_conf["learning_rate"]
+        )
 
     #### scheduler
     if model_conf["scheduler"] == "cosine":
@@ -304,15 +317,8 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
     elif model_conf["scheduler"] == "constant":
         pass
 
-    if model_conf["cuda"] and model_conf["fp16"]:
-        # If model_conf['dynamic_loss_scale'] is False, static_loss_scale will be used.
-        # If model_conf['dynamic_loss_scale'] is True, it will take precedence over static_loss_scale.
-        optimizer = FP16_Optimizer(
-            optimizer,
-            static_loss_scale=model_conf["static_loss_scale"],
-            dynamic_loss_scale=model_conf["dynamic_loss_scale"],
-            dynamic_loss_args={"init_scale": 2**16},
-        )
+    # Mixed precision (MIXED_PRECISION), with dynamic loss scaling for fp16
+    scaler = create_grad_scaler()
 
     if model_conf["restart"]:
         if os.path.exists(os.path.join(model_conf["restart_dir"], "optimizer.pt")):
@@ -368,7 +374,8 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
                     and i >= model_conf["max_eval_steps"]
                 ):
                     break
-                ret = model(data, target, *mems)
+                with autocast():
+                    ret = model(data, target, *mems)
                 loss, mems = ret[0], ret[1:]
                 loss = loss.mean()
                 total_loss += seq_len * loss.float().item()
@@ -381,8 +388,9 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
         )
         model.train()
         
-        print("total_loss", total_loss)
-        print("total_len", total_len)
+        if is_main_process():
+            print("total_loss", total_loss)
+            print("total_len", total_len)
 
         return total_loss / total_len
 
@@ -403,32 +411,30 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
                 for i in range(model_conf["batch_chunk"]):
                     data_i = data_chunks[i].contiguous()
                     target_i = target_chunks[i].contiguous()
-                    ret = para_model(data_i, target_i, *mems[i])
+                    with autocast():
+                        ret = para_model(data_i, target_i, *mems[i])
                     loss, mems[i] = ret[0], ret[1:]
-                    loss = loss.float().mean().type_as(loss) / model_conf["batch_chunk"]
-                    if model_conf["fp16"]:
-                        optimizer.backward(loss)
-                    else:
-                        loss.backward()
-                    train_loss += loss.float().item()
+                    loss = loss.float().mean() / model_conf["batch_chunk"]
+                    scaler.scale(loss).backward()
+                    train_loss += loss.item()
             else:
-                ret = para_model(data, target, *mems)
+                with autocast():
+                    ret = para_model(data, target, *mems)
                 loss, mems = ret[0], ret[1:]
-                loss = loss.float().mean().type_as(loss)
-                if model_conf["fp16"]:
-                    optimizer.backward(loss)
-                else:
-                    loss.backward()
-                train_loss += loss.float().item()
+                loss = loss.float().mean()
+                scaler.scale(loss).backward()
+                train_loss += loss.item()
 
-            if model_conf["fp16"]:
-                optimizer.clip_master_grads(model_conf["clip"])
-            else:
-                torch.nn.utils.clip_grad_norm_(model.parameters(), model_conf["clip"])
+            # Unscale before clipping, so the clip threshold applies to the real gradients
+            scaler.unscale_(optimizer)
+            if model_conf["sample_softmax"] > 0:
+                scaler.unscale_(optimizer_sparse)
+            torch.nn.utils.clip_grad_norm_(model.parameters(), model_conf["clip"])
 
-            optimizer.step()
+            scaler.step(optimizer)
             if model_conf["sample_softmax"] > 0:
-                optimizer_sparse.step()
+                scaler.step(optimizer_sparse)
+            scaler.update()
 
             # step-wise learning rate annealing
             train_step += 1
@@ -488,7 +494,9 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
                 logging(log_str)
                 logging("-" * 100)
                 # Save the model if the validation loss is the best we've seen so far.
-                if not best_val_loss or val_loss < best_val_loss:
+                if (
+                    not best_val_loss or val_loss < best_val_loss
+                ) and is_main_process():
                     create_dir_if_not_exists(
                         os.path.join(WORK_DIR, VERSION, f"train_step_{train_step}", "")
                     )
@@ -522,7 +530,8 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
                 eval_start_time = time.time()
 
             if train_step == model_conf["max_step"]:
-                torch.save(model, MODEL_PATH_DRUM)
+                if is_main_process():
+                    torch.save(model, MODEL_PATH_DRUM)
                 break
 
     # Loop over epochs.
@@ -540,12 +549,17 @@ def drum_network_pipeline(conf: dict, drum_dataset: Drum_Dataset):
             if train_step == model_conf["max_step"]:
                 logging("-" * 100)
                 logging("End of training")
-                save_to_json(loss_list, val_loss_list)
+                if is_main_process():
+                    save_to_json(loss_list, val_loss_list)
                 break
     except KeyboardInterrupt:
         logging("-" * 100)
         logging("Exiting from training early")
 
+    # The other ranks only help training, the main process tests and returns the model
+    if not is_main_process():
+        return model
+
     create_dir_if_not_exists(WORK_DIR)
     # Load the newest model.
     model = torch.load(WORK_DIR + "/drum_model_small.pt")
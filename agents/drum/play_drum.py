@@ -11,6 +11,7 @@ from data_processing import Drum_Dataset, load_yaml, get_drum_dataset
 from config import DRUM_STYLES, MODEL_PATH_DRUM, DEVICE
 
 import random
+import functools
 import pretty_midi
 
 from .drum_network import Drum_Network
@@ -18,8 +19,16 @@ from .drum_network import Drum_Network
 import note_seq as ns
 
 
+@functools.lru_cache(maxsize=None)
+def get_play_drum_dataset() -> Drum_Dataset:
+    """
+    Returns the drum dataset, loaded once per process.
+    """
+    return get_drum_dataset()
+
+
 def play_drum(config: dict) -> pretty_midi.PrettyMIDI:
-    drum_dataset: Drum_Dataset = get_drum_dataset()
+    drum_dataset: Drum_Dataset = get_play_drum_dataset()
     if config["STYLE"]:
         mid, tokens = play_drum_from_style(
             loop_measures=config["LOOP_MEASURES"],
@@ -34,17 +43,12 @@ def play_drum(config: dict) -> pretty_midi.PrettyMIDI:
 
     conf = load_yaml("config/bumblebeat/params.yaml")
 
-    time_vocab = load_yaml("config/bumblebeat/time_steps_vocab.yaml")
-
     model_conf = conf["model"]
 
     path = MODEL_PATH_DRUM
 
     model = load_model(path, DEVICE)
 
-    pitch_vocab = drum_dataset.reverse_vocab
-    velocity_vocab = {v: k for k, v in drum_dataset.vel_vocab.items()}
-
     mem_len = model_conf["mem_len"]
     gen_len = 220
 
@@ -61,12 +65,7 @@ def play_drum(config: dict) -> pretty_midi.PrettyMIDI:
     )
     for i, s in enumerate(seqs):
         note_sequence = tokens_to_note_sequence(
-            s[1:],
-            pitch_vocab,
-            simplified_pitches,
-            velocity_vocab,
-            time_vocab,
-            120,
+            s[1:], drum_dataset.codec, simplified_pitches, 120
         )
         note_sequence = ns.quantize_note_sequence(
             note_sequence, conf["processing"]["steps_per_quarter"]
@@ -82,9 +81,7 @@ def play_known_drums(drum_tokens: list, config: dict):
     loop_measures = config["LOOP_MEASURES"]
     loops = int(config["LENGTH"] / config["LOOP_MEASURES"])
     tempo = config["TEMPO"]
-    drum_dataset: Drum_Dataset = get_drum_dataset()
-    pitch_vocab: dict[int, int] = drum_dataset.reverse_vocab
-    velocity_vocab: dict[int, int] = {v: k for k, v in drum_dataset.vel_vocab.items()}
+    drum_dataset: Drum_Dataset = get_play_drum_dataset()
     simplified_pitches: list[list[int]] = [
         [36],
         [38],
@@ -98,15 +95,9 @@ def play_known_drums(drum_tokens: list, config: dict):
     ]
 
     conf: dict = load_yaml("config/bumblebeat/params.yaml")
-    time_vocab: dict[int, int] = load_yaml("config/bumblebeat/time_steps_vocab.yaml")
 
     note_sequence = tokens_to_note_sequence(
-        drum_tokens,
-        pitch_vocab,
-        simplified_pitches,
-        velocity_vocab,
-        time_vocab,
-        tempo / 2,
+        drum_tokens, drum_dataset.codec, simplified_pitches, tempo / 2
     )
 
     note_sequence = ns.quantize_note_sequence(
@@ -124,13 +115,8 @@ def play_known_drums(drum_tokens: list, config: dict):
 def play_drum_from_style(loop_measures, loops, drum_dataset, tempo, style):
     conf: dict = load_yaml("config/bumblebeat/params.yaml")
 
-    time_vocab: dict[int, int] = load_yaml("config/bumblebeat/time_steps_vocab.yaml")
-
     model: Drum_Network = load_model(MODEL_PATH_DRUM, DEVICE)
 
-    pitch_vocab: dict[int, int] = drum_dataset.reverse_vocab
-    velocity_vocab: dict[int, int] = {v: k for k, v in drum_dataset.vel_vocab.items()}
-
     primer_length: int = 256
     gen_len: int = 128
 
@@ -146,6 +132,9 @@ def play_drum_from_style(loop_measures, loops, drum_dataset, tempo, style):
         [51],
     ]
 
+    # The training examples of the style, already tokenized
+    candidates = drum_dataset.get_example_tokens("train", DRUM_STYLES[style])
+
     attempt: int = 0
     while True:
         attempt += 1
@@ -154,20 +143,9 @@ def play_drum_from_style(loop_measures, loops, drum_dataset, tempo, style):
                 f"Could not find a sequence long enough for {style}, default to {get_key(DRUM_STYLES, 7)}"
             )
             style: str = get_key(DRUM_STYLES, 7)
-        random_sequence: dict = random.choice(
-            [
-                x
-                for x in drum_dataset.train_data
-                if x["style"]["primary"] == DRUM_STYLES[style]
-            ]
-        )
-
-        dev_sequence: ns.NoteSequence = drum_dataset._quantize(
-            ns.midi_to_note_sequence(random_sequence["midi"]), 4
-        )
+            candidates = drum_dataset.get_example_tokens("train", DRUM_STYLES[style])
 
-        quantize: bool = True
-        in_tokens: list[int] = drum_dataset._tokenize(dev_sequence, 4, quantize)
+        in_tokens: list[int] = random.choice(candidates).tolist()
 
         if len(in_tokens) >= primer_length:
             break
@@ -189,12 +167,7 @@ def play_drum_from_style(loop_measures, loops, drum_dataset, tempo, style):
     out_tokens = out_tokens[gen_len:]
 
     note_sequence = tokens_to_note_sequence(
-        out_tokens,
-        pitch_vocab,
-        simplified_pitches,
-        velocity_vocab,
-        time_vocab,
-        tempo / 2,
+        out_tokens, drum_dataset.codec, simplified_pitches, tempo / 2
     )
 
     note_sequence = ns.quantize_note_sequence(
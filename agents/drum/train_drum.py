@@ -9,6 +9,7 @@ import torch.optim as optim
 from torch.utils.data import Dataset
 
 from .utils import create_exp_dir, create_dir_if_not_exists
+from ..mixed_precision import autocast, create_grad_scaler, create_optimizer
 
 from config import (
     LEARNING_RATE_DRUM,
@@ -58,7 +59,8 @@ def train_drum(model: nn.Module, dataset: Dataset):
         ext_len=EXTENDED_CONTEXT_LENGTH_DRUM,
     )
 
-    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE_DRUM)
+    optimizer = create_optimizer(optim.Adam, model.parameters(), lr=LEARNING_RATE_DRUM)
+    scaler = create_grad_scaler()
 
     scheduler = optim.lr_scheduler.CosineAnnealingLR(
         optimizer, MAX_STEP_DRUM, eta_min=ETA_MIN_DRUM
@@ -76,15 +78,18 @@ def train_drum(model: nn.Module, dataset: Dataset):
         for batch, (data, target, seq_len) in enumerate(train_iter):
             model.zero_grad()
 
-            ret = para_model(data, target, *mems)
+            with autocast():
+                ret = para_model(data, target, *mems)
             loss, mems = ret[0], ret[1:]
-            loss = loss.float().mean().type_as(loss)
-            loss.backward()
-            train_loss += loss.float().item()
+            loss = loss.float().mean()
+            scaler.scale(loss).backward()
+            train_loss += loss.item()
 
+            scaler.unscale_(optimizer)
             torch.nn.utils.clip_grad_norm_(model.parameters(), CLIP_DRUM)
 
-            optimizer.step()
+            scaler.step(optimizer)
+            scaler.update()
 
             # step-wise learning rate annealing
             train_step += 1
@@ -197,7 +202,8 @@ def train_drum(model: nn.Module, dataset: Dataset):
             for i, (data, target, seq_len) in enumerate(eval_iter):
                 if MAX_EVAL_STEPS_DRUM > 0 and i >= MAX_EVAL_STEPS_DRUM:
                     break
-                ret = model(data, target, *mems)
+                with autocast():
+                    ret = model(data, target, *mems)
                 loss, mems = ret[0], ret[1:]
                 loss = loss.mean()
                 total_loss += seq_len * loss.float().item()
@@ -10,6 +10,10 @@ import note_seq as ns
 import numpy as np
 import note_seq.protobuf.music_pb2 as music_pb2
 
+from data_processing import Drum_Codec
+
+from ..utils import check_cancelled
+
 from config import (
     INIT_DRUM,
     INIT_STD_DRUM,
@@ -49,7 +53,7 @@ def create_exp_dir(dir_path, scripts_to_save=None, debug=False):
             shutil.copyfile(script, dst_file)
 
     log_path = "log_" + VERSION + ".txt"
-    
+
     return get_logger(log_path=os.path.join(dir_path, log_path))
 
 
@@ -341,10 +345,8 @@ def create_dir_if_not_exists(path):
 
 def tokens_to_note_sequence(
     tokens: list[int],
-    pitch_vocab: dict[int, int],
+    codec: Drum_Codec,
     pitch_classes: list[list[int]],
-    velocity_vocab: dict[int, int],
-    time_vocab: dict[int, int],
     qpm: int,
     time_sig: tuple[int, int] = (4, 4),
     ticks_per_quarter: int = 480,
@@ -356,15 +358,11 @@ def tokens_to_note_sequence(
     =====
     tokens: sequence
         Sequence of tokens to convert to note_sequence
-    pitch_vocab: dict
-        Dict of token:(pitch,velocity)
+    codec: Drum_Codec
+        Codec of the vocab of the tokens, e.g. Drum_Dataset.codec
     pitch_classes: list of lists
         list of lists indicating grouping of similar percussion instruments
         A random candidate will be taken from each group
-    velocity_vocab: int
-        mapping of velocity token: velocity bucket
-    time_vocab: dict
-        token:number of silence ticks
     qpm: int
         quarters per minute
     time_sig: tuple
@@ -376,51 +374,24 @@ def tokens_to_note_sequence(
     ======
     music_pb2.NoteSequence
     """
-    # Token to mark separation between samples
-    time_tokens = list(time_vocab.values())
-    reverse_time_vocab = {v: k for k, v in time_vocab.items()}
+    pitches, velocities, ticks = codec.decode(tokens, pitch_classes)
 
     ticks_per_second = ticks_per_quarter * qpm / 60
-
-    these_pitches = [np.random.choice(p) for p in pitch_classes]
-
-    n_vel_buckets = len(velocity_vocab)
+    start_times = ticks / ticks_per_second
+    start_times[start_times == 0] = 0.0000001
+    velocities = (velocities * 0.8).astype(np.int64)
 
     seq = music_pb2.NoteSequence()
-    silence_ticks = 0
-
-    for i, t in enumerate(tokens):
-        # Aggregate periods of silent ticks
-        if t in time_tokens:
-            silence_ticks += reverse_time_vocab[t]
-        elif t in velocity_vocab:
-            # Velocities are handled with pitches
-            continue
-        else:
-            # Token: instrument
-            p = pitch_vocab[t]
-            pitch = these_pitches[p]
-            # velocity always follows pitch
-            if i == len(tokens) - 1:
-                break
-
-            try:
-                vel_bucket = velocity_vocab[tokens[i + 1]]
-            except KeyError:
-                vel_bucket = velocity_vocab[11]
-            vel = generate_velocity_in_bucket(vel_bucket, n_vel_buckets)
-
-            start_time = silence_ticks / ticks_per_second
-            if start_time == 0:
-                start_time = 0.0000001
-            end_time = start_time + 0.1  # TODO make this relative to qpm
-            seq.notes.add(
-                pitch=pitch,
-                velocity=int(vel * 0.8),
-                start_time=start_time,
-                end_time=end_time,
-                is_drum=True,
-            )
+    for pitch, velocity, start_time in zip(
+        pitches.tolist(), velocities.tolist(), start_times.tolist()
+    ):
+        seq.notes.add(
+            pitch=pitch,
+            velocity=velocity,
+            start_time=start_time,
+            end_time=start_time + 0.1,  # TODO make this relative to qpm
+            is_drum=True,
+        )
 
     seq.ticks_per_quarter = ticks_per_quarter
     seq.tempos.add(qpm=qpm)
@@ -429,31 +400,10 @@ def tokens_to_note_sequence(
     return seq
 
 
-def generate_velocity_in_bucket(bucket, n_buckets):
-    """
-    Generate a random velocity in <bucket> for range of <n_buckets>
-        (0 -> 127 possible)
-    """
-    srange = split_range(1, 127, n_buckets)
-
-    low = srange[bucket]
-    high = srange[bucket + 1]
-
-    vel = np.random.uniform(low=low, high=high)
-    return int(vel)
-
-
-def split_range(r1, r2, n):
-    """
-    Split range <r1> - <r2> into <n> equal size buckets
-    """
-    step = (r2 - r1) / n
-    return [r1 + step * i for i in range(n + 1)]
-
-
+@functools.lru_cache(maxsize=None)
 def load_model(path, device):
     """
-    Load pretrained Transformer model for auto-regressive prediction
+    Load pretrained Transformer model for auto-regressive prediction, once per process
     """
     # Load the best saved model
     with open(path, "rb") as f:
@@ -507,6 +457,7 @@ def generate_sequences(model, num, gen_len, mem_len, device, temp, topk=32):
         sampler = TxlSimpleSampler(model, device, mem_len=mem_len)
         seq = [0]
         for _ in range(gen_len):
+            check_cancelled()
             token, _ = sampler.sample_next_token_updating_mem(
                 seq[-1], temp=temp, topk=topk
             )
@@ -651,6 +602,7 @@ def continue_sequence(model, seq, prime_len, gen_len, temp, topk, mem_len, devic
     cont = seq[:]
 
     for i in range(gen_len):
+        check_cancelled()
         gen, probs = sampler.sample_next_token_updating_mem(inp, temp=temp, topk=topk)
         p = probs[gen].cpu().item()
         nll += -np.log(p)
@@ -669,6 +621,7 @@ def prime_sampler(sampler, seq, prime_len):
     inp = 0
     nll = 0.0
     for i in range(prime_len):
+        check_cancelled()
         tar = seq[i + 1]
         _, probs = sampler.sample_next_token_updating_mem(inp, exclude_eos=False)
         p = probs[tar].cpu().item()
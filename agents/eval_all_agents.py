@@ -1,7 +1,5 @@
-import json
+import os
 import torch
-import torch.nn.functional as F
-import random
 import scipy.stats as stats
 from scipy.stats import ttest_ind
 import numpy as np
@@ -12,23 +10,19 @@ import statsmodels.api as sm
 from scipy.stats.mstats import winsorize
 from scipy.stats import shapiro
 import copy
-from torch import nn
 
 
-from .coplay import get_primer_sequences
 from .melody.melody_network import Melody_Network
-from data_processing import Melody_Dataset, Bass_Dataset, Chord_Dataset
-from .melody.eval_agent import (
-    get_chord_tensor,
-    get_time_left_on_chord_tensor,
-    get_accumulated_time_tensor,
-    get_pitch_duration_tensor,
-    update_input_tensors,
-    select_with_preference,
-    apply_temperature,
-    get_tensors,
-    generate_scale_preferences,
-    get_one_hot_index,
+from .melody.train_melody import process_data
+from .evaluation import get_eval_indices, evaluate_model, score_batches
+from .training_data import to_device
+from .result_store import load_or_evaluate
+from resampling import compare_groups
+from data_processing import (
+    Melody_Dataset,
+    Bass_Dataset,
+    Chord_Dataset,
+    MELODY_EVENT_FIELDS,
 )
 from .bass import Bass_Network, get_primer_sequence_bass
 from .chord.chord_network import Chord_Network, Chord_Network_Full
@@ -52,6 +46,10 @@ from config import (
     MODEL_PATH_CHORD_LSTM_TEST1,
     TRAIN_DATASET_PATH_CHORD,
     TRAIN_DATASET_PATH_BASS,
+    SEQUENCE_LENGTH_CHORD,
+    EVAL_BATCH_SIZE,
+    NUM_RESAMPLES,
+    SEED,
 )
 
 NUM_EVAL_SAMPLES = 1000
@@ -66,7 +64,7 @@ def eval_all_agents():
     # eval_chord_and_bass_separately()
     # eval_multi_agent_vs_monolithic()
     exp3_scrambled_vs_unscrambled()
-    # eval_coop_vs_non_coop(True)
+    # eval_coop_vs_non_coop()
     exit()
 
 
@@ -75,108 +73,45 @@ def eval_chord():
     # chord_network: Chord_Network = torch.load(MODEL_PATH_CHORD, DEVICE)
     chord_network: Chord_Network = torch.load(MODEL_PATH_CHORD_LSTM, DEVICE)
 
-    log_likelihood = 0.0
-    correct_predictions = 0
-    distribution = [0, 0, 0, 0, 0, 0, 0]
+    indices = get_eval_indices(chord_dataset, NUM_EVAL_SAMPLES)
+    scores = evaluate_model(chord_network, chord_dataset, get_chord_outputs, indices)
+    chord_scores = scores["Chord"]
 
-    for _ in range(NUM_EVAL_SAMPLES):
-        random_index = random.randint(0, len(chord_dataset) - 1)
-        chord_primer = chord_dataset[random_index]
-        input_sequence, ground_truth = chord_primer[0].unsqueeze(0), chord_primer[1]
-
-        output = chord_network(input_sequence)
-
-        # Apply softmax to get probabilities
-        chord_probabilities = F.softmax(output[0, :], dim=-1)
-
-        # For accuracy calculation, sampling from the distribution
-        next_chord_type = torch.multinomial(chord_probabilities, 1).item()
-        # for i in range(len(input_sequence[:, :, 0].tolist())):
-        #     print(
-        #         input_sequence[:, :, 0].tolist()[i], input_sequence[:, :, 1].tolist()[i]
-        #     )
-
-        # print(next_chord_type, ground_truth.item())
-        # exit()
-        # print(input_sequence[:, :, 0], input_sequence[:, :, 1], ground_truth.item())
-        if next_chord_type == ground_truth.item():
-            correct_predictions += 1
-        distribution[next_chord_type] = distribution[next_chord_type] + 1
-
-        # For log likelihood, use the probability of the true class directly
-        true_chord_probability = chord_probabilities[ground_truth.item()]
-        log_likelihood += torch.log(true_chord_probability).item()
-
-    mean_log_likelihood = log_likelihood / NUM_EVAL_SAMPLES
-    print(distribution)
+    print(torch.bincount(chord_scores["prediction"], minlength=7).tolist())
     print(
         "Chord agent predicted",
-        correct_predictions / NUM_EVAL_SAMPLES * 100,
+        chord_scores["correct"].float().mean().item() * 100,
         "% of the chords correctly.",
     )
 
-    print("Mean Log Likelihood:", mean_log_likelihood)
+    print("Mean Log Likelihood:", chord_scores["log_likelihood"].mean().item())
 
 
 def eval_bass():
     bass_dataset: Bass_Dataset = torch.load(TEST_DATASET_PATH_BASS, DEVICE)
     bass_network: Bass_Network = torch.load(MODEL_PATH_BASS_LSTM, DEVICE)
-    log_likelihood_notes = 0.0
-    log_likelihood_durations = 0.0
-    correct_predictions_note = 0
-    correct_predictions_duration = 0
-
-    for _ in range(NUM_EVAL_SAMPLES):
-        random_index = random.randint(0, len(bass_dataset) - 1)
-        bass_primer = bass_dataset[random_index]
-        input_note, input_duration, ground_truth = (
-            bass_primer[0].unsqueeze(0),
-            bass_primer[1].unsqueeze(0),
-            bass_primer[2],
-        )
-
-        with torch.no_grad():
-            note_output, duration_output = bass_network(input_note, input_duration)
-
-            note_probabilities = F.softmax(note_output[0, :], dim=-1)
-            duration_probabilities = F.softmax(
-                duration_output[0, :], dim=-1
-            )  # Ensure this is -1 for consistency
-
-            # For accuracy, sampling from the distribution
-            next_note = torch.multinomial(note_probabilities, 1).item()
-            next_duration = torch.multinomial(duration_probabilities, 1).item()
-
-            gt_note, gt_duration = ground_truth[0].item(), ground_truth[1].item()
-
-            if next_note == gt_note:
-                correct_predictions_note += 1
-            if next_duration == gt_duration:
-                correct_predictions_duration += 1
-
-            # For log likelihood
-            true_note_probability = note_probabilities[gt_note]
-            true_duration_probability = duration_probabilities[gt_duration]
 
-            log_likelihood_notes += torch.log(true_note_probability).item()
-            log_likelihood_durations += torch.log(true_duration_probability).item()
-
-    # Convert log likelihood sums to mean log likelihood
-    mean_log_likelihood_notes = log_likelihood_notes / NUM_EVAL_SAMPLES
-    mean_log_likelihood_durations = log_likelihood_durations / NUM_EVAL_SAMPLES
+    indices = get_eval_indices(bass_dataset, NUM_EVAL_SAMPLES)
+    scores = evaluate_model(bass_network, bass_dataset, get_bass_outputs, indices)
 
     print(
         "Bass agent predicted",
-        correct_predictions_note / NUM_EVAL_SAMPLES * 100,
+        scores["Note"]["correct"].float().mean().item() * 100,
         "% of the notes correctly.",
     )
     print(
         "Bass agent predicted",
-        correct_predictions_duration / NUM_EVAL_SAMPLES * 100,
+        scores["Duration"]["correct"].float().mean().item() * 100,
         "% of the durations correctly.",
     )
-    print("Mean Log Likelihood for Notes:", mean_log_likelihood_notes)
-    print("Mean Log Likelihood for Durations:", mean_log_likelihood_durations)
+    print(
+        "Mean Log Likelihood for Notes:",
+        scores["Note"]["log_likelihood"].mean().item(),
+    )
+    print(
+        "Mean Log Likelihood for Durations:",
+        scores["Duration"]["log_likelihood"].mean().item(),
+    )
 
 
 def eval_melody():
@@ -190,67 +125,13 @@ def eval_melody():
         melody_agent: Melody_Network = torch.load(MODEL_NON_COOP_PATH_MELODY, DEVICE)
 
     melody_dataset: Melody_Dataset = torch.load(TEST_DATASET_PATH_MELODY, DEVICE)
-    correct_predictions: int = 0
-
-    for _ in range(NUM_EVAL_SAMPLES):
-        random_index = random.randint(0, len(melody_dataset))
-        melody_primer = melody_dataset[random_index]
-        input_sequence = melody_primer[0]
-        ground_truth = melody_primer[1][0]
-
-        with torch.no_grad():
-            (
-                pitches,
-                durations,
-                current_chords,
-                next_chords,
-                current_chord_time_lefts,
-                accumulated_times,
-            ) = get_tensors(input_sequence)
-
-            if COOP:
-                x = torch.cat(
-                    (
-                        pitches,
-                        durations,
-                        current_chords,
-                        next_chords,
-                        current_chord_time_lefts,
-                    ),
-                    dim=1,
-                )
-            else:
-                x = torch.cat(
-                    (
-                        pitches,
-                        durations,
-                    ),
-                    dim=1,
-                )
-            # add batch dimension
-            accumulated_times = accumulated_times.unsqueeze(0)
-            current_chord_time_lefts = current_chord_time_lefts.unsqueeze(0)
-            x = x.unsqueeze(0)
-
-            pitch_logits, duration_logits = melody_agent(
-                x, accumulated_times, current_chord_time_lefts
-            )
 
-            note_probabilities = F.softmax(pitch_logits, dim=1).view(-1)
-            duration_probabilities = F.softmax(duration_logits, dim=1).view(-1)
+    indices = get_eval_indices(melody_dataset, NUM_EVAL_SAMPLES)
+    scores = evaluate_model(melody_agent, melody_dataset, get_melody_outputs, indices)
 
-            predicted_note = torch.multinomial(note_probabilities, 1).unsqueeze(1)
-            predicted_duration = torch.multinomial(duration_probabilities, 1).unsqueeze(
-                1
-            )
-
-            gt_note = get_one_hot_index(ground_truth[0])
-
-            if predicted_note == gt_note:
-                correct_predictions += 1
     print(
         "Melody agent predicted",
-        correct_predictions / NUM_EVAL_SAMPLES * 100,
+        scores["Pitch"]["correct"].float().mean().item() * 100,
         "% of the notes correctly.",
     )
 
@@ -259,111 +140,38 @@ def eval_chord_bass(verbose=True):
     chord_dataset_full: Chord_Dataset = torch.load(TEST_DATASET_PATH_CHORD_BASS, DEVICE)
     chord_network_full: Chord_Network_Full = torch.load(MODEL_CHORD_BASS_PATH, DEVICE)
 
-    correct_predictions_chord: int = 0
-    correct_predictions_duration: int = 0
-    correct_predictions_root: int = 0
-    correct_prediction_combined: int = 0
-
-    chord_log_likelihood: float = []
-    duration_log_likelihood: float = []
-    root_log_likelihood: float = []
-    total_log_likelihood: float = []
-
-    for _ in range(NUM_EVAL_SAMPLES):
-        random_index = random.randint(0, len(chord_dataset_full) - 1)
-        primer = chord_dataset_full[random_index]
-        input_sequence = primer[0].unsqueeze(0)
-        ground_truth = primer[1]
-
-        root = input_sequence[:, :, 0]
-        chord = input_sequence[:, :, 1]
-        duration = input_sequence[:, :, 2]
-
-        with torch.no_grad():
-            root_output, chord_output, duration_output = chord_network_full(
-                root, chord, duration
-            )
-
-            root_probabilities = F.softmax(root_output[0, :], dim=-1).view(-1)
-            chord_probabilities = F.softmax(chord_output[0, :], dim=-1).view(-1)
-            duration_probabilities = F.softmax(duration_output[0, :], dim=0)
+    indices = get_eval_indices(chord_dataset_full, NUM_EVAL_SAMPLES)
+    scores = evaluate_model(
+        chord_network_full,
+        chord_dataset_full,
+        get_chord_bass_outputs,
+        indices,
+        sample=False,
+    )
 
-            gt_root, gt_chord, gt_duration = (
-                ground_truth[0].item(),
-                ground_truth[1].item(),
-                ground_truth[2].item(),
-            )
+    combined = (
+        scores["Root"]["correct"]
+        & scores["Chord"]["correct"]
+        & scores["Duration"]["correct"]
+    )
+    total_log_likelihood = (
+        scores["Root"]["log_likelihood"]
+        + scores["Chord"]["log_likelihood"]
+        + scores["Duration"]["log_likelihood"]
+    ) / 3
 
-            root_log_prob = torch.log(root_probabilities[gt_root])
-            chord_log_prob = torch.log(chord_probabilities[gt_chord])
-            duration_log_prob = torch.log(duration_probabilities[gt_duration])
-
-            chord_log_likelihood.append(chord_log_prob.item())
-            duration_log_likelihood.append(duration_log_prob.item())
-            root_log_likelihood.append(root_log_prob.item())
-
-            sample_log_likelihood = root_log_prob + chord_log_prob + duration_log_prob
-            total_log_likelihood.append(sample_log_likelihood.item() / 3)
-
-            if gt_chord in chord_probabilities.argmax(dim=0, keepdim=True):
-                correct_predictions_chord += 1
-            if gt_duration in duration_probabilities.argmax(dim=0, keepdim=True):
-                correct_predictions_duration += 1
-            if gt_root in root_probabilities.argmax(dim=0, keepdim=True):
-                correct_predictions_root += 1
-            if (
-                gt_root in root_probabilities.argmax(dim=0, keepdim=True)
-                and gt_chord in chord_probabilities.argmax(dim=0, keepdim=True)
-                and gt_duration in duration_probabilities.argmax(dim=0, keepdim=True)
-            ):
-                correct_prediction_combined += 1
     if verbose:
         print("------Monolithic Evaluation------")
-        print(
-            "Chord agent predicted",
-            correct_predictions_root / NUM_EVAL_SAMPLES * 100,
-            "% of the root notes correctly.",
-        )
-        print(
-            "Chord agent predicted",
-            correct_predictions_duration / NUM_EVAL_SAMPLES * 100,
-            "% of the durations correctly.",
-        )
-        print(
-            "Chord agent predicted",
-            correct_predictions_chord / NUM_EVAL_SAMPLES * 100,
-            "% of the chords correctly.",
-        )
-        print(
-            "Chord agent predicted",
-            correct_prediction_combined / NUM_EVAL_SAMPLES * 100,
-            "% of the combined correctly.",
-        )
-
-        print("Log-likellihood of the chord", chord_log_likelihood / NUM_EVAL_SAMPLES)
-        print(
-            "Log-likellihood of the duration",
-            duration_log_likelihood / NUM_EVAL_SAMPLES,
-        )
-        print("Log-likellihood of the root", root_log_likelihood / NUM_EVAL_SAMPLES)
-        print(
-            "Total log-likelihood of the model:",
-            total_log_likelihood / NUM_EVAL_SAMPLES,
-        )
-        print(
-            "Average log-likelihood per sample:",
-            total_log_likelihood / NUM_EVAL_SAMPLES,
-        )
-        print()
+        print_chord_bass_results(scores, combined, total_log_likelihood)
     return (
-        correct_prediction_combined,
-        correct_predictions_duration,
-        correct_predictions_root,
-        correct_predictions_chord,
-        chord_log_likelihood,
-        duration_log_likelihood,
-        root_log_likelihood,
-        total_log_likelihood,
+        int(combined.sum()),
+        int(scores["Duration"]["correct"].sum()),
+        int(scores["Root"]["correct"].sum()),
+        int(scores["Chord"]["correct"].sum()),
+        scores["Chord"]["log_likelihood"].tolist(),
+        scores["Duration"]["log_likelihood"].tolist(),
+        scores["Root"]["log_likelihood"].tolist(),
+        total_log_likelihood.tolist(),
     )
 
 
@@ -378,363 +186,197 @@ def eval_chord_and_bass_separately(verbose=True, train_dataset=False):
         chord_dataset = torch.load(TRAIN_DATASET_PATH_CHORD, DEVICE)
         bass_dataset = torch.load(TRAIN_DATASET_PATH_BASS, DEVICE)
 
-    correct_combined_predictions: int = 0
-    correct_duration_predictions: int = 0
-    correct_note_predictions: int = 0
-    correct_chord_predictions: int = 0
-
-    chord_log_likelihood: list = []
-    duration_log_likelihood: list = []
-    root_log_likelihood: list = []
-    total_log_likelihood: list = []
-
-    for _ in range(NUM_EVAL_SAMPLES):
-        random_index = random.randint(0, len(chord_dataset) - 1)
-        chord_primer = chord_dataset[random_index]
-        bass_primer = bass_dataset[random_index]
-
-        input_sequence_chord = chord_primer[0].unsqueeze(0)
-        input_note = bass_primer[0].unsqueeze(0)
-        input_duration = bass_primer[1].unsqueeze(0)
-
-        ground_truth_chord = chord_primer[1]
-        ground_truth_bass_pitch, ground_truth_bass_duration = (
-            bass_primer[2][0],
-            bass_primer[2][1],
-        )
-
-        output_chord = chord_network(input_sequence_chord)
-        output_bass_pitch, output_bass_duration = bass_network(
-            input_note, input_duration
-        )
+    # The chord and bass samples at the same index belong to the same point of a song
+    indices = get_eval_indices(chord_dataset, NUM_EVAL_SAMPLES)
+    chord_scores = evaluate_model(
+        chord_network, chord_dataset, get_chord_outputs, indices
+    )
+    bass_scores = evaluate_model(bass_network, bass_dataset, get_bass_outputs, indices)
+    scores = {
+        "Root": bass_scores["Note"],
+        "Chord": chord_scores["Chord"],
+        "Duration": bass_scores["Duration"],
+    }
 
-        chord_probabilities = F.softmax(output_chord[0, :], dim=-1)
-        bass_probabilities_p = F.softmax(output_bass_pitch[0, :], dim=-1)
-        bass_probabilities_d = F.softmax(output_bass_duration[0, :], dim=-1)
-
-        next_chord = torch.multinomial(chord_probabilities, 1).item()
-        next_bass_p = torch.multinomial(bass_probabilities_p, 1).item()
-        next_bass_d = torch.multinomial(bass_probabilities_d, 1).item()
-
-        root_log_prob = torch.log(bass_probabilities_p[ground_truth_bass_pitch])
-        chord_log_prob = torch.log(chord_probabilities[ground_truth_chord])
-        duration_log_prob = torch.log(bass_probabilities_d[ground_truth_bass_duration])
-
-        chord_log_likelihood.append(chord_log_prob.item())
-        duration_log_likelihood.append(duration_log_prob.item())
-        root_log_likelihood.append(root_log_prob.item())
-
-        sample_log_likelihood = root_log_prob + chord_log_prob + duration_log_prob
-        total_log_likelihood.append(sample_log_likelihood.item() / 3)
-
-        if (
-            next_chord == ground_truth_chord.item()
-            and next_bass_p == ground_truth_bass_pitch.item()
-            and next_bass_d == ground_truth_bass_duration.item()
-        ):
-            correct_combined_predictions += 1
-        if next_chord == ground_truth_chord.item():
-            correct_chord_predictions += 1
-        if next_bass_p == ground_truth_bass_pitch.item():
-            correct_note_predictions += 1
-        if next_bass_d == ground_truth_bass_duration.item():
-            correct_duration_predictions += 1
+    combined = (
+        scores["Root"]["correct"]
+        & scores["Chord"]["correct"]
+        & scores["Duration"]["correct"]
+    )
+    total_log_likelihood = (
+        scores["Root"]["log_likelihood"]
+        + scores["Chord"]["log_likelihood"]
+        + scores["Duration"]["log_likelihood"]
+    ) / 3
 
     if verbose:
         print("------MAS Evaluation------")
-        print(
-            "Bass agent predicted",
-            correct_note_predictions / NUM_EVAL_SAMPLES * 100,
-            "% of the root notes correctly.",
-        )
-        print(
-            "Bass agent predicted",
-            correct_duration_predictions / NUM_EVAL_SAMPLES * 100,
-            "% of the durations correctly.",
-        )
-        print(
-            "Chord agent predicted",
-            correct_chord_predictions / NUM_EVAL_SAMPLES * 100,
-            "% of the chords correctly.",
-        )
+        print_chord_bass_results(scores, combined, total_log_likelihood)
 
+    return (
+        int(combined.sum()),
+        int(scores["Duration"]["correct"].sum()),
+        int(scores["Root"]["correct"].sum()),
+        int(scores["Chord"]["correct"].sum()),
+        scores["Chord"]["log_likelihood"].tolist(),
+        scores["Duration"]["log_likelihood"].tolist(),
+        scores["Root"]["log_likelihood"].tolist(),
+        total_log_likelihood.tolist(),
+    )
+
+
+def print_chord_bass_results(scores, combined, total_log_likelihood):
+    for name, description in [
+        ("Root", "root notes"),
+        ("Duration", "durations"),
+        ("Chord", "chords"),
+    ]:
         print(
-            "Chord and bass agents predicted",
-            correct_combined_predictions / NUM_EVAL_SAMPLES * 100,
-            "% of the chords and bass correctly.",
+            "Predicted",
+            scores[name]["correct"].float().mean().item() * 100,
+            f"% of the {description} correctly.",
         )
+    print(
+        "Predicted",
+        combined.float().mean().item() * 100,
+        "% of the combined correctly.",
+    )
 
-        print("Log-likellihood of the chord", chord_log_likelihood / NUM_EVAL_SAMPLES)
-        print(
-            "Log-likellihood of the duration",
-            duration_log_likelihood / NUM_EVAL_SAMPLES,
-        )
-        print("Log-likellihood of the root", root_log_likelihood / NUM_EVAL_SAMPLES)
-        print(
-            "Total log-likelihood of the model:",
-            total_log_likelihood / NUM_EVAL_SAMPLES,
-        )
+    for name in ["Chord", "Duration", "Root"]:
         print(
-            "Average log-likelihood per sample:",
-            total_log_likelihood / NUM_EVAL_SAMPLES,
+            f"Log-likellihood of the {name.lower()}",
+            scores[name]["log_likelihood"].mean().item(),
         )
-        print()
+    print("Average log-likelihood per sample:", total_log_likelihood.mean().item())
+    print()
 
-    return (
-        correct_combined_predictions,
-        correct_duration_predictions,
-        correct_note_predictions,
-        correct_chord_predictions,
-        chord_log_likelihood,
-        duration_log_likelihood,
-        root_log_likelihood,
-        total_log_likelihood,
-    )
 
+def eval_all_melody_agents(verbose=False):
+    # Both agents are evaluated on the same samples
+    coop = eval_melody_agent(MODEL_PATH_MELODY)
+    non_coop = eval_melody_agent(MODEL_NON_COOP_PATH_MELODY)
+    if verbose:
+        print(f"Evaluated {len(coop['Pitch']['correct'])} samples")
 
-def eval_all_melody_agents(verbose=False, use_cache=True):
-    melody_agent_coop: Melody_Network = torch.load(MODEL_PATH_MELODY, DEVICE)
-    melody_agent_non_coop: Melody_Network = torch.load(
-        MODEL_NON_COOP_PATH_MELODY, DEVICE
-    )
+    return (
+        int(coop["Pitch"]["correct"].sum()),
+        int(coop["Duration"]["correct"].sum()),
+        int(non_coop["Pitch"]["correct"].sum()),
+        int(non_coop["Duration"]["correct"].sum()),
+        coop["Pitch"]["log_likelihood"].tolist(),
+        coop["Duration"]["log_likelihood"].tolist(),
+        non_coop["Pitch"]["log_likelihood"].tolist(),
+        non_coop["Duration"]["log_likelihood"].tolist(),
+        coop["Pitch"]["nll"].tolist(),
+        coop["Duration"]["nll"].tolist(),
+        non_coop["Pitch"]["nll"].tolist(),
+        non_coop["Duration"]["nll"].tolist(),
+    )
+
+
+def eval_melody_agent(model_path):
+    melody_agent: Melody_Network = torch.load(model_path, DEVICE)
     melody_dataset: Melody_Dataset = torch.load(TEST_DATASET_PATH_MELODY, DEVICE)
 
-    correct_predictions_pitch_coop: int = 0
-    correct_predictions_duration_coop: int = 0
-    correct_predictions_pitch_non_coop: int = 0
-    correct_predictions_duration_non_coop: int = 0
-
-    log_likelihood_pitch_coop = []
-    log_likelihood_duration_coop = []
-    log_likelihood_pitch_non_coop = []
-    log_likelihood_duration_non_coop = []
-
-    nllLoss_pitch_coop = []
-    nllLoss_duration_coop = []
-    nllLoss_pitch_non_coop = []
-    nllLoss_duration_non_coop = []
-
-    for i, input in enumerate(melody_dataset):
-        if i % 100 == 0:
-            print(f"Evaluated {i} of {NUM_EVAL_SAMPLES} samples")
-        if i > NUM_EVAL_SAMPLES:
-            break
-        input_sequence = input[0]
-        ground_truth = input[1][0]
-
-        with torch.no_grad():
-            (
-                pitches,
-                durations,
-                current_chords,
-                next_chords,
-                current_chord_time_lefts,
-                accumulated_times,
-            ) = get_tensors(input_sequence)
-            x_coop = torch.cat(
-                (
-                    pitches,
-                    durations,
-                    current_chords,
-                    next_chords,
-                    current_chord_time_lefts,
-                ),
-                dim=1,
-            ).unsqueeze(0)
-
-            x_non_coop = torch.cat(
-                (
-                    pitches,
-                    durations,
-                ),
-                dim=1,
-            ).unsqueeze(0)
-
-            # add batch dimension
-            accumulated_times = accumulated_times.unsqueeze(0)
-            current_chord_time_lefts = current_chord_time_lefts.unsqueeze(0)
-
-            pitch_logits_coop, duration_logits_coop = melody_agent_coop(
-                x_coop, accumulated_times, current_chord_time_lefts
-            )
-            pitch_logits_non_coop, duration_logits_non_coop = melody_agent_non_coop(
-                x_non_coop, accumulated_times, current_chord_time_lefts
-            )
-
-            note_probabilities_c = F.softmax(pitch_logits_coop, dim=1).view(-1)
-            duration_probabilities_c = F.softmax(duration_logits_coop, dim=1).view(-1)
+    indices = get_eval_indices(melody_dataset, NUM_EVAL_SAMPLES)
+    return evaluate_model(melody_agent, melody_dataset, get_melody_outputs, indices)
 
-            predicted_note_c = torch.multinomial(note_probabilities_c, 1).unsqueeze(1)
-            predicted_duration_c = torch.multinomial(
-                duration_probabilities_c, 1
-            ).unsqueeze(1)
 
-            note_probabilities_nc = F.softmax(pitch_logits_non_coop, dim=1).view(-1)
-            duration_probabilities_nc = F.softmax(duration_logits_non_coop, dim=1).view(
-                -1
-            )
+def get_melody_results(model_path):
+    scores = eval_melody_agent(model_path)
+    return {
+        "accuracy": {name: int(scores[name]["correct"].sum()) for name in scores},
+        "log_likelihood": {
+            name: scores[name]["log_likelihood"].tolist() for name in scores
+        },
+        "nll": {name: scores[name]["nll"].tolist() for name in scores},
+        "correct": {name: scores[name]["correct"].tolist() for name in scores},
+    }
 
-            predicted_note_nc = torch.multinomial(note_probabilities_nc, 1).unsqueeze(1)
-            predicted_duration_nc = torch.multinomial(
-                duration_probabilities_nc, 1
-            ).unsqueeze(1)
 
-            nllLoss_pitch_coop.append(
-                get_nllLoss(logits=pitch_logits_coop, targets=ground_truth[0])
-            )
-            nllLoss_duration_coop.append(
-                get_nllLoss(logits=duration_logits_coop, targets=ground_truth[1])
-            )
-            nllLoss_pitch_non_coop.append(
-                get_nllLoss(logits=pitch_logits_non_coop, targets=ground_truth[0])
-            )
-            nllLoss_duration_non_coop.append(
-                get_nllLoss(logits=duration_logits_non_coop, targets=ground_truth[1])
-            )
+def get_chord_outputs(model, batch):
+    data, targets = batch
+    return {"Chord": (model(data), targets)}
 
-            gt_note = get_one_hot_index(ground_truth[0])
-            gt_duration = get_one_hot_index(ground_truth[1])
 
-            true_coop_pitch_probability = note_probabilities_c[gt_note]
-            true_coop_duration_probability = duration_probabilities_c[gt_duration]
+def get_bass_outputs(model, batch):
+    notes, durations, targets = batch
+    note_output, duration_output = model(notes, durations)
+    return {
+        "Note": (note_output, targets[:, 0]),
+        "Duration": (duration_output, targets[:, 1]),
+    }
 
-            true_non_coop_pitch_probability = note_probabilities_nc[gt_note]
-            true_non_coop_duration_probability = duration_probabilities_nc[gt_duration]
 
-            log_likelihood_pitch_coop.append(
-                torch.log(true_coop_pitch_probability).item()
-            )
-            log_likelihood_duration_coop.append(
-                torch.log(true_coop_duration_probability).item()
-            )
+def get_chord_bass_outputs(model, batch):
+    input_sequence, targets = batch
+    root_output, chord_output, duration_output = model(
+        input_sequence[:, :, 0], input_sequence[:, :, 1], input_sequence[:, :, 2]
+    )
+    return {
+        "Root": (root_output, targets[:, 0]),
+        "Chord": (chord_output, targets[:, 1]),
+        "Duration": (duration_output, targets[:, 2]),
+    }
 
-            log_likelihood_pitch_non_coop.append(
-                torch.log(true_non_coop_pitch_probability).item()
-            )
-            log_likelihood_duration_non_coop.append(
-                torch.log(true_non_coop_duration_probability).item()
-            )
 
-            if predicted_note_c == gt_note:
-                correct_predictions_pitch_coop += 1
-            if predicted_duration_c == gt_duration:
-                correct_predictions_duration_coop += 1
-            if predicted_note_nc == gt_note:
-                correct_predictions_pitch_non_coop += 1
-            if predicted_duration_nc == gt_duration:
-                correct_predictions_duration_non_coop += 1
-    return (
-        correct_predictions_pitch_coop,
-        correct_predictions_duration_coop,
-        correct_predictions_pitch_non_coop,
-        correct_predictions_duration_non_coop,
-        log_likelihood_pitch_coop,
-        log_likelihood_duration_coop,
-        log_likelihood_pitch_non_coop,
-        log_likelihood_duration_non_coop,
-        nllLoss_pitch_coop,
-        nllLoss_duration_coop,
-        nllLoss_pitch_non_coop,
-        nllLoss_duration_non_coop,
-    )
+def get_melody_outputs(model, batch):
+    """
+    Runs a melody agent on a batch of Melody_Dataset.__getitems__ windows, the last event
+    of each window is the target.
+    """
+    pitch_logits, duration_logits = melody_forward(model, process_data(batch))
+    return {
+        "Pitch": (pitch_logits, batch[:, -1, 0]),
+        "Duration": (duration_logits, batch[:, -1, 1]),
+    }
 
 
-def get_nllLoss(logits, targets):
-    log_probabilities = F.log_softmax(logits, dim=1).view(-1)
-
-    loss_function = nn.NLLLoss()
-    targets = torch.tensor(get_one_hot_index(targets)).to(DEVICE)
-
-    loss = loss_function(log_probabilities, targets)
-
-    return loss.item()
-
-
-def eval_coop_vs_non_coop(use_cache=True):
-    if not use_cache:
-        (
-            correct_predictions_pitch_coop,
-            correct_predictions_duration_coop,
-            correct_predictions_pitch_non_coop,
-            correct_predictions_duration_non_coop,
-            log_likelihood_pitch_coop,
-            log_likelihood_duration_coop,
-            log_likelihood_pitch_non_coop,
-            log_likelihood_duration_non_coop,
-            nllLoss_pitch_coop,
-            nllLoss_duration_coop,
-            nllLoss_pitch_non_coop,
-            nllLoss_duration_non_coop,
-        ) = eval_all_melody_agents()
-
-        accuracy_coop = {
-            "Pitch": correct_predictions_pitch_coop,
-            "Duration": correct_predictions_duration_coop,
-        }
-        accuracy_non_coop = {
-            "Pitch": correct_predictions_pitch_non_coop,
-            "Duration": correct_predictions_duration_non_coop,
-        }
-        log_likelihood_coop = {
-            "Pitch": log_likelihood_pitch_coop,
-            "Duration": log_likelihood_duration_coop,
-        }
-        log_likelihood_non_coop = {
-            "Pitch": log_likelihood_pitch_non_coop,
-            "Duration": log_likelihood_duration_non_coop,
-        }
-        nllLoss_coop = {
-            "Pitch": nllLoss_pitch_coop,
-            "Duration": nllLoss_duration_coop,
-        }
-        nllLoss_non_coop = {
-            "Pitch": nllLoss_pitch_non_coop,
-            "Duration": nllLoss_duration_non_coop,
-        }
-
-        save_to_json(
-            nllLoss_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/nllLoss_coop.json",
-        )
-        save_to_json(
-            nllLoss_non_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/nllLoss_non_coop.json",
-        )
-        save_to_json(
-            log_likelihood_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/log_likelihood_coop.json",
-        )
-        save_to_json(
-            log_likelihood_non_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/log_likelihood_non_coop.json",
-        )
-        save_to_json(
-            accuracy_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/accuracy_coop.json",
-        )
-        save_to_json(
-            accuracy_non_coop,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/accuracy_non_coop.json",
-        )
+def melody_forward(model, batch):
+    (pitches, durations, current_chord, next_chord), _, accumulated_time, time_left = (
+        batch
+    )
+    if "non_coop" in str(model):
+        x = torch.cat((pitches, durations), dim=2)
     else:
-        log_likelihood_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/log_likelihood_coop.json"
-        )
-        log_likelihood_non_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/log_likelihood_non_coop.json"
-        )
-        accuracy_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/accuracy_coop.json"
-        )
-        accuracy_non_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/accuracy_non_coop.json"
-        )
-        nllLoss_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/nllLoss_coop.json"
-        )
-        nllLoss_non_coop = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp2/nllLoss_non_coop.json"
-        )
+        x = torch.cat((pitches, durations, current_chord, next_chord, time_left), dim=2)
+    return model(x, accumulated_time, time_left)
+
+
+def eval_coop_vs_non_coop():
+    results_coop = load_or_evaluate(
+        "melody_coop",
+        lambda: get_melody_results(MODEL_PATH_MELODY),
+        [MODEL_PATH_MELODY],
+        [TEST_DATASET_PATH_MELODY],
+        params=(NUM_EVAL_SAMPLES,),
+    )
+    results_non_coop = load_or_evaluate(
+        "melody_non_coop",
+        lambda: get_melody_results(MODEL_NON_COOP_PATH_MELODY),
+        [MODEL_NON_COOP_PATH_MELODY],
+        [TEST_DATASET_PATH_MELODY],
+        params=(NUM_EVAL_SAMPLES,),
+    )
+    accuracy_coop = results_coop["accuracy"]
+    accuracy_non_coop = results_non_coop["accuracy"]
+    log_likelihood_coop = results_coop["log_likelihood"]
+    log_likelihood_non_coop = results_non_coop["log_likelihood"]
+    nllLoss_coop = results_coop["nll"]
+    nllLoss_non_coop = results_non_coop["nll"]
+
+    # Before the plots, which winsorize the log-likelihoods in place
+    print_resampling_tests(
+        {
+            **prefix_keys("Log-likelihood", log_likelihood_coop),
+            **prefix_keys("Accuracy", results_coop["correct"]),
+        },
+        {
+            **prefix_keys("Log-likelihood", log_likelihood_non_coop),
+            **prefix_keys("Accuracy", results_non_coop["correct"]),
+        },
+        "coop - non-coop",
+    )
 
     print("Coop, pitch ", sum(nllLoss_coop["Pitch"]) / len(nllLoss_coop["Pitch"]))
     print(
@@ -777,153 +419,193 @@ def eval_coop_vs_non_coop(use_cache=True):
         )
 
 
-def save_temporal_data(
-    log_likelihood_chord,
-    log_likelihood_melody_pitch,
-    log_likelihood_melody_duration,
-    accuracy_chord,
-    accuracy_melody_pitch,
-    accuracy_melody_duration,
-):
-    save_to_json(
-        log_likelihood_chord,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_chord_temp.json",
-    )
-    save_to_json(
-        log_likelihood_melody_pitch,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_pitch_temp.json",
-    )
-    save_to_json(
-        log_likelihood_melody_duration,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_duration_temp.json",
-    )
-    save_to_json(
-        accuracy_chord,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_chord_temp.json",
-    )
-    save_to_json(
-        accuracy_melody_pitch,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_pitch_temp.json",
-    )
-    save_to_json(
-        accuracy_melody_duration,
-        "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_duration_temp.json",
-    )
-
-
 def eval_scrambled_vs_unscrambled():
     chord_dataset: Chord_Dataset = torch.load(TEST_DATASET_PATH_CHORD, DEVICE)
     chord_network: Chord_Network = torch.load(MODEL_PATH_CHORD_LSTM, DEVICE)
     melody_dataset: Melody_Dataset = torch.load(TEST_DATASET_PATH_MELODY, DEVICE)
     melody_agent: Melody_Network = torch.load(MODEL_PATH_MELODY, DEVICE)
 
-    log_likelihood_chord: dict[str, float] = {}
-    log_likelihood_melody_pitch: dict[str, float] = {}
-    log_likelihood_melody_duration: dict[str, float] = {}
+    log_likelihood_chord: dict[str, list[float]] = {}
+    log_likelihood_melody_pitch: dict[str, list[float]] = {}
+    log_likelihood_melody_duration: dict[str, list[float]] = {}
 
     accuracy_chord: dict[str, int] = {}
     accuracy_melody_pitch: dict[str, int] = {}
     accuracy_melody_duration: dict[str, int] = {}
 
-    for i in range(NUM_EVAL_SAMPLES):
-        for j, gamma in enumerate([0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]):
-            if i == 0:
-                log_likelihood_chord[str(gamma)] = []
-                log_likelihood_melody_pitch[str(gamma)] = []
-                log_likelihood_melody_duration[str(gamma)] = []
-                accuracy_chord[str(gamma)] = 0
-                accuracy_melody_pitch[str(gamma)] = 0
-                accuracy_melody_duration[str(gamma)] = 0
-            if i % 20 == 0 and gamma == 0:
-                print(f"Evaluating sample {i}")
-
-            chord_primer, _, melody_primer = get_primer_sequences()
-
-            log_l, correct = play_chord(chord_network, chord_primer, gamma)
-            log_likelihood_chord[str(gamma)].append(log_l)
-            accuracy_chord[str(gamma)] += correct
-
-            log_l_p, correct_p, log_l_d, correct_d = play_melody(
-                melody_agent, melody_primer, gamma
-            )
-            log_likelihood_melody_pitch[str(gamma)].append(log_l_p)
-            log_likelihood_melody_duration[str(gamma)].append(log_l_d)
-            accuracy_melody_pitch[str(gamma)] += correct_p
-            accuracy_melody_duration[str(gamma)] += correct_d
-        save_temporal_data(
-            log_likelihood_chord,
-            log_likelihood_melody_pitch,
-            log_likelihood_melody_duration,
-            accuracy_chord,
-            accuracy_melody_pitch,
-            accuracy_melody_duration,
-        )
-
-    return (
-        log_likelihood_chord,
-        log_likelihood_melody_pitch,
-        log_likelihood_melody_duration,
-        accuracy_chord,
-        accuracy_melody_pitch,
-        accuracy_melody_duration,
+    generator = torch.Generator()
+    generator.manual_seed(SEED)
+    chord_indices, melody_indices = get_primer_indices(
+        chord_dataset, melody_dataset, NUM_EVAL_SAMPLES, generator
+    )
+    chord_primers = torch.stack(
+        [chord_dataset[idx][0] for idx in chord_indices.tolist()]
+    ).float()
+    chord_labels = torch.stack(
+        [chord_dataset[idx][1] for idx in chord_indices.tolist()]
     )
+    melody_primers = melody_dataset.__getitems__(melody_indices).cpu()
+
+    for gamma in [0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1]:
+        print(f"Evaluating gamma {gamma}")
+        chord_batches = zip(
+            get_scrambled_primers_chord(chord_primers, gamma, generator).split(
+                EVAL_BATCH_SIZE
+            ),
+            chord_labels.split(EVAL_BATCH_SIZE),
+        )
+        chord_scores = score_batches(
+            chord_network, map(to_device, chord_batches), get_chord_outputs
+        )["Chord"]
+        melody_batches = get_scrambled_primers_melody(
+            melody_primers, gamma, generator
+        ).split(EVAL_BATCH_SIZE)
+        melody_scores = score_batches(
+            melody_agent, map(to_device, melody_batches), get_melody_outputs
+        )
+
+        log_likelihood_chord[str(gamma)] = chord_scores["log_likelihood"].tolist()
+        log_likelihood_melody_pitch[str(gamma)] = melody_scores["Pitch"][
+            "log_likelihood"
+        ].tolist()
+        log_likelihood_melody_duration[str(gamma)] = melody_scores["Duration"][
+            "log_likelihood"
+        ].tolist()
+        accuracy_chord[str(gamma)] = int(chord_scores["correct"].sum())
+        accuracy_melody_pitch[str(gamma)] = int(melody_scores["Pitch"]["correct"].sum())
+        accuracy_melody_duration[str(gamma)] = int(
+            melody_scores["Duration"]["correct"].sum()
+        )
+
+    return {
+        "log_likelihood_chord": log_likelihood_chord,
+        "log_likelihood_melody_pitch": log_likelihood_melody_pitch,
+        "log_likelihood_melody_duration": log_likelihood_melody_duration,
+        "accuracy_chord": accuracy_chord,
+        "accuracy_melody_pitch": accuracy_melody_pitch,
+        "accuracy_melody_duration": accuracy_melody_duration,
+    }
+
+
+def get_primer_indices(
+    chord_dataset: Chord_Dataset,
+    melody_dataset: Melody_Dataset,
+    num_samples: int,
+    generator: torch.Generator,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Draws pairs of chord and melody samples from the same point of a song, like
+    get_primer_sequences, for num_samples primers at once.
+
+    The chord sample is the one ending at the first chord that starts after the last input
+    note of the melody window. Melody windows without such a chord are drawn again.
+
+    Returns:
+    ----------
+        tuple[torch.Tensor, torch.Tensor]: The indices into the chord and melody datasets.
+    """
+    chord_songs = torch.tensor([int(sample[0][2]) for sample in chord_dataset.data])
+    chord_timings = torch.tensor(
+        [float(sample[0][3]) for sample in chord_dataset.data], dtype=torch.float64
+    )
+    window_starts = melody_dataset.window_starts.cpu()
+    song_ids = (
+        torch.searchsorted(melody_dataset.song_offsets.cpu(), window_starts, right=True)
+        - 1
+    )
+    last_note_timings = melody_dataset.event_start_times.cpu()[
+        window_starts + melody_dataset.sequence_length - 1
+    ]
+
+    chord_indices, melody_indices = [], []
+    while len(melody_indices) < num_samples:
+        for idx in torch.randint(
+            len(melody_dataset), (num_samples,), generator=generator
+        ).tolist():
+            song_name = int(melody_dataset.song_names[song_ids[idx]])
+            passed = (chord_songs == song_name) & (
+                chord_timings > last_note_timings[idx]
+            )
+            end_chord = int(passed.nonzero()[0]) if passed.any() else 0
+            # The chord sample needs a full sequence of chords before the end chord
+            if end_chord < SEQUENCE_LENGTH_CHORD:
+                continue
+            chord_indices.append(end_chord - SEQUENCE_LENGTH_CHORD)
+            melody_indices.append(idx)
+            if len(melody_indices) == num_samples:
+                break
+    return torch.tensor(chord_indices), torch.tensor(melody_indices)
+
+
+def get_scrambled_primers_chord(
+    chord_primers: torch.Tensor, gamma: float, generator: torch.Generator
+) -> torch.Tensor:
+    """
+    Replaces each chord of the primers with probability gamma by a random root note of
+    the same chord type, without song and timing.
+
+    Args:
+    ----------
+        chord_primers (torch.Tensor): The chord samples, shape (batch, sequence length, 4).
+        gamma (float): The probability of scrambling a chord.
+        generator (torch.Generator): The random generator.
+
+    Returns:
+    ----------
+        torch.Tensor: The scrambled primers.
+    """
+    scrambled = chord_primers.clone()
+    mask = torch.rand(scrambled.shape[:2], generator=generator) < gamma
+    random_roots = torch.randint(12, scrambled.shape[:2], generator=generator)
+    scrambled[:, :, 0] = torch.where(mask, random_roots.float(), scrambled[:, :, 0])
+    scrambled[:, :, 2:] = scrambled[:, :, 2:].masked_fill(mask.unsqueeze(2), 0)
+    return scrambled
+
+
+def get_scrambled_primers_melody(
+    melody_primers: torch.Tensor, gamma: float, generator: torch.Generator
+) -> torch.Tensor:
+    """
+    Replaces the chord and timing fields of each input event of the primers with
+    probability gamma by random values, keeping the pitch and duration.
+
+    Args:
+    ----------
+        melody_primers (torch.Tensor): The field ids from Melody_Dataset.__getitems__,
+            where the last event of each window is the target and is not scrambled.
+        gamma (float): The probability of scrambling an event.
+        generator (torch.Generator): The random generator.
+
+    Returns:
+    ----------
+        torch.Tensor: The scrambled primers.
+    """
+    scrambled = melody_primers.clone()
+    inputs = scrambled[:, :-1]
+    mask = torch.rand(inputs.shape[:2], generator=generator) < gamma
+    for field, field_size in enumerate(MELODY_EVENT_FIELDS[2:], start=2):
+        random_ids = torch.randint(field_size, inputs.shape[:2], generator=generator)
+        inputs[:, :, field] = torch.where(
+            mask, random_ids.to(inputs.dtype), inputs[:, :, field]
+        )
+    return scrambled
 
 
 def exp3_scrambled_vs_unscrambled():
-    use_cache = True
-    if not use_cache:
-        (
-            log_likelihood_chord,
-            log_likelihood_melody_pitch,
-            log_likelihood_melody_duration,
-            accuracy_chord,
-            accuracy_melody_pitch,
-            accuracy_melody_duration,
-        ) = eval_scrambled_vs_unscrambled()
-
-        save_to_json(
-            log_likelihood_chord,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_chord.json",
-        )
-        save_to_json(
-            log_likelihood_melody_pitch,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_pitch.json",
-        )
-        save_to_json(
-            log_likelihood_melody_duration,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_duration.json",
-        )
-        save_to_json(
-            accuracy_chord,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_chord.json",
-        )
-        save_to_json(
-            accuracy_melody_pitch,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_pitch.json",
-        )
-        save_to_json(
-            accuracy_melody_duration,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_duration.json",
-        )
-    else:
-        log_likelihood_chord = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_chord.json"
-        )
-        log_likelihood_melody_pitch = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_pitch.json"
-        )
-        log_likelihood_melody_duration = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/log_likelihood_melody_duration.json"
-        )
-        accuracy_chord = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_chord.json"
-        )
-        accuracy_melody_pitch = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_pitch.json"
-        )
-        accuracy_melody_duration = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/exp3/accuracy_melody_duration.json"
-        )
+    results = load_or_evaluate(
+        "scrambled_vs_unscrambled",
+        eval_scrambled_vs_unscrambled,
+        [MODEL_PATH_CHORD_LSTM, MODEL_PATH_MELODY],
+        [TEST_DATASET_PATH_CHORD, TEST_DATASET_PATH_MELODY],
+        params=(NUM_EVAL_SAMPLES,),
+    )
+    log_likelihood_chord = results["log_likelihood_chord"]
+    log_likelihood_melody_pitch = results["log_likelihood_melody_pitch"]
+    log_likelihood_melody_duration = results["log_likelihood_melody_duration"]
+    accuracy_chord = results["accuracy_chord"]
+    accuracy_melody_pitch = results["accuracy_melody_pitch"]
+    accuracy_melody_duration = results["accuracy_melody_duration"]
+
     log_likelihood_system = {}
     accuracy_system = {}
 
@@ -975,207 +657,30 @@ def exp3_scrambled_vs_unscrambled():
     # )
 
 
-def play_chord(network, primer, gamma=1.0):
-    primer = get_scrambled_primer_chord(primer, gamma)
-    correct = 0
-    input_sequence, ground_truth = primer[0].unsqueeze(0), primer[1]
-
-    output = network(input_sequence)
-
-    chord_probabilities = F.softmax(output[0, :], dim=-1)
-
-    next_chord_type = torch.multinomial(chord_probabilities, 1).item()
-
-    if next_chord_type == ground_truth.item():
-        correct = 1
-
-    # For log likelihood, use the probability of the true class directly
-    true_chord_probability = chord_probabilities[ground_truth.item()]
-    log_likelihood = torch.log(true_chord_probability).item()
-    return log_likelihood, correct
-
-
-def play_melody(network, primer, gamma=1.0):
-
-    primer = get_scrambled_primer_melody(primer, gamma)
-
-    input_sequence = primer[0]
-    ground_truth = primer[1][0]
-    correct_pitch = 0
-    correct_duration = 0
-    with torch.no_grad():
-        (
-            pitches,
-            durations,
-            current_chords,
-            next_chords,
-            current_chord_time_lefts,
-            accumulated_times,
-        ) = get_tensors(input_sequence)
-        x = torch.cat(
-            (
-                pitches,
-                durations,
-                current_chords,
-                next_chords,
-                current_chord_time_lefts,
-            ),
-            dim=1,
-        ).unsqueeze(0)
-
-        # add batch dimension
-        accumulated_times = accumulated_times.unsqueeze(0)
-        current_chord_time_lefts = current_chord_time_lefts.unsqueeze(0)
-
-        pitch_logits_coop, duration_logits_coop = network(
-            x, accumulated_times, current_chord_time_lefts
-        )
-
-        pitch_probabilities = F.softmax(pitch_logits_coop, dim=1).view(-1)
-        duration_probabilities = F.softmax(duration_logits_coop, dim=1).view(-1)
-
-        predicted_pitch = torch.multinomial(pitch_probabilities, 1).unsqueeze(1)
-        predicted_duration = torch.multinomial(duration_probabilities, 1).unsqueeze(1)
-
-        gt_pitch = get_one_hot_index(ground_truth[0])
-        gt_duration = get_one_hot_index(ground_truth[1])
-
-        true_pitch_probability = pitch_probabilities[gt_pitch]
-        true_duration_probability = duration_probabilities[gt_duration]
-
-        log_likelihood_pitch = torch.log(true_pitch_probability).item()
-        log_likelihood_duration = torch.log(true_duration_probability).item()
-
-        if predicted_pitch == gt_pitch:
-            correct_pitch = 1
-        if predicted_duration == gt_duration:
-            correct_duration = 1
-
-        return (
-            log_likelihood_pitch,
-            correct_pitch,
-            log_likelihood_duration,
-            correct_duration,
-        )
-
+def eval_multi_agent_vs_monolithic():
+    results_mas = load_or_evaluate(
+        "chord_bass_mas",
+        lambda: get_chord_bass_results(eval_chord_and_bass_separately(verbose=False)),
+        [MODEL_PATH_CHORD_LSTM_TEST1, MODEL_PATH_BASS_LSTM_TEST],
+        [TEST_DATASET_PATH_CHORD, TEST_DATASET_PATH_BASS],
+        params=(NUM_EVAL_SAMPLES,),
+    )
+    results_mono = load_or_evaluate(
+        "chord_bass_mono",
+        lambda: get_chord_bass_results(eval_chord_bass(verbose=False)),
+        [MODEL_CHORD_BASS_PATH],
+        [TEST_DATASET_PATH_CHORD_BASS],
+        params=(NUM_EVAL_SAMPLES,),
+    )
+    accuracy_mas = results_mas["accuracy"]
+    accuracy_mono = results_mono["accuracy"]
+    log_likelihood_mas = results_mas["log_likelihood"]
+    log_likelihood_mono = results_mono["log_likelihood"]
 
-def get_scrambled_primer_chord(chord_primer, gamma):
-    primer = chord_primer[0].tolist()
-    new_primer = []
-    for i in range(8):
-        if random.random() < gamma:
-            root_note = random.randint(0, 11)
-            chord_type = primer[i][1]
-            note = [root_note, chord_type, 0, 0]
-            new_primer.append(note)
-        else:
-            new_primer.append(primer[i])
-    new_primer = (torch.tensor(new_primer, dtype=torch.float32), chord_primer[1])
-    return new_primer
-
-
-def get_scrambled_primer_melody(melody_primer, gamma):
-    new_primer = []
-    for event in melody_primer[0]:
-        if random.random() < gamma:
-            pitch = event[0]
-            duration = event[1]
-            current_chord = create_oh_vector(random.randint(0, 23), 24)
-            next_chord = create_oh_vector(random.randint(0, 23), 24)
-            tloc = create_oh_vector(random.randint(0, 15), 16)
-            accm_time = create_oh_vector(random.randint(0, 3), 4)
-
-            new_event = [pitch, duration, current_chord, next_chord, tloc, accm_time]
-            new_primer.append(new_event)
-        else:
-            new_primer.append(event)
-    new_primer = (new_primer, melody_primer[1])
-    return new_primer
-
-
-def create_oh_vector(index, length):
-    return [1 if i == index else 0 for i in range(length)]
-
-
-def eval_multi_agent_vs_monolithic(
-    use_cache=True,
-):
-    if not use_cache:
-        (
-            correct_combined_predictions_mas,
-            correct_duration_predictions_mas,
-            correct_note_predictions_mas,
-            correct_chord_predictions_mas,
-            chord_log_likelihood_mas,
-            duration_log_likelihood_mas,
-            root_log_likelihood_mas,
-            total_log_likelihood_mas,
-        ) = eval_chord_and_bass_separately(verbose=False)
-
-        (
-            correct_combined_predictions_mono,
-            correct_duration_predictions_mono,
-            correct_note_predictions_mono,
-            correct_chord_predictions_mono,
-            chord_log_likelihood_mono,
-            duration_log_likelihood_mono,
-            root_log_likelihood_mono,
-            total_log_likelihood_mono,
-        ) = eval_chord_bass(verbose=False)
-
-        accuracy_mono = {
-            "Chord": correct_chord_predictions_mono,
-            "Duration": correct_duration_predictions_mono,
-            "Root": correct_note_predictions_mono,
-            "Combined": correct_combined_predictions_mono,
-        }
-        accuracy_mas = {
-            "Chord": correct_chord_predictions_mas,
-            "Duration": correct_duration_predictions_mas,
-            "Root": correct_note_predictions_mas,
-            "Combined": correct_combined_predictions_mas,
-        }
-        log_likelihood_mono = {
-            "Chord": chord_log_likelihood_mono,
-            "Duration": duration_log_likelihood_mono,
-            "Root": root_log_likelihood_mono,
-            "Combined": total_log_likelihood_mono,
-        }
-        log_likelihood_mas = {
-            "Chord": chord_log_likelihood_mas,
-            "Duration": duration_log_likelihood_mas,
-            "Root": root_log_likelihood_mas,
-            "Combined": total_log_likelihood_mas,
-        }
-        save_to_json(
-            log_likelihood_mono,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/log_likelihood_mono.json",
-        )
-        save_to_json(
-            log_likelihood_mas,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/log_likelihood_mas.json",
-        )
-        save_to_json(
-            accuracy_mono,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/accuracy_mono.json",
-        )
-        save_to_json(
-            accuracy_mas,
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/accuracy_mas.json",
-        )
-    else:
-        log_likelihood_mono = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/log_likelihood_mono.json"
-        )
-        log_likelihood_mas = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/log_likelihood_mas.json"
-        )
-        accuracy_mono = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/accuracy_mono.json"
-        )
-        accuracy_mas = read_from_json(
-            "/Users/trymbo/Documents/master/mas_music_generation/data/experiments/accuracy_mas.json"
-        )
+    # Before the plots, which winsorize the log-likelihoods in place
+    print_resampling_tests(
+        log_likelihood_mono, log_likelihood_mas, "monolithic - multi-agent"
+    )
 
     box_plot(log_likelihood_mono, log_likelihood_mas, name="exp1/box_plot")
     violin_plot(log_likelihood_mono, log_likelihood_mas)
@@ -1192,6 +697,33 @@ def eval_multi_agent_vs_monolithic(
         print(z_test(accuracy_mono[key], accuracy_mas[key]))
 
 
+def get_chord_bass_results(results):
+    (
+        correct_combined_predictions,
+        correct_duration_predictions,
+        correct_note_predictions,
+        correct_chord_predictions,
+        chord_log_likelihood,
+        duration_log_likelihood,
+        root_log_likelihood,
+        total_log_likelihood,
+    ) = results
+    return {
+        "accuracy": {
+            "Chord": correct_chord_predictions,
+            "Duration": correct_duration_predictions,
+            "Root": correct_note_predictions,
+            "Combined": correct_combined_predictions,
+        },
+        "log_likelihood": {
+            "Chord": chord_log_likelihood,
+            "Duration": duration_log_likelihood,
+            "Root": root_log_likelihood,
+            "Combined": total_log_likelihood,
+        },
+    }
+
+
 def plot_mean_values(dict1, dict2, dict3, dict4, name=""):
     all_keys = (
         list(dict1.keys())
@@ -1249,9 +781,7 @@ def plot_mean_values(dict1, dict2, dict3, dict4, name=""):
     plt.legend(title="Metric", fontsize=14)
     sns.despine()
     plt.grid(True)
-    plt.savefig(
-        f"/Users/trymbo/Documents/master/mas_music_generation/figures/{name}.png"
-    )
+    plt.savefig(f"figures/{name}.png")
 
 
 def violin_plot(group1_data, group2_data, name=""):
@@ -1300,9 +830,7 @@ def violin_plot(group1_data, group2_data, name=""):
 
     plt.legend(title="Group", fontsize=14)
     sns.despine()
-    plt.savefig(
-        f"/Users/trymbo/Documents/master/mas_music_generation/figures/{name}.png"
-    )
+    plt.savefig(f"figures/{name}.png")
 
 
 def box_plot(group1_data, group2_data, name=""):
@@ -1355,20 +883,24 @@ def box_plot(group1_data, group2_data, name=""):
 
     plt.legend(title="Group", fontsize=14)
     sns.despine()
-    plt.savefig(
-        f"/Users/trymbo/Documents/master/mas_music_generation/figures/{name}.png"
-    )
+    plt.savefig(f"figures/{name}.png")
 
 
-def read_from_json(file_path):
-    with open(file_path, "r") as file:
-        data = json.load(file)
-    return data
+def print_resampling_tests(group1, group2, name=""):
+    results = compare_groups(
+        group1,
+        group2,
+        num_resamples=NUM_RESAMPLES,
+        seed=SEED,
+        workers=os.cpu_count(),
+    )
+    print(f"Bootstrap confidence intervals and permutation tests, {name}:")
+    print(results.to_string(index=False))
+    print()
 
 
-def save_to_json(data, path):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=4)
+def prefix_keys(prefix, data):
+    return {f"{prefix} {key}": values for key, values in data.items()}
 
 
 def t_test(group1, group2):
@@ -0,0 +1,138 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+from torch.utils.data._utils.collate import default_collate
+
+from .training_data import to_device
+
+from config import SEED, DEVICE, EVAL_BATCH_SIZE
+
+
+def get_eval_indices(dataset: Dataset, num_samples: int = None, seed: int = SEED):
+    """
+    Selects the samples of a test split to evaluate on.
+
+    Args:
+    ----------
+        dataset (Dataset): The test split.
+        num_samples (int): Number of samples to draw without replacement, the whole split if None.
+        seed (int): Seed of the subsample, so every model is evaluated on the same samples.
+
+    Returns:
+    ----------
+        torch.Tensor: The indices of the samples.
+    """
+    if num_samples is None or num_samples >= len(dataset):
+        return torch.arange(len(dataset))
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return torch.randperm(len(dataset), generator=generator)[:num_samples]
+
+
+def get_batches(dataset: Dataset, indices: torch.Tensor, batch_size: int):
+    """
+    Yields the samples at indices in batches on DEVICE. Datasets with __getitems__ gather a
+    batch at once, the others are stacked with the default collate function.
+    """
+    for start in range(0, len(indices), batch_size):
+        batch_indices = indices[start : start + batch_size].tolist()
+        if hasattr(dataset, "__getitems__"):
+            batch = dataset.__getitems__(batch_indices)
+        else:
+            batch = default_collate([dataset[idx] for idx in batch_indices])
+        yield to_device(batch)
+
+
+def score_predictions(
+    logits: torch.Tensor,
+    targets: torch.Tensor,
+    sample: bool = True,
+    generator: torch.Generator = None,
+) -> dict[str, torch.Tensor]:
+    """
+    Scores a batch of predictions of one output of a model.
+
+    Args:
+    ----------
+        logits (torch.Tensor): The logits, shape (batch, classes).
+        targets (torch.Tensor): The index of the true class of each sample, shape (batch,).
+        sample (bool): Whether the prediction is sampled from the distribution or its argmax.
+        generator (torch.Generator): The generator the predictions are sampled with, on the device of the logits.
+
+    Returns:
+    ----------
+        dict[str, torch.Tensor]: Per sample, the log-likelihood and negative log-likelihood
+            of the true class, the predicted class and whether it was correct.
+    """
+    log_probabilities = F.log_softmax(logits.float(), dim=-1)
+    targets = targets.long().view(-1, 1)
+    log_likelihood = log_probabilities.gather(1, targets).squeeze(1)
+    if sample:
+        predictions = torch.multinomial(log_probabilities.exp(), 1, generator=generator)
+    else:
+        predictions = log_probabilities.argmax(dim=-1, keepdim=True)
+    return {
+        "log_likelihood": log_likelihood,
+        "nll": -log_likelihood,
+        "correct": (predictions == targets).squeeze(1),
+        "prediction": predictions.squeeze(1),
+    }
+
+
+def evaluate_model(
+    model: nn.Module,
+    dataset: Dataset,
+    get_outputs,
+    indices: torch.Tensor,
+    sample: bool = True,
+    batch_size: int = EVAL_BATCH_SIZE,
+    seed: int = SEED,
+) -> dict[str, dict[str, torch.Tensor]]:
+    """
+    Runs the samples at indices through the model in batches and scores every output.
+
+    Args:
+    ----------
+        model (nn.Module): The model to evaluate.
+        dataset (Dataset): The test split.
+        get_outputs (callable): Runs the model on a batch, as get_outputs(model, batch), and
+            returns a dict of output name to (logits, targets).
+        indices (torch.Tensor): The samples to evaluate, from get_eval_indices.
+        sample (bool): Whether predictions are sampled from the distribution or its argmax.
+        batch_size (int): The number of samples per forward pass.
+        seed (int): Seed of the sampled predictions, so every run samples the same predictions.
+
+    Returns:
+    ----------
+        dict[str, dict[str, torch.Tensor]]: Per output, the per sample metrics of score_predictions, on the CPU.
+    """
+    return score_batches(
+        model, get_batches(dataset, indices, batch_size), get_outputs, sample, seed
+    )
+
+
+def score_batches(
+    model: nn.Module, batches, get_outputs, sample: bool = True, seed: int = SEED
+) -> dict[str, dict[str, torch.Tensor]]:
+    """
+    Scores every output of the model on already collated batches, e.g. batches that were
+    modified before evaluation. See evaluate_model for the arguments.
+    """
+    model.eval()
+    # A generator of its own, so the predictions do not depend on what used the global RNG before
+    generator = torch.Generator(device=DEVICE)
+    generator.manual_seed(seed)
+    scores: dict[str, dict[str, list]] = {}
+    with torch.no_grad():
+        for batch in batches:
+            for name, (logits, targets) in get_outputs(model, batch).items():
+                batch_scores = score_predictions(logits, targets, sample, generator)
+                for metric, values in batch_scores.items():
+                    scores.setdefault(name, {}).setdefault(metric, []).append(
+                        values.cpu()
+                    )
+    return {
+        name: {metric: torch.cat(values) for metric, values in metrics.items()}
+        for name, metrics in scores.items()
+    }
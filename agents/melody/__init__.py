@@ -1,4 +1,4 @@
 from .melody_network import Melody_Network, Melody_Network_Non_Coop
-from .train_melody import train_melody
+from .train_melody import train_melody, create_melody_trainer
 from .play_melody import play_melody, play_known_melody
 from .eval_agent import generate_scale_preferences, select_with_preference
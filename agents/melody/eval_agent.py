@@ -11,7 +11,7 @@ from config import (
     INT_TO_TRIAD,
     PITCH_VECTOR_SIZE,
 )
-from ..utils import select_with_preference
+from ..utils import select_with_preference, check_cancelled
 
 
 def predict_next_notes(
@@ -56,6 +56,7 @@ def predict_next_notes(
         sum_duration_in_beats: float = 0.0
         print("Generating melody uding ", str(melody_agent))
         while True:
+            check_cancelled()
             x = torch.cat(
                 (
                     pitches,
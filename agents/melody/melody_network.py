@@ -2,9 +2,6 @@ import torch
 import torch.nn as nn
 import math
 
-import tensorflow as tf
-
-
 from config import (
     PITCH_SIZE_MELODY,
     DURATION_SIZE_MELODY,
@@ -27,7 +24,7 @@ import torch.nn.functional as F
 
 
 class Melody_Network(nn.Module):
-    
+
     class Tier3LSTM(nn.Module):
         def __init__(self):
             super(Melody_Network.Tier3LSTM, self).__init__()
@@ -231,8 +228,6 @@ class Melody_Network(nn.Module):
             out_features=DURATION_SIZE_MELODY,
         )
 
-
-
     def _create_predictive_networks(self):
         self.predictive_networks = nn.ModuleList()
         for i in range(16):
@@ -4,7 +4,7 @@ import pretty_midi
 
 from .melody_network import Melody_Network
 from .eval_agent import predict_next_notes
-from ..utils import beats_to_seconds, adjust_for_key
+from ..utils import beats_to_seconds, adjust_for_key, load_cached
 
 from config import (
     MODEL_PATH_MELODY,
@@ -41,7 +41,7 @@ def play_melody(
     # else:
     #     melody_agent: Melody_Network = torch.load(MODEL_PATH_MELODY, DEVICE)
 
-    melody_agent: Melody_Network = torch.load(MODEL_PATH_MELODY, DEVICE)
+    melody_agent: Melody_Network = load_cached(MODEL_PATH_MELODY, DEVICE)
     melody_agent.eval()
 
     note_sequence = predict_next_notes(
@@ -2,14 +2,22 @@ import json
 import torch
 import numpy as np
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import Dataset, DataLoader
 import matplotlib.pyplot as plt
 
-import tensorflow as tf
-
 from .melody_network import Melody_Network
-from data_processing import Melody_Dataset
+from ..training_data import create_dataloader
+from ..trainer import Trainer
+from ..mixed_precision import create_optimizer
+from ..distributed import is_main_process
+from data_processing import (
+    Melody_Dataset,
+    MELODY_EVENT_FIELDS,
+    transpose_melody_batch,
+    read_manifest,
+)
 
 
 from config import (
@@ -36,6 +44,7 @@ from config import (
     TRAIN_DATASET_COMBINED_PATH_MELODY,
     VAL_DATASET_COMBINED_PATH_MELODY,
     CHECKPOINT_FREQUENCY_MELODY,
+    TRANSPOSE_AUGMENTATION_MELODY,
 )
 
 
@@ -51,7 +60,35 @@ def train_melody(model: Melody_Network) -> None:
     Returns:
         list: A list of average epoch losses for each epoch.
     """
+    trainer = create_melody_trainer(model)
+    loss_list, val_loss_list = trainer.fit()
+
+    # Only the main process saves the results of a distributed run
+    if not is_main_process():
+        return
 
+    # Save the model
+    plot_loss(loss_list, val_loss_list, model)
+    model_path = (
+        MODEL_NON_COOP_PATH_MELODY if "non_coop" in str(model) else MODEL_PATH_MELODY
+    )
+    torch.save(model, model_path)
+
+    save_to_json(loss_list, val_loss_list, model)
+
+    plt.show()
+
+
+def create_melody_trainer(model: Melody_Network) -> Trainer:
+    """
+    Creates the Trainer of the melody model, with its data, optimizer and loss.
+
+    Args:
+        model (Melody_Network): The neural network model to train.
+
+    Returns:
+        Trainer: The Trainer, ready to fit.
+    """
     if COMBINED:
         melody_dataset_train = torch.load(TRAIN_DATASET_COMBINED_PATH_MELODY)
         melody_dataset_val = torch.load(VAL_DATASET_COMBINED_PATH_MELODY)
@@ -63,116 +100,52 @@ def train_melody(model: Melody_Network) -> None:
 
     print(sum(p.numel() for p in model.parameters() if p.requires_grad))
 
-    # Create DataLoader
-    dataloader_train = DataLoader(
+    # Create DataLoader, the training windows are transposed at random if enabled
+    dataloader_train = create_dataloader(
         melody_dataset_train,
-        batch_size=BATCH_SIZE_MELODY,
-        shuffle=True,
-        collate_fn=process_data,
+        BATCH_SIZE_MELODY,
+        collate_fn=(
+            process_data_transposed if TRANSPOSE_AUGMENTATION_MELODY else process_data
+        ),
     )
-    dataloader_val = DataLoader(
-        melody_dataset_val,
-        batch_size=BATCH_SIZE_MELODY,
-        shuffle=True,
-        collate_fn=process_data,
+    dataloader_val = create_dataloader(
+        melody_dataset_val, BATCH_SIZE_MELODY, collate_fn=process_data
     )
 
-    # Define loss function and optimizer
-    criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(
-        model.parameters(), lr=LEARNING_RATE_MELODY, weight_decay=WEIGHT_DECAY_MELODY
+    # Define optimizer
+    optimizer = create_optimizer(
+        optim.Adam,
+        model.parameters(),
+        lr=LEARNING_RATE_MELODY,
+        weight_decay=WEIGHT_DECAY_MELODY,
     )
 
-    loss_list = []
-    val_loss_list = []
-
-    # Training loop
-    for epoch in range(NUM_EPOCHS_MELODY):
-        batch_loss = []
-        if epoch % CHECKPOINT_FREQUENCY_MELODY == 0:
-            torch.save(
-                model,
-                "models/melody/checkpoints/checkpoint_"
-                + (COMMENT_MELODY)
-                + str(epoch)
-                + ".pt",
-            )
-            # TODO: save data to json
-            print("saving checkpoint")
-        for idx, batch in enumerate(dataloader_train):
-            if idx > MAX_BATCHES_MELODY:
-                break
-            (
-                pitches,
-                durations,
-                current_chord,
-                next_chord,
-            ) = batch[0]
-            gt_pitches, gt_durations = batch[1]
-            accumulated_time = batch[2]
-            time_left_on_chord = batch[3]
-
-            gt_pitches.to(DEVICE)
-            gt_durations.to(DEVICE)
-            # Zero the parameter gradients
-            optimizer.zero_grad()
-
-            x = torch.cat(
-                (
-                    pitches,
-                    durations,
-                    current_chord,
-                    next_chord,
-                    time_left_on_chord,
-                ),
-                dim=2,
-            )
-            
-            if "non_coop" in str(model):
-                x = torch.cat(
-                    (
-                        pitches,
-                        durations,
-                    ),
-                    dim=2,
-                )
-
-            pitch_logits, duration_logits = model(
-                x, accumulated_time, time_left_on_chord
-            )
-
-            pitch_loss = criterion(
-                pitch_logits, get_gt(gt_pitches.squeeze(1)).to(DEVICE)
-            )
-            duration_loss = criterion(
-                duration_logits, get_gt(gt_durations.squeeze(1)).to(DEVICE)
-            )
-
-            loss = pitch_loss * ALPHA1_MELODY + duration_loss * ALPHA2_MELODY
-
-            batch_loss.append(loss.item())
-
-            # Backward pass and optimize
-            loss.backward()
-            optimizer.step()
-
-        val_loss = get_validation_loss(model, dataloader_val, criterion)
-
-        loss_list.append(np.mean(batch_loss))
-        val_loss_list.append(val_loss)
-
-        print(
-            f"Epoch:  {epoch + 1} Loss: {round(loss_list[-1], 2)} Validation loss: {round(val_loss_list[-1],2)}"
-        )
-
-    # Save the model
-    plot_loss(loss_list, val_loss_list, model)
-    model_path = MODEL_NON_COOP_PATH_MELODY if "non_coop" in str(model) else MODEL_PATH_MELODY
-    torch.save(model, model_path)
-
-    save_to_json(loss_list, val_loss_list, model)
-
-    plt.show()
+    return Trainer(
+        model,
+        optimizer,
+        get_loss,
+        dataloader_train,
+        dataloader_val,
+        NUM_EPOCHS_MELODY,
+        MAX_BATCHES_MELODY,
+        "melody_" + str(model) + "_" + COMMENT_MELODY,
+        snapshot_frequency=CHECKPOINT_FREQUENCY_MELODY,
+        snapshot_prefix="models/melody/checkpoints/checkpoint_" + COMMENT_MELODY,
+        signature=(
+            read_manifest().get("melody_combined" if COMBINED else "melody"),
+            SEQUENCE_LENGHT_MELODY,
+            HIDDEN_SIZE_LSTM_MELODY,
+            LEARNING_RATE_MELODY,
+            WEIGHT_DECAY_MELODY,
+            BATCH_SIZE_MELODY,
+            MAX_BATCHES_MELODY,
+            ALPHA1_MELODY,
+            ALPHA2_MELODY,
+            TRANSPOSE_AUGMENTATION_MELODY,
+        ),
+        # With CONCAT, a forward pass uses either the FC1 or the FC2 head of the pitch network
+        find_unused_parameters=True,
+    )
 
 
 def save_to_json(loss_list: list, val_loss_list: list, model: Melody_Network):
@@ -223,58 +196,49 @@ def save_to_json(loss_list: list, val_loss_list: list, model: Melody_Network):
         json.dump(data_to_save, file, indent=4)
 
 
-def get_validation_loss(model: nn.Module, dataloader: DataLoader, criterion) -> float:
+def process_data_transposed(batch):
+    """
+    Transposes every window of a batch by a random number of half steps before process_data.
     """
-    Calculate the validation loss for a given model using the provided dataloader and criterion.
+    return process_data(transpose_melody_batch(batch))
+
+
+def get_loss(model: nn.Module, batch) -> torch.Tensor:
+    """
+    Calculate the combined pitch and duration loss of the model on a batch.
 
     Args:
     ----------
-        model (nn.Module): The model to evaluate.
-        dataloader (DataLoader): The dataloader containing the validation data.
-        criterion: The loss criterion used for calculating the loss.
+        model (nn.Module): The melody model.
+        batch (tuple): A batch from process_data, on DEVICE.
 
     Returns:
     ----------
-        float: The average validation loss.
+        torch.Tensor: The combined loss.
     """
-    model.eval()
-    batch_loss = []
-    for idx, batch in enumerate(dataloader):
-        if idx > MAX_BATCHES_MELODY / 10:
-            break
-        (
-            pitches,
-            durations,
-            current_chord,
-            next_chord,
-        ) = batch[0]
-        gt_pitches, gt_durations = batch[1]
-        accumulated_time = batch[2]
-        time_left_on_chord = batch[3]
-
-        gt_pitches.to(DEVICE)
-        gt_durations.to(DEVICE)
-
-        x = torch.cat(
-            (pitches, durations, current_chord, next_chord, time_left_on_chord),
-            dim=2,
-        )
-        if "non_coop" in str(model):
-            x = torch.cat((pitches, durations), dim=2)
-
-        pitch_logits, duration_logits = model(x, accumulated_time, time_left_on_chord)
-
-        pitch_loss = criterion(pitch_logits, get_gt(gt_pitches.squeeze(1)).to(DEVICE))
-        duration_loss = criterion(
-            duration_logits, get_gt(gt_durations.squeeze(1)).to(DEVICE)
-        )
+    (
+        pitches,
+        durations,
+        current_chord,
+        next_chord,
+    ) = batch[0]
+    gt_pitches, gt_durations = batch[1]
+    accumulated_time = batch[2]
+    time_left_on_chord = batch[3]
+
+    x = torch.cat(
+        (pitches, durations, current_chord, next_chord, time_left_on_chord),
+        dim=2,
+    )
+    if "non_coop" in str(model):
+        x = torch.cat((pitches, durations), dim=2)
 
-        loss = pitch_loss * ALPHA1_MELODY + duration_loss * ALPHA2_MELODY
+    pitch_logits, duration_logits = model(x, accumulated_time, time_left_on_chord)
 
-        batch_loss.append(loss.item())
+    pitch_loss = F.cross_entropy(pitch_logits, get_gt(gt_pitches.squeeze(1)))
+    duration_loss = F.cross_entropy(duration_logits, get_gt(gt_durations.squeeze(1)))
 
-    model.train()
-    return np.mean(batch_loss)
+    return pitch_loss * ALPHA1_MELODY + duration_loss * ALPHA2_MELODY
 
 
 def get_gt(gt):
@@ -345,11 +309,12 @@ def plot_loss(
 
 def process_data(batch):
     """
-    Process the data in the batch and convert it into tensors for training.
+    Expands a batch of gathered melody windows to the one-hot tensors used for training.
 
     Args:
     ----------
-        batch (list): A list of sequences, where each sequence contains input and label data.
+        batch (torch.Tensor): The field ids returned by Melody_Dataset.__getitems__, shape (batch, sequence length + 1, number of fields).
+            The last event of each window is the target.
 
     Returns:
     ----------
@@ -359,62 +324,27 @@ def process_data(batch):
             - accumulated_time_tensor (torch.Tensor): A tensor representing the accumulated times for each sequence in the batch.
             - current_chord_time_left_tensor (torch.Tensor): A tensor representing the time left for the current chord in each sequence.
     """
-
-    # batch - input/label - Sequence - note - pitch/duration/chord
-    # Initialize lists to store sequence data
-    pitches, durations, current_chords, next_chords = [], [], [], []
-    current_chord_time_lefts, accumulated_times = [], []
-    ground_truth_pitches, ground_truth_durations = [], []
-
-    # Iterate through each sequence of inputs in the batch
-    for idx, sequence in enumerate(batch):
-        pitches.append([])
-        durations.append([])
-        current_chords.append([])
-        next_chords.append([])
-        current_chord_time_lefts.append([])
-        accumulated_times.append([])
-        for note in sequence[0]:
-            # Convert each item to a tensor before appending
-            pitches[idx].append(torch.tensor(note[0]))
-            durations[idx].append(torch.tensor(note[1]))
-            current_chords[idx].append(torch.tensor(note[2]))
-            next_chords[idx].append(torch.tensor(note[3]))
-            current_chord_time_lefts[idx].append(torch.tensor(note[4]))
-            accumulated_times[idx].append(torch.tensor(note[5]))
-        pitches[idx] = torch.stack(pitches[idx])
-        durations[idx] = torch.stack(durations[idx])
-        current_chords[idx] = torch.stack(current_chords[idx])
-        next_chords[idx] = torch.stack(next_chords[idx])
-        current_chord_time_lefts[idx] = torch.stack(current_chord_time_lefts[idx])
-        accumulated_times[idx] = torch.stack(accumulated_times[idx])
-
-    # Iterate through each sequence of labels in the batch
-    for idx, sequence in enumerate(batch):
-        ground_truth_pitches.append([])
-        ground_truth_durations.append([])
-        for note in sequence[1]:
-            # Convert each item to a tensor before appending
-            ground_truth_pitches[idx].append(torch.tensor(note[0]))
-            ground_truth_durations[idx].append(torch.tensor(note[1]))
-        ground_truth_pitches[idx] = torch.stack(ground_truth_pitches[idx])
-        ground_truth_durations[idx] = torch.stack(ground_truth_durations[idx])
-
-    # Convert lists of tensors to a single tensor for each
-    pitches_tensor = torch.stack(pitches)
-    pitches_tensor = torch.stack(pitches)
-    durations_tensor = torch.stack(durations)
-    current_chord_tensor = torch.stack(current_chords)
-    next_chord_tensor = torch.stack(next_chords)
-    current_chord_time_left_tensor = torch.stack(current_chord_time_lefts)
-    accumulated_time_tensor = torch.stack(accumulated_times)
-
-    # Stack ground truth pitches and durations
-    ground_truth_pitches_tensor = torch.stack(ground_truth_pitches)
-    ground_truth_durations_tensor = torch.stack(ground_truth_durations)
+    (
+        pitches,
+        durations,
+        current_chord,
+        next_chord,
+        current_chord_time_left,
+        accumulated_time,
+    ) = (
+        F.one_hot(field_ids, field_size).float()
+        for field_ids, field_size in zip(
+            batch.long().unbind(dim=2), MELODY_EVENT_FIELDS
+        )
+    )
 
     # Group the inputs and targets
-    inputs = (pitches_tensor, durations_tensor, current_chord_tensor, next_chord_tensor)
-    targets = (ground_truth_pitches_tensor, ground_truth_durations_tensor)
+    inputs = (
+        pitches[:, :-1],
+        durations[:, :-1],
+        current_chord[:, :-1],
+        next_chord[:, :-1],
+    )
+    targets = (pitches[:, -1:], durations[:, -1:])
 
-    return inputs, targets, accumulated_time_tensor, current_chord_time_left_tensor
+    return inputs, targets, accumulated_time[:, :-1], current_chord_time_left[:, :-1]
@@ -0,0 +1,60 @@
+import contextlib
+import torch
+
+from config import DEVICE, MIXED_PRECISION, FUSED_OPTIMIZER
+
+PRECISION_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def autocast():
+    """
+    Returns the autocast context to run the forward pass and loss in, on DEVICE and in the
+    precision set by MIXED_PRECISION. Does nothing when training in fp32.
+
+    Returns:
+    ----------
+        The autocast context manager.
+    """
+    if MIXED_PRECISION is None:
+        return contextlib.nullcontext()
+    return torch.autocast(
+        device_type=DEVICE.type, dtype=PRECISION_DTYPES[MIXED_PRECISION]
+    )
+
+
+def create_grad_scaler() -> torch.amp.GradScaler:
+    """
+    Creates the gradient scaler for the backward pass. Loss scaling is only needed for fp16,
+    bf16 has the same range as fp32, so for bf16 and fp32 the scaler is disabled and passes
+    the loss and optimizer step through unchanged.
+
+    Returns:
+    ----------
+        torch.amp.GradScaler: The gradient scaler.
+    """
+    return torch.amp.GradScaler(DEVICE.type, enabled=MIXED_PRECISION == "fp16")
+
+
+def create_optimizer(optimizer_class, params, **kwargs) -> torch.optim.Optimizer:
+    """
+    Creates an optimizer, using its fused implementation when FUSED_OPTIMIZER is set and the
+    optimizer and device support it.
+
+    Args:
+    ----------
+        optimizer_class (type): The optimizer to create, e.g. torch.optim.Adam.
+        params (iterable): The parameters to optimize.
+        **kwargs: The arguments of the optimizer, e.g. lr.
+
+    Returns:
+    ----------
+        torch.optim.Optimizer: The optimizer.
+    """
+    params = list(params)
+    if FUSED_OPTIMIZER:
+        try:
+            return optimizer_class(params, fused=True, **kwargs)
+        except (RuntimeError, TypeError):
+            # No fused implementation for this optimizer, device or dtype
+            pass
+    return optimizer_class(params, **kwargs)
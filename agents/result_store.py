@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from config import SEED, EVAL_RESULTS_DIR
+
+# Bump when the evaluation code changes the metrics it produces, to invalidate stored results
+EVALUATION_VERSION = 2
+
+# Hashes of the files hashed by this process, keyed by (path, size, modification time)
+_file_hashes: dict[tuple, str] = {}
+
+
+def load_or_evaluate(
+    experiment: str,
+    evaluate,
+    model_paths: list[str],
+    dataset_paths: list[str],
+    seed: int = SEED,
+    params: tuple = (),
+) -> dict[str, dict]:
+    """
+    Returns the stored results of an experiment, or runs it and stores them.
+
+    Results are stored in EVAL_RESULTS_DIR under a key made from the content of the
+    model and dataset files, the experiment name, the sample seed, the evaluation code
+    version and <params>. Retraining a model or rebuilding a dataset changes the key, so
+    only the experiments that depend on it are evaluated again.
+
+    Args:
+    ----------
+        experiment (str): Name of the experiment, used for the directory of its results.
+        evaluate (callable): Runs the experiment and returns its results, a dict of groups
+            (e.g. "log_likelihood") of dicts of per-sample lists or scalars.
+        model_paths (list[str]): The model files the results depend on.
+        dataset_paths (list[str]): The dataset files the results depend on.
+        seed (int): Seed of the evaluated samples.
+        params (tuple): Other values the results depend on, e.g. the number of samples.
+
+    Returns:
+    ----------
+        dict[str, dict]: The results, with the lists as numpy arrays.
+    """
+    key = get_result_key(experiment, model_paths, dataset_paths, seed, params)
+    path = os.path.join(EVAL_RESULTS_DIR, experiment, key + ".npz")
+    if os.path.isfile(path):
+        print(f"{experiment}: using stored results {path}")
+        return load_results(path)
+
+    print(f"{experiment}: no stored results for the current models, evaluating")
+    results = evaluate()
+    save_results(path, results, experiment, model_paths, dataset_paths, seed)
+    return load_results(path)
+
+
+def get_result_key(
+    experiment: str,
+    model_paths: list[str],
+    dataset_paths: list[str],
+    seed: int,
+    params: tuple,
+) -> str:
+    """
+    Hashes everything the results of an experiment depend on.
+    """
+    parts = (
+        EVALUATION_VERSION,
+        experiment,
+        seed,
+        params,
+        [get_file_hash(path) for path in model_paths],
+        [get_file_hash(path) for path in dataset_paths],
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def get_file_hash(path: str) -> str:
+    """
+    Hashes the content of a file. The hash is kept for the rest of the process until the
+    file changes, so models and datasets shared by experiments are only read once.
+    """
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if cache_key not in _file_hashes:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                hasher.update(chunk)
+        _file_hashes[cache_key] = hasher.hexdigest()
+    return _file_hashes[cache_key]
+
+
+def save_results(
+    path: str,
+    results: dict[str, dict],
+    experiment: str,
+    model_paths: list[str],
+    dataset_paths: list[str],
+    seed: int,
+) -> None:
+    """
+    Stores the results as one column per metric ("group/name") in an .npz file, written
+    through a temporary file so readers never see a partial file. What the results were
+    computed from is stored next to them in a readable "__meta__" column.
+    """
+    columns = {
+        f"{group}/{name}": np.asarray(values)
+        for group, metrics in results.items()
+        for name, values in metrics.items()
+    }
+    columns["__meta__"] = np.array(
+        json.dumps(
+            {
+                "experiment": experiment,
+                "models": model_paths,
+                "datasets": dataset_paths,
+                "seed": seed,
+                "evaluation_version": EVALUATION_VERSION,
+            }
+        )
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez_compressed(file, **columns)
+    os.replace(tmp_path, path)
+
+
+def load_results(path: str) -> dict[str, dict]:
+    """
+    Reads results stored by save_results. Scalar metrics are returned as Python numbers.
+    """
+    results: dict[str, dict] = {}
+    with np.load(path) as columns:
+        for column in columns.files:
+            if column == "__meta__":
+                continue
+            group, name = column.split("/", 1)
+            values = columns[column]
+            results.setdefault(group, {})[name] = (
+                values.item() if values.ndim == 0 else values
+            )
+    return results
@@ -0,0 +1,348 @@
+import os
+import copy
+import random
+import numpy as np
+import torch
+import torch.nn as nn
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import DataLoader
+
+from .training_data import to_device, Batch_Timer
+from .mixed_precision import autocast, create_grad_scaler
+from .distributed import wrap_model, is_main_process, all_reduce_mean
+from data_processing import get_build_key
+
+from config import (
+    DEVICE,
+    CHECKPOINT_DIR,
+    CHECKPOINT_INTERVAL_BATCHES,
+    EARLY_STOPPING_PATIENCE,
+    RESUME_TRAINING,
+)
+
+
+class Trainer:
+    """
+    The epoch loop shared by the bass, chord and melody agents.
+
+    The state of a run (model, optimizer, RNG, epoch, position in the epoch, losses and
+    early stopping) is written as a state_dict checkpoint every CHECKPOINT_INTERVAL_BATCHES
+    batches and after every epoch. The writes happen on a background thread, so training
+    continues while the checkpoint is saved. An interrupted run continues from its last
+    checkpoint, which is removed once the run completes. A checkpoint is only resumed if
+    its signature, a hash of the config values and dataset build key the run was created
+    with and the parameter shapes of the model, is the one of this run, so a stale
+    checkpoint of a run with the same name is ignored. Training stops early once the
+    validation loss has not improved for EARLY_STOPPING_PATIENCE epochs, keeping the
+    weights of the best epoch, or when the epoch_callback asks for it, which is how
+    hyperparameter sweeps prune trials. The forward pass runs in the precision set by
+    MIXED_PRECISION, with loss scaling for fp16.
+
+    When run by launch, every rank trains on its shard of the data and the gradients are
+    averaged between the ranks. The losses are averaged as well, so all ranks make the same
+    early stopping decision, and only the main process prints and writes checkpoints.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        optimizer: torch.optim.Optimizer,
+        loss_fn,
+        dataloader_train: DataLoader,
+        dataloader_val: DataLoader,
+        num_epochs: int,
+        max_batches: float,
+        name: str,
+        loss_precision: int = 2,
+        snapshot_frequency: int = None,
+        snapshot_prefix: str = None,
+        epoch_callback=None,
+        signature: tuple = (),
+        find_unused_parameters: bool = False,
+    ):
+        """
+        Args:
+        ----------
+            model (nn.Module): The model to train.
+            optimizer (torch.optim.Optimizer): The optimizer of the model.
+            loss_fn (callable): Computes the loss of a batch, as loss_fn(model, batch), with the batch on DEVICE.
+            dataloader_train (DataLoader): The training data, from create_dataloader.
+            dataloader_val (DataLoader): The validation data, from create_dataloader.
+            num_epochs (int): The number of epochs to train for.
+            max_batches (float): Max number of batches to train on per epoch.
+            name (str): Name of the run, the checkpoint is saved as CHECKPOINT_DIR/<name>.pt.
+            loss_precision (int): Number of decimals of the printed losses.
+            snapshot_frequency (int): If set, the whole model is also saved every snapshot_frequency epochs.
+            snapshot_prefix (str): Path prefix of the model snapshots, followed by the epoch.
+            epoch_callback (callable): Called with the validation losses so far after every epoch, training stops when it returns True.
+            signature (tuple): The config values and dataset build key the run depends on.
+            find_unused_parameters (bool): Whether a forward pass may leave parameters of the model unused, see wrap_model.
+        """
+        self.model = model
+        self.train_model = wrap_model(model, find_unused_parameters)
+        self.optimizer = optimizer
+        self.scaler = create_grad_scaler()
+        self.loss_fn = loss_fn
+        self.dataloader_train = dataloader_train
+        self.dataloader_val = dataloader_val
+        self.num_epochs = num_epochs
+        self.max_batches = max_batches
+        self.loss_precision = loss_precision
+        self.snapshot_frequency = snapshot_frequency
+        self.snapshot_prefix = snapshot_prefix
+        self.epoch_callback = epoch_callback
+        self.checkpoint_path = os.path.join(CHECKPOINT_DIR, name + ".pt")
+        self.signature = get_build_key(
+            signature,
+            [(key, tuple(value.shape)) for key, value in model.state_dict().items()],
+        )
+
+        self.epoch: int = 0
+        self.batch_idx: int = 0
+        self.batch_loss: list[float] = []
+        self.loss_list: list[float] = []
+        self.val_loss_list: list[float] = []
+        self.best_val_loss: float = float("inf")
+        self.best_model_state: dict = None
+        self.epochs_without_improvement: int = 0
+        self.stopped: bool = False
+
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending_write = None
+
+    def fit(self) -> tuple[list[float], list[float]]:
+        """
+        Trains the model, continuing from the checkpoint of an interrupted run if there is one.
+
+        Returns:
+        ----------
+            tuple: The average training loss and the validation loss of each epoch.
+        """
+        if RESUME_TRAINING and os.path.exists(self.checkpoint_path):
+            self.load_checkpoint()
+
+        self.model.train()
+        while self.epoch < self.num_epochs and not self._should_stop():
+            if (
+                is_main_process()
+                and self.snapshot_frequency
+                and self.epoch % self.snapshot_frequency == 0
+                and self.batch_idx == 0
+            ):
+                self._save_snapshot()
+
+            timer = Batch_Timer()
+            self._set_epoch(self.dataloader_train, self.batch_idx)
+            for batch in timer.batches(
+                self.dataloader_train, self.max_batches - self.batch_idx
+            ):
+                self.optimizer.zero_grad()
+                with autocast():
+                    loss = self.loss_fn(self.train_model, batch)
+                self.scaler.scale(loss).backward()
+                self.scaler.step(self.optimizer)
+                self.scaler.update()
+
+                self.batch_loss.append(loss.item())
+                self.batch_idx += 1
+                if self.batch_idx % CHECKPOINT_INTERVAL_BATCHES == 0:
+                    self.save_checkpoint()
+
+            val_loss = self.get_validation_loss()
+
+            self.loss_list.append(all_reduce_mean(self.batch_loss))
+            self.val_loss_list.append(val_loss)
+
+            if is_main_process():
+                print(
+                    f"Epoch:  {self.epoch + 1} Loss: {round(self.loss_list[-1], self.loss_precision)} Validation loss: {round(self.val_loss_list[-1], self.loss_precision)}"
+                )
+                print(timer.summary())
+
+            if val_loss < self.best_val_loss:
+                self.best_val_loss = val_loss
+                self.best_model_state = _copy_to_cpu(self.model.state_dict())
+                self.epochs_without_improvement = 0
+            else:
+                self.epochs_without_improvement += 1
+
+            if self.epoch_callback is not None and self.epoch_callback(
+                self.val_loss_list
+            ):
+                self.stopped = True
+
+            self.epoch += 1
+            self.batch_idx = 0
+            self.batch_loss = []
+            self.save_checkpoint()
+
+        if (
+            self.epochs_without_improvement >= EARLY_STOPPING_PATIENCE
+            and is_main_process()
+        ):
+            print(
+                f"Stopping early, no improvement in validation loss for {EARLY_STOPPING_PATIENCE} epochs"
+            )
+        self.wait_for_checkpoint()
+        # The run is complete, the next run of this name starts from scratch
+        if is_main_process() and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        # Keep the weights of the epoch with the best validation loss
+        if self.best_model_state is not None:
+            self.model.load_state_dict(self.best_model_state)
+
+        return self.loss_list, self.val_loss_list
+
+    def get_validation_loss(self) -> float:
+        """
+        Calculate the validation loss of the model on at most a tenth of max_batches batches.
+
+        Returns:
+        ----------
+            float: The average validation loss, over all ranks, or inf if there is no validation data.
+        """
+        self.model.eval()
+        self._set_epoch(self.dataloader_val, 0)
+        batch_loss = []
+        with torch.no_grad(), autocast():
+            for batch_idx, batch in enumerate(self.dataloader_val):
+                if batch_idx > self.max_batches / 10:
+                    break
+                loss = self.loss_fn(self.model, to_device(batch))
+                batch_loss.append(loss.item())
+        self.model.train()
+        return all_reduce_mean(batch_loss)
+
+    def state_dict(self) -> dict:
+        """
+        Returns:
+        ----------
+            dict: Everything needed to continue the run from the current batch.
+        """
+        return {
+            "signature": self.signature,
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "scaler": self.scaler.state_dict(),
+            "epoch": self.epoch,
+            "batch_idx": self.batch_idx,
+            "batch_loss": self.batch_loss,
+            "loss_list": self.loss_list,
+            "val_loss_list": self.val_loss_list,
+            "best_val_loss": self.best_val_loss,
+            "best_model_state": self.best_model_state,
+            "epochs_without_improvement": self.epochs_without_improvement,
+            "rng_state": {
+                "python": random.getstate(),
+                "numpy": np.random.get_state(),
+                "torch": torch.get_rng_state(),
+                "cuda": (
+                    torch.cuda.get_rng_state_all() if torch.cuda.is_available() else []
+                ),
+            },
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        """
+        Args:
+        ----------
+            state (dict): A state returned by state_dict.
+        """
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.scaler.load_state_dict(state["scaler"])
+        self.epoch = state["epoch"]
+        self.batch_idx = state["batch_idx"]
+        self.batch_loss = state["batch_loss"]
+        self.loss_list = state["loss_list"]
+        self.val_loss_list = state["val_loss_list"]
+        self.best_val_loss = state["best_val_loss"]
+        self.best_model_state = state["best_model_state"]
+        self.epochs_without_improvement = state["epochs_without_improvement"]
+
+        rng_state = state["rng_state"]
+        random.setstate(rng_state["python"])
+        np.random.set_state(rng_state["numpy"])
+        torch.set_rng_state(rng_state["torch"])
+        if rng_state["cuda"] and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng_state["cuda"])
+
+    def save_checkpoint(self) -> None:
+        """
+        Copies the state of the run to the CPU and writes it to the checkpoint on the background thread.
+        Only the main process writes, the state is the same on all ranks.
+        """
+        if not is_main_process():
+            return
+        self._write_async(_copy_to_cpu(self.state_dict()), self.checkpoint_path)
+
+    def load_checkpoint(self) -> None:
+        """
+        Restores the state of an interrupted run from the checkpoint, unless the checkpoint
+        has another signature, then the run starts from scratch and overwrites it.
+        """
+        state = torch.load(
+            self.checkpoint_path, map_location=DEVICE, weights_only=False
+        )
+        if state.get("signature") != self.signature:
+            if is_main_process():
+                print(
+                    f"Ignoring {self.checkpoint_path}, it was written with another config, dataset or model"
+                )
+            return
+        self.load_state_dict(state)
+        if is_main_process():
+            print(
+                f"Resuming from {self.checkpoint_path} at epoch {self.epoch + 1}, batch {self.batch_idx}"
+            )
+
+    def wait_for_checkpoint(self) -> None:
+        """
+        Blocks until the last checkpoint is written. Raises the error of the write if it failed.
+        """
+        if self._pending_write is not None:
+            self._pending_write.result()
+            self._pending_write = None
+
+    def _save_snapshot(self) -> None:
+        snapshot = copy.deepcopy(self.model).to("cpu")
+        self._write_async(snapshot, self.snapshot_prefix + str(self.epoch) + ".pt")
+        print("saving checkpoint")
+
+    def _write_async(self, data, path: str) -> None:
+        # Only one write in flight, so at most one extra copy of the state is kept in memory
+        self.wait_for_checkpoint()
+        self._pending_write = self._writer.submit(_save_atomic, data, path)
+
+    def _set_epoch(self, dataloader: DataLoader, batch_idx: int) -> None:
+        if hasattr(dataloader.sampler, "set_epoch"):
+            dataloader.sampler.set_epoch(self.epoch, batch_idx * dataloader.batch_size)
+
+    def _should_stop(self) -> bool:
+        return (
+            self.stopped or self.epochs_without_improvement >= EARLY_STOPPING_PATIENCE
+        )
+
+
+def _copy_to_cpu(state):
+    """
+    Returns a copy of a (nested) state with every tensor copied to the CPU, so it is not changed by further training.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {key: _copy_to_cpu(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(_copy_to_cpu(value) for value in state)
+    return state
+
+
+def _save_atomic(data, path: str) -> None:
+    """
+    Saves data with torch.save, through a temporary file, so an interrupted write never leaves a partial checkpoint.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(data, tmp_path)
+    os.replace(tmp_path, path)
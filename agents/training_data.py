@@ -0,0 +1,160 @@
+import math
+import time
+import torch
+from torch.utils.data import Dataset, DataLoader, Sampler
+
+from .distributed import get_rank, get_world_size
+
+from config import DEVICE, NUM_WORKERS_TRAINING, PREFETCH_FACTOR_TRAINING, SEED
+
+
+class Resumable_Sampler(Sampler):
+    """
+    Shuffles the dataset with a permutation that only depends on the seed and the epoch,
+    so an interrupted epoch can be continued from any position.
+
+    When training distributed, every rank draws the same permutation and takes every
+    world_size-th sample of it, so the ranks train on disjoint shards of equal length.
+    """
+
+    def __init__(self, dataset: Dataset, seed: int = SEED):
+        self.num_samples: int = len(dataset)
+        self.seed: int = seed
+        self.epoch: int = 0
+        self.start_index: int = 0
+        self.rank: int = get_rank()
+        self.world_size: int = get_world_size()
+        self.shard_size: int = math.ceil(self.num_samples / self.world_size)
+
+    def set_epoch(self, epoch: int, start_index: int = 0) -> None:
+        """
+        Args:
+        ----------
+            epoch (int): The epoch to shuffle the dataset for.
+            start_index (int): The number of samples of the epoch that this rank has already used.
+        """
+        self.epoch = epoch
+        self.start_index = start_index
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        permutation = torch.randperm(self.num_samples, generator=generator)
+
+        # Repeat the first samples so every rank gets a full shard
+        padding = self.shard_size * self.world_size - self.num_samples
+        if padding > 0:
+            permutation = torch.cat([permutation, permutation[:padding]])
+
+        shard = permutation[self.rank :: self.world_size]
+        return iter(shard[self.start_index :].tolist())
+
+    def __len__(self) -> int:
+        return max(self.shard_size - self.start_index, 0)
+
+
+def create_dataloader(
+    dataset: Dataset, batch_size: int, shuffle: bool = True, collate_fn=None
+) -> DataLoader:
+    """
+    Creates a DataLoader for training or validation, with the worker count and prefetch depth from the config.
+    Batches are put in pinned memory when training on the GPU, so they can be copied to the device without blocking.
+    Shuffling uses a Resumable_Sampler, available as dataloader.sampler.
+
+    Args:
+    ----------
+        dataset (Dataset): The dataset to load batches from.
+        batch_size (int): The number of samples per batch.
+        shuffle (bool): Whether to shuffle the dataset every epoch.
+        collate_fn (callable): Function merging a list of samples, or a batch from __getitems__, into a batch.
+
+    Returns:
+    ----------
+        DataLoader: The configured DataLoader.
+    """
+    num_workers: int = NUM_WORKERS_TRAINING
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=Resumable_Sampler(dataset) if shuffle else None,
+        collate_fn=collate_fn,
+        num_workers=num_workers,
+        pin_memory=DEVICE.type == "cuda",
+        persistent_workers=num_workers > 0,
+        prefetch_factor=PREFETCH_FACTOR_TRAINING if num_workers > 0 else None,
+    )
+
+
+def to_device(batch):
+    """
+    Moves a batch to DEVICE without blocking. Tuples and lists of tensors are moved recursively.
+
+    Args:
+    ----------
+        batch: A tensor, or a (nested) tuple or list of tensors.
+
+    Returns:
+    ----------
+        The batch, on DEVICE.
+    """
+    if isinstance(batch, torch.Tensor):
+        return batch.to(DEVICE, non_blocking=True)
+    if isinstance(batch, (tuple, list)):
+        return type(batch)(to_device(item) for item in batch)
+    return batch
+
+
+class Batch_Timer:
+    """
+    Iterates over a DataLoader while measuring how long the training loop waits for data
+    and how long it spends on the batches, so loader stalls are visible.
+    """
+
+    def __init__(self):
+        self.data_time: float = 0.0
+        self.compute_time: float = 0.0
+        self.num_batches: int = 0
+
+    def batches(self, dataloader: DataLoader, max_batches: float = float("inf")):
+        """
+        Yields the batches of the DataLoader, moved to DEVICE.
+
+        Args:
+        ----------
+            dataloader (DataLoader): The DataLoader to iterate over.
+            max_batches (float): Stop after the batch with index max_batches.
+
+        Yields:
+        ----------
+            The batches of the DataLoader, on DEVICE.
+        """
+        iterator = iter(dataloader)
+        batch_idx: int = 0
+        while batch_idx <= max_batches:
+            start = time.perf_counter()
+            try:
+                batch = to_device(next(iterator))
+            except StopIteration:
+                break
+            self.data_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            yield batch
+            self.compute_time += time.perf_counter() - start
+            self.num_batches += 1
+            batch_idx += 1
+
+    def summary(self) -> str:
+        """
+        Returns:
+        ----------
+            str: The data wait time against the compute time, and the resulting throughput.
+        """
+        total_time = self.data_time + self.compute_time
+        data_share = self.data_time / total_time * 100 if total_time > 0 else 0
+        batches_per_second = self.num_batches / total_time if total_time > 0 else 0
+        return (
+            f"Data wait: {self.data_time:.2f}s ({data_share:.0f}%) "
+            f"Compute: {self.compute_time:.2f}s "
+            f"({batches_per_second:.1f} batches/s)"
+        )
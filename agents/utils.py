@@ -1,9 +1,10 @@
+import functools
+import contextlib
+
 import numpy as np
 import torch
 import torch.nn.functional as F
 
-from note_seq.protobuf import music_pb2
-
 from config import DEVICE
 
 
@@ -140,96 +141,6 @@ def adjust_for_key(note, key):
     return note
 
 
-def tokens_to_note_sequence(
-    tokens,
-    pitch_vocab,
-    pitch_classes,
-    velocity_vocab,
-    time_vocab,
-    qpm,
-    time_sig=(4, 4),
-    ticks_per_quarter=480,
-):
-    """
-    Convert sequence of tokens to note_sequence
-
-    Param
-    =====
-    tokens: sequence
-        Sequence of tokens to convert to note_sequence
-    pitch_vocab: dict
-        Dict of token:(pitch,velocity)
-    pitch_classes: list of lists
-        list of lists indicating grouping of similar percussion instruments
-        A random candidate will be taken from each group
-    velocity_vocab: int
-        mapping of velocity token: velocity bucket
-    time_vocab: dict
-        token:number of silence ticks
-    qpm: int
-        quarters per minute
-    time_sig: tuple
-        time signature, (numerator, denominator)
-    ticks_per_quarter: int
-        Ticks per quarter
-
-    Return
-    ======
-    music_pb2.NoteSequence
-    """
-    # Token to mark separation between samples
-
-    time_tokens = list(time_vocab.values())
-    reverse_time_vocab = {v: k for k, v in time_vocab.items()}
-
-    ticks_per_second = ticks_per_quarter * qpm / 60
-
-    these_pitches = [np.random.choice(p) for p in pitch_classes]
-
-    n_vel_buckets = len(velocity_vocab)
-
-    seq = music_pb2.NoteSequence()
-    silence_ticks = 0
-    for i, t in enumerate(tokens):
-        # Aggregate periods of silent ticks
-        if t in time_tokens:
-            silence_ticks += reverse_time_vocab[t]
-        elif t in velocity_vocab:
-            # Velocities are handled with pitches
-            continue
-        else:
-            # Token: instrument
-            p = pitch_vocab[t]
-            pitch = these_pitches[p]
-            # velocity always follows pitch
-            if i == len(tokens) - 1:
-                break
-
-            try:
-                vel_bucket = velocity_vocab[tokens[i + 1]]
-            except KeyError:
-                vel_bucket = velocity_vocab[11]
-            vel = generate_velocity_in_bucket(vel_bucket, n_vel_buckets)
-
-            start_time = silence_ticks / ticks_per_second
-            if start_time == 0:
-                start_time = 0.0000001
-            end_time = start_time + 0.1  # TODO make this relative to qpm
-            seq.notes.add(
-                pitch=pitch,
-                velocity=vel,
-                start_time=start_time,
-                end_time=end_time,
-                is_drum=True,
-            )
-
-    seq.ticks_per_quarter = ticks_per_quarter
-    seq.tempos.add(qpm=qpm)
-    seq.time_signatures.add(numerator=time_sig[0], denominator=time_sig[1])
-
-    return seq
-
-
 def beats_to_seconds(beats: float, tempo: int) -> float:
     """
     Converts beats to seconds based on the given tempo.
@@ -286,23 +197,57 @@ def select_with_preference(probs, preferred_indices):
         return probs
 
 
-def generate_velocity_in_bucket(bucket, n_buckets):
+@functools.lru_cache(maxsize=None)
+def load_cached(path: str, map_location=None):
     """
-    Generate a random velocity in <bucket> for range of <n_buckets>
-        (0 -> 127 possible)
+    Loads a saved model or dataset once per process. Later calls return the same object, so
+    callers must not change it.
+
+    Args:
+    ----------
+        path (str): The path of the file saved with torch.save.
+        map_location: The device to load the tensors on, as for torch.load.
+
+    Returns:
+    ----------
+        The loaded object.
     """
-    srange = split_range(1, 127, n_buckets)
+    return torch.load(path, map_location)
+
 
-    low = srange[bucket]
-    high = srange[bucket + 1]
+class Generation_Cancelled(Exception):
+    """
+    Raised by check_cancelled when the generation running in this process is cancelled.
+    """
 
-    vel = np.random.uniform(low=low, high=high)
-    return int(vel)
+
+# Returns True once the generation running in this process is cancelled, see cancellable
+_is_cancelled = None
+
+
+@contextlib.contextmanager
+def cancellable(is_cancelled):
+    """
+    Makes check_cancelled raise Generation_Cancelled inside the with block once
+    <is_cancelled> returns True. The agents check it between decode steps, so a
+    generation stops within one step of being cancelled.
+
+    Args:
+    ----------
+        is_cancelled (callable): Returns True if the generation is no longer needed.
+    """
+    global _is_cancelled
+    previous = _is_cancelled
+    _is_cancelled = is_cancelled
+    try:
+        yield
+    finally:
+        _is_cancelled = previous
 
 
-def split_range(r1, r2, n):
+def check_cancelled() -> None:
     """
-    Split range <r1> - <r2> into <n> equal size buckets
+    Raises Generation_Cancelled if the generation running in this process is cancelled.
     """
-    step = (r2 - r1) / n
-    return [r1 + step * i for i in range(n + 1)]
+    if _is_cancelled is not None and _is_cancelled():
+        raise Generation_Cancelled()
@@ -2,10 +2,19 @@
 
 import clockblocks
 import rtmidi
+import io
+import queue
+import threading
+import time
 
-from agents import play_agents
-
-from .utils import get_kept_instruments
+from .sessions import Session_Manager, DEFAULT_SESSION
+from .generation_pool import (
+    Generation_Pool,
+    forward_configs,
+    NEW_CONFIG,
+    SHUTDOWN,
+    JOB_DONE,
+)
 
 
 from multiprocessing import Value, Process, Queue as mpQueue, Event as mpEvent
@@ -35,8 +44,6 @@ is_chord_kept = False
 is_melody_kept = False
 is_harmony_kept = False
 
-GENERATION_LOG = []
-
 # Constants
 MS_PER_SEC = 1_000_000  # microseconds per second
 BARS = 2
@@ -265,6 +272,9 @@ def broadcasting_loop(
             # First loop of the groove for the desired number of times, then switch to the new groove
             if new_groove_queued and current_loop_count >= desired_loops:
                 midi_obj = generation_queue.get_nowait()
+                # Grooves queued after it are newer, only the latest one is played
+                while not generation_queue.empty():
+                    midi_obj = generation_queue.get_nowait()
                 current_midi_events, current_tempo, ticks_per_beat = pretty_midi2events(
                     midi_obj
                 )
@@ -345,29 +355,130 @@ def music_generation_process(
     change_groove_event,
     generation_is_complete,
     chord_progression_queue,
+    models_ready,
+    session_results,
+    build_datasets=False,
 ):
     """
     Process for generating music based on the provided configuration.
     Add instruments to logs and sends signals processes.
 
+    The agents are imported and their models loaded here, after the server has started,
+    and models_ready is set once they are. Configurations received before that wait in
+    config_queue.
+
+    The generations of all sessions run in one Generation_Pool. A new configuration
+    cancels the generation in progress of its session, and only the result of the latest
+    configuration of a session is kept. The generation log and the primers of every
+    session stay in this process and are sent with every job. A generation that takes
+    longer than GENERATION_DEADLINE keeps the remaining instruments of the previous one.
+
+    The default session is broadcast to the MIDI ports. The MIDI file and chord
+    progression of other sessions are put on session_results, with the id of the request
+    they were generated for, and with None for both when the session is evicted.
+
     Args:
     ----------
-        config_queue (Queue): A queue to receive the configuration.
+        config_queue (Queue): A queue to receive the session id, request id and configuration, None to stop.
         generation_queue (Queue): A queue to send the generated music.
         change_groove_event (Event): An event to signal a change in groove.
         generation_is_complete (Event): An event to signal the completion of music generation.
+        chord_progression_queue (Queue): A queue to send the chord progression.
+        models_ready (Event): An event to signal that the models are loaded.
+        session_results (Queue): A queue to send the results of the other sessions.
+        build_datasets (bool): Whether to build the datasets before loading the models.
     """
+    if build_datasets:
+        from utils import get_datasets
+
+        get_datasets()
+
+    from agents import warm_up_agents, save_example
+    from config import (
+        DEVICE,
+        GENERATION_WORKERS,
+        GENERATION_DEADLINE,
+        SESSION_TTL,
+        MAX_SESSIONS,
+        GENERATION_LOG_LENGTH,
+    )
+
+    warm_up_agents()
+    pool = Generation_Pool(GENERATION_WORKERS, fork=DEVICE.type == "cpu")
+    # Started after the workers are forked, a forked process only has the forking thread
+    forwarding_thread = threading.Thread(
+        target=forward_configs, args=(config_queue, pool.messages)
+    )
+    forwarding_thread.daemon = True
+    forwarding_thread.start()
+    models_ready.set()
+    print("Models loaded, ready to generate")
+
+    sessions = Session_Manager(SESSION_TTL, MAX_SESSIONS, GENERATION_LOG_LENGTH)
+
+    def evict(evicted: list) -> None:
+        for session in evicted:
+            pool.cancel(session.session_id)
+            session_results.put((session.session_id, session.request_id, None, None))
+            print(f"Session {session.session_id} evicted")
 
-    # TODO, not use global config, get config from queue
-    global global_config
     while True:
-        global_config = config_queue.get()  # Blocking call
-        kept_instruments = get_kept_instruments(GENERATION_LOG)
-        pm, instruments, chord_progression = play_agents(
-            global_config, kept_instruments
-        )
+        try:
+            # Wakes up at least every TTL, to evict idle sessions
+            kind, job_id, payload = pool.messages.get(timeout=SESSION_TTL)
+        except queue.Empty:
+            evict(sessions.evict_idle())
+            continue
+        evict(sessions.evict_idle())
+
+        if kind == NEW_CONFIG:
+            session_id, request_id, config = payload
+            session, evicted = sessions.touch(session_id)
+            evict(evicted)
+            session.config = config
+            session.request_id = request_id
+            deadline = time.time() + GENERATION_DEADLINE
+            pool.submit(
+                session_id,
+                config,
+                session.get_kept_instruments(),
+                session.primers,
+                deadline,
+            )
+            continue
+        if kind == SHUTDOWN:
+            pool.shutdown()
+            return
+
+        session_id = pool.finish(job_id)
+        if kind != JOB_DONE:
+            print(f"Generation {job_id} of session {session_id} {kind}")
+            continue
+        session = sessions.get(session_id)
+        if session is None or not pool.is_latest(session_id, job_id):
+            print(f"Generation {job_id} of session {session_id} discarded")
+            continue
+
+        pm, instruments, chord_progression, session.primers = payload
+        # Saved here rather than by the workers, so the example numbers do not race
+        save_example(pm, session.config)
+        session.generation_log.append(instruments)
+        if session_id != DEFAULT_SESSION:
+            midi_file = io.BytesIO()
+            pm.write(midi_file)
+            # The job is the latest of the session, so it was generated for its latest request
+            session_results.put(
+                (
+                    session_id,
+                    session.request_id,
+                    midi_file.getvalue(),
+                    chord_progression,
+                )
+            )
+            print(f"Generation complete for session {session_id}")
+            continue
+
         chord_progression_queue.put(chord_progression)
-        GENERATION_LOG.append(instruments)
         generation_queue.put(pm)
         change_groove_event.set()
         generation_is_complete.set()
@@ -0,0 +1,214 @@
+import random
+import traceback
+import multiprocessing
+from collections import OrderedDict
+
+# Kinds of messages on Generation_Pool.messages, each a (kind, job id, payload) tuple
+NEW_CONFIG = "config"  # The payload is the session id, request id and configuration
+SHUTDOWN = "shutdown"  # The server is shutting down
+JOB_DONE = "done"  # The payload is the result of play_agents
+JOB_CANCELLED = "cancelled"  # A newer job of the session was submitted first
+JOB_FAILED = "failed"  # play_agents raised an exception
+
+
+class Generation_Pool:
+    """
+    Worker processes that play the agents, one configuration at a time each, shared by
+    all sessions.
+
+    The pool is created by a process that has already loaded the models. If fork is set,
+    the workers are forked from it, so they start with the models loaded and share their
+    weights copy-on-write. Otherwise they are spawned and load the models themselves, as
+    CUDA cannot be used in a forked process.
+
+    Jobs are numbered in the order they are submitted, and submitting a job cancels the
+    older jobs of the same session. A worker checks between decode steps whether its job
+    is cancelled, so a new configuration does not wait behind a generation that is
+    already stale.
+
+    Jobs are coalesced: a job is only handed to a worker when one is idle, until then it
+    is pending, and a newer job of the same session replaces the pending one. Sessions
+    are served in the order they started waiting, so a session that changes its
+    configuration often does not delay the others.
+    """
+
+    def __init__(self, num_workers: int, fork: bool):
+        """
+        Args:
+        ----------
+            num_workers (int): Number of worker processes.
+            fork (bool): Whether to fork the workers, else they are spawned.
+        """
+        context = multiprocessing.get_context("fork" if fork else "spawn")
+        self.messages = context.Queue()
+        # Set to 1 to cancel the job of the worker at that index
+        self.cancelled = context.Array("b", num_workers)
+        self.num_submitted = 0
+
+        self.latest_jobs: dict[str, int] = {}  # Session id -> its latest job
+        self.pending: OrderedDict[str, tuple] = OrderedDict()  # Session id -> job
+        self.running: dict[int, tuple[str, int]] = {}  # Job -> session id and worker
+        self.idle_workers = list(range(num_workers))
+
+        self.job_queues = [context.Queue() for _ in range(num_workers)]
+        self.workers = [
+            context.Process(
+                target=generation_worker,
+                args=(job_queue, self.messages, self.cancelled, idx, not fork),
+                daemon=True,
+            )
+            for idx, job_queue in enumerate(self.job_queues)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(
+        self,
+        session_id: str,
+        config: dict,
+        kept_instruments: list,
+        primers: tuple,
+        deadline: float,
+    ) -> int:
+        """
+        Submits a generation of a session with the arguments of play_agents and cancels
+        the older jobs of the session.
+
+        Returns:
+        ----------
+            int: The id of the job.
+        """
+        self.num_submitted += 1
+        self.cancel_running(session_id)
+        self.latest_jobs[session_id] = self.num_submitted
+        # Replaces the pending job of the session, which keeps its place in line
+        job = (self.num_submitted, config, kept_instruments, primers, deadline)
+        self.pending[session_id] = job
+        self.dispatch()
+        return self.num_submitted
+
+    def cancel(self, session_id: str) -> None:
+        """
+        Drops the pending job of a session and cancels its running jobs.
+        """
+        self.pending.pop(session_id, None)
+        self.latest_jobs.pop(session_id, None)
+        self.cancel_running(session_id)
+
+    def cancel_running(self, session_id: str) -> None:
+        """
+        Cancels the running jobs of a session.
+        """
+        for job_session_id, worker in self.running.values():
+            if job_session_id == session_id:
+                self.cancelled[worker] = 1
+
+    def finish(self, job_id: int) -> str:
+        """
+        Marks job <job_id> as finished, after its message was received, and hands a
+        pending job to the worker it freed.
+
+        Returns:
+        ----------
+            str: The session id of the job.
+        """
+        session_id, worker = self.running.pop(job_id)
+        self.idle_workers.append(worker)
+        self.dispatch()
+        return session_id
+
+    def is_latest(self, session_id: str, job_id: int) -> bool:
+        """
+        Returns True if no job of the session was submitted after job <job_id>.
+        """
+        return self.latest_jobs.get(session_id) == job_id
+
+    def dispatch(self) -> None:
+        """
+        Hands pending jobs to idle workers, the session that has waited longest first.
+        """
+        while self.pending and self.idle_workers:
+            session_id, job = self.pending.popitem(last=False)
+            worker = self.idle_workers.pop(0)
+            self.cancelled[worker] = 0
+            self.running[job[0]] = (session_id, worker)
+            self.job_queues[worker].put(job)
+
+    def shutdown(self, timeout: float = 5) -> None:
+        """
+        Cancels all jobs and stops the workers, terminating those that are not stopped
+        after <timeout> seconds.
+        """
+        self.pending.clear()
+        for idx, job_queue in enumerate(self.job_queues):
+            self.cancelled[idx] = 1
+            job_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+
+def generation_worker(
+    jobs, messages, cancelled, worker_idx: int, load_models: bool
+) -> None:
+    """
+    Plays the agents for every job of <jobs> until it gets None, and puts the outcome of
+    each job on <messages>.
+
+    Args:
+    ----------
+        jobs (Queue): The (job id, config, kept instruments, primers, deadline) of every
+            job of this worker.
+        messages (Queue): The queue the outcomes are put on.
+        cancelled (Array): The cancellation flag of every worker.
+        worker_idx (int): The index of this worker in cancelled.
+        load_models (bool): Whether to load the models first, if the worker was spawned.
+    """
+    import numpy as np
+    import torch
+
+    from agents import play_agents, warm_up_agents, cancellable, Generation_Cancelled
+
+    if load_models:
+        warm_up_agents()
+
+    # Forked workers start with the random state of the process that forked them
+    random.seed()
+    np.random.seed()
+    torch.seed()
+
+    def is_cancelled() -> bool:
+        return cancelled[worker_idx] == 1
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, config, kept_instruments, primers, deadline = job
+
+        try:
+            with cancellable(is_cancelled):
+                result = play_agents(config, kept_instruments, primers, deadline)
+        except Generation_Cancelled:
+            messages.put((JOB_CANCELLED, job_id, None))
+        except Exception:
+            traceback.print_exc()
+            messages.put((JOB_FAILED, job_id, None))
+        else:
+            messages.put((JOB_DONE, job_id, result))
+
+
+def forward_configs(config_queue, messages) -> None:
+    """
+    Moves the (session id, request id, configuration) of the server from <config_queue> to
+    <messages>, so the generation process waits on one queue for both configurations
+    and results. None on config_queue is forwarded as SHUTDOWN and stops the forwarding.
+    """
+    while True:
+        request = config_queue.get()
+        if request is None:
+            messages.put((SHUTDOWN, None, None))
+            return
+        messages.put((NEW_CONFIG, None, request))
@@ -3,6 +3,9 @@ from flask_cors import CORS
 from multiprocessing import Process, Queue as mpQueue, Event as mpEvent
 
 import os
+import queue
+import base64
+import itertools
 import threading
 
 import signal
@@ -14,6 +17,7 @@ from .utils import (
     get_duration_preferences_bass_from_advanced,
     get_duration_preferences_melody_from_advanced,
 )
+from .sessions import DEFAULT_SESSION
 from .broadcaster import (
     set_new_channels,
     broadcasting_loop,
@@ -28,7 +32,19 @@ generation_queue = mpQueue(maxsize=10)
 chord_progression_queue = mpQueue(maxsize=10)
 generation_is_complete = mpEvent()
 change_groove_event = mpEvent()
+models_ready = mpEvent()
+session_results = mpQueue()
 
+# Session id -> request id, MIDI file and chord progression of its latest generation, for
+# the sessions other than the default one. Filled by collect_session_results.
+latest_session_results: dict[str, tuple[int, bytes, list]] = {}
+# Session id -> id of its latest /set_params request, a result of an older one is stale
+latest_requests: dict[str, int] = {}
+request_ids = itertools.count(1)
+
+
+# Seconds the generator process gets to stop its workers on shutdown
+SHUTDOWN_TIMEOUT = 10
 
 is_playing = False
 
@@ -56,7 +72,8 @@ CORS(midi_app)
 @midi_app.route("/set_params", methods=["POST"])
 def set_params():
     """
-    Sets the parameters for MIDI file generation based on the frontend.
+    Sets the parameters for MIDI file generation based on the frontend, for the session
+    in "session_id", the default session if it is not given.
 
     Returns:
     ----------
@@ -141,9 +158,18 @@ def set_params():
         "INTERVAL": data.get("interval", False),
         "DELAY": data.get("delay", False),
     }
-    config_queue.put(global_config)
+    session_id = str(data.get("session_id", DEFAULT_SESSION))
+    request_id = next(request_ids)
+    latest_requests[session_id] = request_id
+    config_queue.put((session_id, request_id, global_config))
     current_loop_count = 0
-    return jsonify({"message": "Processing MIDI file..."})
+    return jsonify(
+        {
+            "message": "Processing MIDI file...",
+            "session_id": session_id,
+            "request_id": request_id,
+        }
+    )
 
 
 @midi_app.route("/mute", methods=["POST"])
@@ -214,29 +240,85 @@ def update_volume():
 @midi_app.route("/check_status", methods=["GET"])
 def check_status():
     """
-    Check the status of the music generation process.
+    Check the status of the music generation process. For a session other than the
+    default one, the generation is complete once it has a result of its latest request.
 
     Returns:
     ----------
         A JSON response indicating whether the generation is complete or not.
     """
     global generation_is_complete
-    is_complete = generation_is_complete.is_set()
+    session_id = request.args.get("session_id", DEFAULT_SESSION)
+    if session_id == DEFAULT_SESSION:
+        is_complete = generation_is_complete.is_set()
+    else:
+        is_complete = is_latest_result(session_id)
     return jsonify({"isComplete": is_complete})
 
 
+@midi_app.route("/session_result", methods=["GET"])
+def session_result():
+    """
+    Returns the latest generation of a session other than the default one, which is
+    broadcast to the MIDI ports instead.
+
+    Returns:
+    ----------
+        A JSON response with the base64 encoded MIDI file, the chord progression, the id
+        of the request it was generated for and whether that is the latest request of the
+        session, or a 404 if the session has no generation yet or was evicted.
+    """
+    session_id = request.args.get("session_id", DEFAULT_SESSION)
+    result = latest_session_results.get(session_id)
+    if result is None:
+        return jsonify({"error": f"No generation for session {session_id}"}), 404
+    request_id, midi_bytes, chord_progression = result
+    return jsonify(
+        {
+            "midi": base64.b64encode(midi_bytes).decode("ascii"),
+            "chordProgression": chord_progression,
+            "requestId": request_id,
+            "isLatest": request_id == latest_requests.get(session_id),
+        }
+    )
+
+
+def is_latest_result(session_id: str) -> bool:
+    """
+    Returns True if the session has a result, and it was generated for the latest
+    /set_params request of the session.
+    """
+    result = latest_session_results.get(session_id)
+    return result is not None and result[0] == latest_requests.get(session_id)
+
+
+@midi_app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Check whether the models are loaded. Generation requests sent before are queued.
+
+    Returns:
+    ----------
+        A JSON response indicating whether the models are loaded or not.
+    """
+    return jsonify({"ready": models_ready.is_set()})
+
+
 @midi_app.route("/shutdown", methods=["POST"])
 def shutdown():
     """
-    Terminate the generator process.
+    Stop the generator process and its workers, terminating it if it does not stop in time.
 
     Returns:
     ----------
         str: A message indicating that the server is shutting down.
     """
-    global gen_process
-    gen_process.terminate()
-    gen_process.join()
+    global gen_process, config_queue
+    config_queue.put(None)
+    gen_process.join(SHUTDOWN_TIMEOUT)
+    if gen_process.is_alive():
+        gen_process.terminate()
+        gen_process.join()
     return "Server shutting down..."
 
 
@@ -310,6 +392,13 @@ def send_chord_progression():
     """
     global chord_progression_queue
     chord_progression = chord_progression_queue.get()
+    # Progressions queued after it belong to newer grooves, and the broadcaster only plays
+    # the latest groove, so the latest progression is the one that is played
+    while True:
+        try:
+            chord_progression = chord_progression_queue.get_nowait()
+        except queue.Empty:
+            break
     cp_string = ""
     duration_string = ""
     for chord, duration in chord_progression:
@@ -318,14 +407,35 @@ def send_chord_progression():
     return jsonify({"chordProgression": cp_string, "duration": duration_string})
 
 
-def start_broadcaster():
+def collect_session_results():
+    """
+    Keeps the latest generation of every session from session_results, and forgets the
+    sessions the generation process evicted, unless the session got a request after the
+    generation process evicted it, which recreates the session.
+    """
+    while True:
+        session_id, request_id, midi_bytes, chord_progression = session_results.get()
+        if midi_bytes is None:
+            latest_session_results.pop(session_id, None)
+            if latest_requests.get(session_id) == request_id:
+                latest_requests.pop(session_id, None)
+        else:
+            latest_session_results[session_id] = (
+                request_id,
+                midi_bytes,
+                chord_progression,
+            )
+
+
+def start_broadcaster(build_datasets: bool = False):
     """
     Starts the MIDI broadcaster by running the Flask server and the broadcasting loop in separate threads.
-    It also starts the music generation process.
+    It also starts the music generation process, which loads the models in the background.
 
     Parameters:
     ----------
-        None
+        build_datasets (bool): Whether the generation process builds the datasets before
+            loading the models.
 
     Returns:
     ----------
@@ -362,6 +472,10 @@ def start_broadcaster():
     broadcasting_thread.daemon = True
     broadcasting_thread.start()
 
+    results_thread = threading.Thread(target=collect_session_results)
+    results_thread.daemon = True
+    results_thread.start()
+
     config_queue = mpQueue()
     gen_process = Process(
         target=music_generation_process,
@@ -371,6 +485,9 @@ def start_broadcaster():
             change_groove_event,
             generation_is_complete,
             chord_progression_queue,
+            models_ready,
+            session_results,
+            build_datasets,
         ),
     )
     gen_process.start()
@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict, deque
+
+from .utils import get_kept_instruments
+
+# Session of the browser interface, the only one that is broadcast to the MIDI ports
+DEFAULT_SESSION = "default"
+
+
+class Session:
+    """
+    The generation state of one jam session: its latest configuration and the id of the
+    request it came with, the primers the next generation continues from, and the last
+    generations, from which instruments are kept.
+    """
+
+    def __init__(self, session_id: str, log_length: int):
+        """
+        Args:
+        ----------
+            session_id (str): The id of the session.
+            log_length (int): Number of generations kept in the generation log.
+        """
+        self.session_id = session_id
+        self.config: dict = None
+        self.request_id: int = None
+        self.primers: tuple = None
+        self.generation_log = deque(maxlen=log_length)
+        self.last_active = time.time()
+
+    def get_kept_instruments(self) -> list:
+        """
+        Returns the instruments of the last generation, see get_kept_instruments.
+        """
+        return get_kept_instruments(self.generation_log)
+
+
+class Session_Manager:
+    """
+    The sessions of the generation server, keyed by session id.
+
+    A session is created by its first request. Sessions without a request for <ttl>
+    seconds are evicted, and when there are <max_sessions> sessions the least recently
+    active one is evicted to make room for a new one, so the memory of the sessions is
+    bounded. The default session is never evicted.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, log_length: int):
+        """
+        Args:
+        ----------
+            ttl (float): Seconds after its last request a session is evicted.
+            max_sessions (int): Maximum number of sessions.
+            log_length (int): Number of generations kept per session.
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.log_length = log_length
+        # Least recently active first
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def touch(self, session_id: str) -> tuple[Session, list[Session]]:
+        """
+        Returns the session with <session_id>, created if it does not exist, and marks it
+        as active.
+
+        Returns:
+        ----------
+            tuple[Session, list[Session]]: The session, and the sessions evicted to make
+                room for it.
+        """
+        evicted = []
+        if session_id not in self.sessions:
+            while len(self.sessions) >= self.max_sessions:
+                oldest_id = next(
+                    (s for s in self.sessions if s != DEFAULT_SESSION), None
+                )
+                if oldest_id is None:
+                    break
+                evicted.append(self.sessions.pop(oldest_id))
+            self.sessions[session_id] = Session(session_id, self.log_length)
+
+        session = self.sessions[session_id]
+        session.last_active = time.time()
+        self.sessions.move_to_end(session_id)
+        return session, evicted
+
+    def get(self, session_id: str) -> Session:
+        """
+        Returns the session with <session_id>, or None if it was evicted.
+        """
+        return self.sessions.get(session_id)
+
+    def evict_idle(self) -> list[Session]:
+        """
+        Evicts the sessions that have been idle for longer than the TTL.
+
+        Returns:
+        ----------
+            list[Session]: The evicted sessions.
+        """
+        expired_before = time.time() - self.ttl
+        expired = [
+            session_id
+            for session_id, session in self.sessions.items()
+            if session.last_active < expired_before and session_id != DEFAULT_SESSION
+        ]
+        return [self.sessions.pop(session_id) for session_id in expired]
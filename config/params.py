@@ -1,5 +1,7 @@
+import os
 import torch
 
+from dataset_manifest import DATASET_MANIFEST_PATH
 
 SEED = 42  # Random seed
 
@@ -7,3 +9,31 @@ SAVE_RESULT_PATH = "results/drum_bass_chord_melody.mid"
 
 # DEVICE = torch.device("mps")
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Dataset building
+NUM_WORKERS_PREPROCESSING = os.cpu_count()  # Processes used to process POP909 songs
+PREPROCESSING_CACHE_DIR = "data/dataset/cache"  # Processed songs, keyed by content
+
+# Training data loading
+NUM_WORKERS_TRAINING = min(4, os.cpu_count())  # DataLoader worker processes
+PREFETCH_FACTOR_TRAINING = 2  # Batches loaded in advance by each worker
+
+# Training loop
+CHECKPOINT_DIR = "models/checkpoints"  # Resumable training checkpoints
+CHECKPOINT_INTERVAL_BATCHES = 100  # Batches between checkpoint writes
+EARLY_STOPPING_PATIENCE = 10  # Epochs without a better validation loss before stopping
+RESUME_TRAINING = True  # Continue from the checkpoint of an interrupted run
+
+# Precision
+MIXED_PRECISION = None  # None to train in fp32, "bf16" (CPU or GPU) or "fp16" (GPU, with loss scaling)
+FUSED_OPTIMIZER = True  # Use the fused optimizer implementation where available
+
+# Distributed training
+NUM_TRAINING_PROCESSES = 1  # Data-parallel processes per agent, 1 to train in this process
+DISTRIBUTED_BACKEND = "gloo"  # "gloo" for CPU, "nccl" for GPUs, one GPU per process
+DISTRIBUTED_PORT = 29500  # Port of the process group rendezvous on localhost
+
+# Evaluation
+EVAL_BATCH_SIZE = 512  # Samples per forward pass when evaluating the agents
+EVAL_RESULTS_DIR = "results/evaluation"  # Stored experiment results, keyed by the models and datasets
+NUM_RESAMPLES = 10000  # Bootstrap resamples and permutations of the statistical tests
@@ -20,6 +20,7 @@ NUM_EPOCHS_BASS = 50  # Number of epochs
 MAX_BATCHES_BASS = (
     500  # Max number of batches to train on per Epoch, for shorter training
 )
+TRANSPOSE_AUGMENTATION_BASS = False  # Randomly transpose every training sample
 
 MODEL_PATH_BASS = "models/bass/bass_model.pt"
 MODEL_PATH_BASS_LSTM = "models/bass/bass_model_lstm.pt"
@@ -11,6 +11,7 @@ LEARNING_RATE_CHORD = 0.0001
 
 WEIGHT_DECAY_CHORD = 0  # 0.001
 NHEAD_CHORD = 4  # Number of self-attention heads
+TRANSPOSE_AUGMENTATION_CHORD = False  # Randomly transpose every training sample
 
 # NUM_EPOCHS_CHORD = 50  # Number of epochs
 # MAX_BATCHES_CHORD = (
@@ -5,6 +5,7 @@ CHORD_SIZE_MELODY = 24
 DURATION_SIZE_MELODY = 16
 PITCH_SIZE_MELODY = PITCH_VECTOR_SIZE + 1
 TIME_LEFT_ON_CHORD_SIZE_MELODY = 16
+ACCUMULATED_TIME_SIZE_MELODY = 4  # Beat of the bar a note starts on, one-hot
 INPUT_SIZE_MELODY = (
     PITCH_SIZE_MELODY
     + DURATION_SIZE_MELODY
@@ -27,6 +28,7 @@ WEIGHT_DECAY_MELODY = 0.001
 DROPOUT_MELODY = 0.5
 NUM_LAYERS_LSTM_MELODY = 2
 CHECKPOINT_FREQUENCY_MELODY = 5
+TRANSPOSE_AUGMENTATION_MELODY = False  # Randomly transpose every training window
 
 
 TOTAL_INPUT_SIZE_MELODY = (
@@ -3,6 +3,13 @@ TEMPO = 120
 LENGTH = 24  # Number of measures to be generated
 LOOP_MEASURES = 4
 
+# Generation server
+GENERATION_WORKERS = 2  # Processes generating at the same time, models loaded
+GENERATION_DEADLINE = 10  # Seconds after which the previous instruments are kept
+SESSION_TTL = 30 * 60  # Seconds without a request after which a session is evicted
+MAX_SESSIONS = 32  # Sessions kept at once, the least recently active is evicted first
+GENERATION_LOG_LENGTH = 8  # Generations kept per session
+
 # Drum parameters
 STYLE = "country"
 
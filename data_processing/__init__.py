@@ -9,8 +9,15 @@ from .datasets import (
     Drum_Dataset,
     Melody_Dataset,
     Melody_Dataset_Combined,
+    MELODY_EVENT_FIELDS,
 )
+from .drum_codec import Drum_Codec
 from .drum_processing import get_drum_dataset
+from .transposition import (
+    transpose_melody_batch,
+    transpose_bass_batch,
+    transpose_chord_batch,
+)
 from .utils import (
     split_range,
     create_vocab,
@@ -18,6 +25,7 @@ from .utils import (
     load_yaml,
     remove_file_from_dataset,
     split_indices,
-    get_indices,
+    get_build_key,
+    read_manifest,
 )
 from .melody_processing import get_melody_dataset
@@ -1,9 +1,19 @@
 import os
 import re
+import numpy as np
 import torch
+from functools import partial
 
 from .datasets import Bass_Dataset, Chord_Dataset, Chord_Dataset_Bass
-from .utils import get_timed_notes
+from .utils import (
+    get_timed_notes,
+    list_song_dirs,
+    process_songs_in_parallel,
+    get_song_keys,
+    get_build_key,
+    is_build_current,
+    write_manifest,
+)
 
 from config import (
     TRAIN_DATASET_PATH_BASS,
@@ -15,13 +25,19 @@ from config import (
     TRAIN_DATASET_PATH_CHORD_BASS,
     TEST_DATASET_PATH_CHORD_BASS,
     VAL_DATASET_PATH_CHORD_BASS,
+    SEQUENCE_LENGTH_BASS,
+    SEQUENCE_LENGTH_CHORD,
 )
 
+# Bump when process_chord_song or the bass/chord dataset format changes, to invalidate cached songs and datasets
+CHORD_PROCESSING_VERSION = 1
+
 
 def get_bass_and_chord_dataset(root_directory: str) -> None:
     """
     Creates a dataset object containing timed note sequences and chords for the training
     and evaluation of the bass agent and chord agent.
+    The datasets are only rebuilt if the songs, the processing code or the config they depend on have changed.
 
     Args
     ----------
@@ -31,55 +47,71 @@ def get_bass_and_chord_dataset(root_directory: str) -> None:
     ----------
         None
     """
-    if (
-        not os.path.exists(TRAIN_DATASET_PATH_BASS)
-        or not os.path.exists(TRAIN_DATASET_PATH_CHORD)
-        or not os.path.exists(TRAIN_DATASET_PATH_CHORD_BASS)
-    ):
-        timed_notes_list: list[list[list[tuple[str, int]]]] = []
-        chords_list: list[list[tuple[str, str]]] = []
-        chord_n_beat_list: list = []
-        for split in ["train", "test", "val"]:
-            chords, notes, beats, chord_n_beat = extract_chords_from_files(
-                root_directory, True, split
-            )
-
-            chord_n_beat_list.append(chord_n_beat)
-            chords_list.append(chords)
-            timed_notes_list.append(get_timed_notes(notes, beats))
-
-        if not os.path.exists(TRAIN_DATASET_PATH_CHORD):
-            chord_dataset_train: Chord_Dataset = Chord_Dataset(chords_list[0])
-            chord_dataset_test: Chord_Dataset = Chord_Dataset(chords_list[1])
-            chord_dataset_val: Chord_Dataset = Chord_Dataset(chords_list[2])
-
-            torch.save(chord_dataset_train, TRAIN_DATASET_PATH_CHORD)
-            torch.save(chord_dataset_test, TEST_DATASET_PATH_CHORD)
-            torch.save(chord_dataset_val, VAL_DATASET_PATH_CHORD)
-
-        if not os.path.exists(TRAIN_DATASET_PATH_CHORD_BASS):
-            chord_bass_dataset_train: Chord_Dataset = Chord_Dataset_Bass(
-                chord_n_beat_list[0]
-            )
-            chord_bass_dataset_test: Chord_Dataset = Chord_Dataset_Bass(
-                chord_n_beat_list[1]
-            )
-            chord_bass_dataset_val: Chord_Dataset = Chord_Dataset_Bass(
-                chord_n_beat_list[2]
+    splits = ["train", "test", "val"]
+    song_config = (CHORD_PROCESSING_VERSION, True)
+    build_key = get_build_key(
+        song_config,
+        SEQUENCE_LENGTH_BASS,
+        SEQUENCE_LENGTH_CHORD,
+        [
+            get_song_keys(
+                list_song_dirs([os.path.join(root_directory, split)]), song_config
             )
-
-            torch.save(chord_bass_dataset_train, TRAIN_DATASET_PATH_CHORD_BASS)
-            torch.save(chord_bass_dataset_test, TEST_DATASET_PATH_CHORD_BASS)
-            torch.save(chord_bass_dataset_val, VAL_DATASET_PATH_CHORD_BASS)
-
-        if not os.path.exists(TRAIN_DATASET_PATH_BASS):
-            bass_dataset_train: Bass_Dataset = Bass_Dataset(timed_notes_list[0])
-            bass_dataset_test: Bass_Dataset = Bass_Dataset(timed_notes_list[1])
-            bass_dataset_val: Bass_Dataset = Bass_Dataset(timed_notes_list[2])
-
-            torch.save(bass_dataset_train, TRAIN_DATASET_PATH_BASS)
-            torch.save(bass_dataset_test, TEST_DATASET_PATH_BASS)
-            torch.save(bass_dataset_val, VAL_DATASET_PATH_BASS)
+            for split in splits
+        ],
+    )
+    dataset_paths = [
+        TRAIN_DATASET_PATH_BASS,
+        TEST_DATASET_PATH_BASS,
+        VAL_DATASET_PATH_BASS,
+        TRAIN_DATASET_PATH_CHORD,
+        TEST_DATASET_PATH_CHORD,
+        VAL_DATASET_PATH_CHORD,
+        TRAIN_DATASET_PATH_CHORD_BASS,
+        TEST_DATASET_PATH_CHORD_BASS,
+        VAL_DATASET_PATH_CHORD_BASS,
+    ]
+
+    if is_build_current("bass_and_chord", build_key, dataset_paths):
+        return
+
+    timed_notes_list: list[list[list[tuple[str, int]]]] = []
+    chords_list: list[list[tuple[str, str]]] = []
+    chord_n_beat_list: list = []
+    for split in splits:
+        chords, notes, beats, chord_n_beat = extract_chords_from_files(
+            root_directory, True, split
+        )
+
+        chord_n_beat_list.append(chord_n_beat)
+        chords_list.append(chords)
+        timed_notes_list.append(get_timed_notes(notes, beats))
+
+    chord_dataset_train: Chord_Dataset = Chord_Dataset(chords_list[0])
+    chord_dataset_test: Chord_Dataset = Chord_Dataset(chords_list[1])
+    chord_dataset_val: Chord_Dataset = Chord_Dataset(chords_list[2])
+
+    torch.save(chord_dataset_train, TRAIN_DATASET_PATH_CHORD)
+    torch.save(chord_dataset_test, TEST_DATASET_PATH_CHORD)
+    torch.save(chord_dataset_val, VAL_DATASET_PATH_CHORD)
+
+    chord_bass_dataset_train: Chord_Dataset = Chord_Dataset_Bass(chord_n_beat_list[0])
+    chord_bass_dataset_test: Chord_Dataset = Chord_Dataset_Bass(chord_n_beat_list[1])
+    chord_bass_dataset_val: Chord_Dataset = Chord_Dataset_Bass(chord_n_beat_list[2])
+
+    torch.save(chord_bass_dataset_train, TRAIN_DATASET_PATH_CHORD_BASS)
+    torch.save(chord_bass_dataset_test, TEST_DATASET_PATH_CHORD_BASS)
+    torch.save(chord_bass_dataset_val, VAL_DATASET_PATH_CHORD_BASS)
+
+    bass_dataset_train: Bass_Dataset = Bass_Dataset(timed_notes_list[0])
+    bass_dataset_test: Bass_Dataset = Bass_Dataset(timed_notes_list[1])
+    bass_dataset_val: Bass_Dataset = Bass_Dataset(timed_notes_list[2])
+
+    torch.save(bass_dataset_train, TRAIN_DATASET_PATH_BASS)
+    torch.save(bass_dataset_test, TEST_DATASET_PATH_BASS)
+    torch.save(bass_dataset_val, VAL_DATASET_PATH_BASS)
+
+    write_manifest("bass_and_chord", build_key)
 
 
 def extract_chords_from_files(root_dir, only_triads, split):
@@ -106,124 +138,206 @@ def extract_chords_from_files(root_dir, only_triads, split):
     all_beats: list[list[int]] = []
     all_chord_n_beats: list = []
 
-    # Traverse through the directory structure
-    for dir_name, subdirs, file_list in os.walk(os.path.join(root_dir, split)):
-        if "versions" in subdirs:
-            subdirs.remove("versions")
-        chords = []
-        for file_name in file_list:
-            if file_name == ".DS_Store":
-                continue
-            # key: str = get_key(dir_name, "key_audio.txt")
-            beat_list: list = get_beat_info(dir_name, "beat_audio.txt")
-            if file_name == "chord_audio.txt":
-                # # If there is a keychange in the song, skip it
-                # if len(key) > 1:
-                #     continue
-                chords: list[tuple(str, str)] = []
-                num_beats_list: list[int] = []
-
-                placement: list[str, int] = []
-
-                for fn in file_list:
-                    if fn[0] == "C":
-                        song_name = fn.split("_")[1].split(".")[0]
-                with open(os.path.join(dir_name, file_name), "r") as file:
-                    for line in file:
-                        # Split the line into components
-                        components = line.split()
-                        if components[2] == "N":
-                            continue
-                        # Split the chord by ':' and save as a tuple
-                        chord_start = float(components[0])
-                        chord_end = float(components[1])
-
-                        placement = [song_name, chord_start]
-
-                        num_beats = find_chord_length(chord_start, chord_end, beat_list)
-
-                        root, version = components[2].split(":")
-                        if only_triads:
-                            version = remove_non_triad(version)
-                        chords.append((root, version, placement))
-                        num_beats_list.append(num_beats)
-
-                    chords = flat_to_sharp(chords)
-                    # key = flat_to_sharp_key(key[0])
-
-                    # if key[-1] == "j" and key != "C:maj":
-                    # chords = transpose_chord(chords, key)
-                    # all_chords.append(chords)
-                    # all_beats.append(num_beats_list)
-
-                    all_chords.append(chords)
-                    all_beats.append(num_beats_list)
-                    all_chord_n_beats.append([chords, num_beats_list])
+    song_dirs: list[str] = list_song_dirs([os.path.join(root_dir, split)])
+    song_chords: list = process_songs_in_parallel(
+        partial(process_chord_song, only_triads=only_triads),
+        song_dirs,
+        "chord",
+        (CHORD_PROCESSING_VERSION, only_triads),
+    )
+
+    for song in song_chords:
+        if song is None:
+            continue
+        chords, num_beats_list = song
+
+        all_chords.append(chords)
+        all_beats.append(num_beats_list)
+        all_chord_n_beats.append([chords, num_beats_list])
 
     all_notes = get_notes_from_chords(all_chords)
 
     return all_chords, all_notes, all_beats, all_chord_n_beats
 
 
-def find_chord_length(chord_start, chord_end, beat_list):
+def process_chord_song(dir_name: str, only_triads: bool):
+    """
+    Extracts the chords and their lengths in beats from one song directory. Runs in a worker process.
+
+    Args:
+    ----------
+        dir_name (str): The song directory containing chord_audio.txt and beat_audio.txt.
+        only_triads (bool): Flag indicating whether to include only triads.
+
+    Returns:
+    ----------
+        tuple: The chords of the song and the number of beats of each chord,
+            or None if the directory has no chord annotations.
+    """
+    annotations: dict = load_song_annotations(dir_name)
+    if annotations["chord_names"] is None:
+        return None
+
+    # # If there is a keychange in the song, skip it
+    # if len(annotations["keys"]) > 1:
+    #     continue
+
+    # Skip the parts of the song where no chord is played
+    chord_indices: list[int] = [
+        index
+        for index, chord_name in enumerate(annotations["chord_names"])
+        if chord_name != "N"
+    ]
+    chord_starts: np.ndarray = annotations["chord_starts"][chord_indices]
+    chord_ends: np.ndarray = annotations["chord_ends"][chord_indices]
+
+    num_beats_list: list[int] = find_chord_lengths(
+        chord_starts, chord_ends, annotations["beat_times"]
+    )
+
+    chords: list[tuple(str, str)] = []
+    for index, chord_start in zip(chord_indices, chord_starts.tolist()):
+        placement: list[str, int] = [annotations["song_name"], chord_start]
+
+        root, version = annotations["chord_names"][index].split(":")
+        if only_triads:
+            version = remove_non_triad(version)
+        chords.append((root, version, placement))
+
+    chords = flat_to_sharp(chords)
+    # key = flat_to_sharp_key(annotations["keys"][0])
+
+    # if key[-1] == "j" and key != "C:maj":
+    # chords = transpose_chord(chords, key)
+
+    return chords, num_beats_list
+
+
+def load_song_annotations(dir_name: str) -> dict:
     """
-    Calculates the length of a chord based on its start and end positions in a list of beats.
+    Parses the beat, chord and key annotations of a song directory once, into NumPy arrays.
+
+    Args:
+    ----------
+        dir_name (str): The song directory, containing C_<song>.mid and the *_audio.txt annotation files.
+
+    Returns:
+    ----------
+        dict: The song name, the beat times, the chord start and end times and chord names,
+            and the key start and end times and keys. The chord and key entries are None
+            if the song has no chord_audio.txt or key_audio.txt.
+    """
+    file_list: list[str] = os.listdir(dir_name)
+
+    song_name: str = None
+    for fn in file_list:
+        if fn[0] == "C":
+            song_name = fn.split("_")[1].split(".")[0]
+
+    beat_times, _, _ = read_timed_labels(os.path.join(dir_name, "beat_audio.txt"))
+
+    chord_starts = chord_ends = chord_names = None
+    if "chord_audio.txt" in file_list:
+        chord_starts, chord_ends, chord_names = read_timed_labels(
+            os.path.join(dir_name, "chord_audio.txt")
+        )
+
+    key_starts = key_ends = keys = None
+    if "key_audio.txt" in file_list:
+        key_starts, key_ends, keys = read_timed_labels(
+            os.path.join(dir_name, "key_audio.txt")
+        )
+
+    return {
+        "song_name": song_name,
+        "beat_times": beat_times,
+        "chord_starts": chord_starts,
+        "chord_ends": chord_ends,
+        "chord_names": chord_names,
+        "key_starts": key_starts,
+        "key_ends": key_ends,
+        "keys": keys,
+    }
+
+
+def read_timed_labels(file_path: str) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    Reads an annotation file where each line starts with a time, optionally followed by an end time and a label.
+
+    Args:
+    ----------
+        file_path (str): The path to the annotation file.
+
+    Returns:
+    ----------
+        tuple: The start times, the end times and the labels. The end times and labels are
+            only meaningful for files that have them (chord_audio.txt and key_audio.txt).
+    """
+    starts: list[float] = []
+    ends: list[float] = []
+    labels: list[str] = []
+    with open(file_path, "r") as file:
+        for line in file:
+            components = line.split()
+            if not components:
+                continue
+            starts.append(float(components[0]))
+            if len(components) > 2:
+                ends.append(float(components[1]))
+                labels.append(components[2])
+    return np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64), labels
+
+
+def find_chord_lengths(chord_starts, chord_ends, beat_times):
+    """
+    Calculates the length of every chord of a song in beats, based on its start and end positions in the beats.
 
     Parameters:
     ----------
-    chord_start (float): The start position of the chord.
-    chord_end (float): The end position of the chord.
-    beat_list (list): A list of beats.
+    chord_starts (np.ndarray): The start times of the chords.
+    chord_ends (np.ndarray): The end times of the chords.
+    beat_times (np.ndarray): The sorted beat times of the song.
 
     Returns:
     ----------
-    int: The length of the chord in beats.
+    list[int]: The length of each chord in beats.
     """
-    distance_to_start: float = 10000
-    for index, time in enumerate(beat_list):
-        current_distance = abs(float(time) - chord_start)
-        if current_distance < distance_to_start:
-            distance_to_start = current_distance
-        else:
-            chord_start = index
-            break
-
-    distance_to_end: float = 10000
-    for index, time in enumerate(beat_list):
-        current_distance = abs(float(time) - chord_end)
-        if current_distance < distance_to_end:
-            distance_to_end = current_distance
-        else:
-            chord_end = index
-            break
-    beat_time = chord_end - chord_start
+    beat_time = get_beat_positions(chord_ends, beat_times) - get_beat_positions(
+        chord_starts, beat_times
+    )
     # The last note is not represented like the rest, defaults to 2 beats
-    if beat_time < 0:
-        beat_time = 2
-    if beat_time > 8:
-        beat_time = 8
-    return int(beat_time)
+    beat_time = np.where(beat_time < 0, 2, np.minimum(beat_time, 8))
+    return beat_time.astype(int).tolist()
 
 
-def get_beat_info(dir_name, file_name):
+def get_beat_positions(times, beat_times):
     """
-    Retrieves the beat information from a file.
+    Finds the position of each time in the beats, as the index of the beat after the closest beat.
+    Times that are closest to the last beat have no such index, and are kept as they are.
 
     Parameters:
     ----------
-    dir_name (str): The directory name where the file is located.
-    file_name (str): The name of the file.
+    times (np.ndarray): The times to find the positions of.
+    beat_times (np.ndarray): The sorted beat times of the song.
 
     Returns:
     ----------
-    list: A list containing the beat information.
+    np.ndarray: The position of each time.
     """
-    beat_list = []
-    with open(os.path.join(dir_name, file_name), "r") as file:
-        for line in file:
-            components = line.split()
-            beat_list.append(components[0])
-    return beat_list
+    num_beats: int = len(beat_times)
+    if num_beats == 0:
+        return times
+
+    # First beat at or after each time
+    after = np.searchsorted(beat_times, times)
+    distance_before = times - beat_times[np.maximum(after - 1, 0)]
+    distance_after = beat_times[np.minimum(after, num_beats - 1)] - times
+
+    # On a tie the earlier beat is the closest
+    positions = np.where(
+        (after > 0) & (distance_after >= distance_before), after, after + 1
+    )
+    return np.where(positions < num_beats, positions, times)
 
 
 def flat_to_sharp(chords):
@@ -317,29 +431,6 @@ def remove_non_triad(string):
     return modified_str
 
 
-def get_key(dir_name, file_name):
-    """
-    Retrieves the key from a text file.
-
-    Parameters:
-    ----------
-    dir_name (str): The directory name where the file is located.
-    file_name (str): The name of the file.
-
-    Returns:
-    ----------
-    list: A list of keys extracted from the file.
-    """
-    key = []
-    # Check if key_audio.txt exists
-    with open(os.path.join(dir_name, file_name), "r") as file:
-        for line in file:
-            components = line.split()
-            # Extract the key (string after the two numbers)
-            key.append(components[2])
-    return key
-
-
 def get_notes_from_chords(chords):
     """
     Extracts the root notes from a list of chords.
@@ -1,14 +1,13 @@
-import note_seq as ns
 import numpy as np
 import torch
+import torch.nn.functional as F
 import math
-import random
 from torch.utils.data import Dataset
-import tensorflow_datasets as tfds
 
-from .utils import split_range, create_vocab, get_bucket_number, LMOrderedIterator
+from .utils import split_range, create_vocab, LMOrderedIterator
+from .drum_codec import Drum_Codec
 
-from note_seq.sequences_lib import augment_note_sequence, quantize_note_sequence
+from note_seq.sequences_lib import quantize_note_sequence
 
 from config import (
     SEQUENCE_LENGTH_BASS,
@@ -16,6 +15,26 @@ from config import (
     SEQUENCE_LENGTH_CHORD,
     CHORD_TO_INT,
     SEQUENCE_LENGHT_MELODY,
+    PITCH_SIZE_MELODY,
+    DURATION_SIZE_MELODY,
+    CHORD_SIZE_MELODY,
+    TIME_LEFT_ON_CHORD_SIZE_MELODY,
+    ACCUMULATED_TIME_SIZE_MELODY,
+    SEED,
+)
+
+# Splits of the Groove dataset, in the order of their ids in example_splits
+DRUM_SPLITS = ("train", "test", "valid")
+
+# Sizes of the one-hot fields of a melody event: pitch, duration, current chord,
+# next chord, time left on chord and accumulated time
+MELODY_EVENT_FIELDS = (
+    PITCH_SIZE_MELODY,
+    DURATION_SIZE_MELODY,
+    CHORD_SIZE_MELODY,
+    CHORD_SIZE_MELODY,
+    TIME_LEFT_ON_CHORD_SIZE_MELODY,
+    ACCUMULATED_TIME_SIZE_MELODY,
 )
 
 
@@ -136,34 +155,25 @@ class Drum_Dataset:
     """
     Dataset to handle data in pipeline
 
+    The vocab is built on creation. The tokens of the Groove examples are set with
+    set_examples, from the flat arrays built by data_processing.drum_processing, and are
+    joined into one token stream per split and type (all, beat or fill).
+
     This class together with related functions and classes are a part of the bumblebeat project
     bumblebeat https://github.com/thomasgnuttall/bumblebeat/tree/master
     """
 
     def __init__(
         self,
-        data_dir,
-        dataset_name,
         pitch_classes,
         time_steps_vocab,
-        processing_conf,
         n_velocity_buckets=10,
         min_velocity=0,
         max_velocity=127,
-        augment_stretch=True,
-        shuffle=True,
     ):
-        """
-        Documentation here baby
-        """
-        self.data_dir = data_dir
-        self.dataset_name = dataset_name
         self.pitch_classes = pitch_classes
         self.time_steps_vocab = time_steps_vocab
         self.n_velocity_buckets = n_velocity_buckets
-        self.processing_conf = processing_conf
-        self.augment_stretch = True
-        self.shuffle = True
 
         self.velocity_buckets = split_range(
             min_velocity, max_velocity, n_velocity_buckets
@@ -186,119 +196,71 @@ class Drum_Dataset:
             len(self.reverse_vocab) + len(time_steps_vocab) + len(self.vel_vocab) + 1
         )  # add 1 for <eos> token
 
-        train_dataset = self.download_midi(dataset_name, tfds.Split.TRAIN)
-        test_dataset = self.download_midi(dataset_name, tfds.Split.TEST)
-        valid_dataset = self.download_midi(dataset_name, tfds.Split.VALIDATION)
-
-        self.train_data = [x for x in train_dataset]
-        self.test_data = [x for x in test_dataset]
-        self.valid_data = [x for x in valid_dataset]
-
-        self.train_data_beat = []
-        self.train_data_fill = []
-        self.test_data_beat = []
-        self.test_data_fill = []
-        self.val_data_beat = []
-        self.val_data_fill = []
-
-        for item in self.train_data:
-            if item["type"] == 0:
-                self.train_data_beat.append(item)
-            elif item["type"] == 1:
-                self.train_data_fill.append(item)
-
-        for item in self.test_data:
-            if item["type"] == 0:
-                self.test_data_beat.append(item)
-            elif item["type"] == 1:
-                self.test_data_fill.append(item)
-
-        for item in self.valid_data:
-            if item["type"] == 0:
-                self.val_data_beat.append(item)
-            elif item["type"] == 1:
-                self.val_data_fill.append(item)
-
-        print("Processing dataset TRAIN...")
-        self.train_all = self.process_dataset(self.train_data, conf=processing_conf)
-        self.train_beat = self.process_dataset(
-            self.train_data_beat, conf=processing_conf
-        )
-        self.train_fill = self.process_dataset(
-            self.train_data_fill, conf=processing_conf
-        )
-
-        print("Processing dataset TEST...")
-        self.test_all = self.process_dataset(self.test_data, conf=processing_conf)
-        self.test_beat = self.process_dataset(self.test_data_beat, conf=processing_conf)
-        self.test_fill = self.process_dataset(self.test_data_fill, conf=processing_conf)
-
-        print("Processing dataset VALID...")
-        self.valid_all = self.process_dataset(self.valid_data, conf=processing_conf)
-        self.valid_beat = self.process_dataset(self.val_data_beat, conf=processing_conf)
-        self.valid_fill = self.process_dataset(self.val_data_fill, conf=processing_conf)
-
-    def download_midi(self, dataset_name, dataset_split):
-        print(f"Downloading midi data: {dataset_name}, split: {dataset_split}")
-        dataset = tfds.as_numpy(
-            tfds.load(name=dataset_name, split=dataset_split, try_gcs=True)
+        self.codec = Drum_Codec(
+            self.pitch_class_map,
+            self.vocab,
+            self.vel_vocab,
+            self.time_steps_vocab,
+            self.velocity_buckets,
         )
-        return dataset
 
-    def process_dataset(self, dataset, conf):
+    def set_examples(self, arrays: dict, shuffle: bool = True, seed: int = SEED):
         """
-        Augment, transform and tokenize each sample in <dataset>
-        Return: list of tokenised sequences
+        Sets the tokenized examples and joins them into the token streams train_all,
+        train_beat, train_fill, test_all, ..., valid_fill.
+
+        Args:
+        ----------
+            arrays (dict): The arrays of build_drum_arrays in data_processing.drum_processing.
+            shuffle (bool): Whether to shuffle the sequences of each stream.
+            seed (int): Seed of the shuffle.
         """
-        # Abstract to ARGS at some point
-        quantize = conf["quantize"]
-        steps_per_quarter = conf["steps_per_quarter"]
-        filter_4_4 = conf["filter_4_4"]  # maybe we dont want this?
-
-        # To midi note sequence using magent
-        dev_sequences = [
-            ns.midi_to_note_sequence(features["midi"]) for features in dataset
-        ]
-
-        if self.augment_stretch:
-            augmented = self._augment_stretch(dev_sequences)
-            # Tripling the total number of sequences
-            dev_sequences = dev_sequences + augmented
-
-        if quantize:
-            dev_sequences = [
-                self._quantize(d, steps_per_quarter) for d in dev_sequences
-            ]
-
-        # Filter out those that are not in 4/4 and do not have any notes
-        dev_sequences = [
-            s
-            for s in dev_sequences
-            if self._is_4_4(s)
-            and len(s.notes) > 0
-            and s.notes[-1].quantized_end_step
-            > ns.steps_per_bar_in_quantized_sequence(s)
-        ]
-
-        # note sequence -> [(pitch, vel_bucket, start timestep)]
-        tokens = [self._tokenize(d, steps_per_quarter, quantize) for d in dev_sequences]
-
-        if self.shuffle:
-            np.random.shuffle(tokens)
-
-        stream = self._join_token_list(tokens, n=1)
-
-        return torch.tensor(stream)
+        self.arrays = arrays
+        rng = np.random.default_rng(seed)
+        example_splits = arrays["example_splits"][arrays["sequence_examples"]]
+        example_types = arrays["example_types"][arrays["sequence_examples"]]
+
+        for split_idx, split in enumerate(DRUM_SPLITS):
+            for name, types in (("all", (0, 1)), ("beat", (0,)), ("fill", (1,))):
+                sequences = np.flatnonzero(
+                    arrays["sequence_in_stream"]
+                    & (example_splits == split_idx)
+                    & np.isin(example_types, types)
+                )
+                if shuffle:
+                    rng.shuffle(sequences)
+                setattr(self, f"{split}_{name}", self._join_sequences(sequences))
 
-    def _join_token_list(self, tokens, n=5):
+    def _join_sequences(self, sequences: np.ndarray, n: int = 1) -> torch.Tensor:
+        """
+        Joins the token sequences at the indices <sequences> into one stream, each followed
+        by <n> pad tokens, after a leading pad token.
+        """
+        tokens, offsets = self.arrays["tokens"], self.arrays["sequence_offsets"]
+        pad = np.zeros(n, dtype=tokens.dtype)
+        parts = [pad[:1]]
+        for idx in sequences:
+            parts += [tokens[offsets[idx] : offsets[idx + 1]], pad]
+        return torch.from_numpy(np.concatenate(parts).astype(np.int64))
+
+    def get_example_tokens(self, split: str, style: int = None) -> list[np.ndarray]:
         """
-        Join list of lists, <tokens>
-        In new list each previous list is separated by <n> instances
-        of the highest token value (token assigned for placeholding)
+        Returns the tokens of every example of a split, without stretching and whether or
+        not it is in the streams, optionally only the examples of a primary style.
         """
-        pad = 0
-        to_join = [t + n * [pad] for t in tokens]
-        return [pad] + [y for x in to_join for y in x]
+        arrays = self.arrays
+        examples = arrays["sequence_examples"]
+        is_original = np.ones(len(examples), dtype=bool)
+        is_original[1:] = examples[1:] != examples[:-1]
+        is_match = arrays["example_splits"][examples] == DRUM_SPLITS.index(split)
+        if style is not None:
+            is_match &= arrays["example_styles"][examples] == style
+
+        offsets = arrays["sequence_offsets"]
+        return [
+            arrays["tokens"][offsets[idx] : offsets[idx + 1]]
+            for idx in np.flatnonzero(is_original & is_match)
+        ]
 
     def get_iterator(self, split, *args, **kwargs):
         if split == "train":
@@ -309,34 +271,12 @@ class Drum_Dataset:
 
         return data_iter
 
-    def _augment_stretch(self, note_sequences):
-        """
-        Two stretchings for each sequence in <note_sequence>:
-          - faster by 1%-10%
-          - slower by 1%-10%
-        These are returned as new sequences
-        """
-        augmented_slow = [
-            augment_note_sequence(x, 1.01, 1.1, 0, 0) for x in note_sequences
-        ]
-        augmented_fast = [
-            augment_note_sequence(x, 0.9, 0.99, 0, 0) for x in note_sequences
-        ]
-        return augmented_fast + augmented_slow
-
     def _quantize(self, s, steps_per_quarter=4):
         """
         Quantize a magenta Note Sequence object
         """
         return quantize_note_sequence(s, steps_per_quarter)
 
-    def _is_4_4(self, s):
-        """
-        Return True if sample, <s> is in 4/4 timing, False otherwise
-        """
-        ts = s.time_signatures[0]
-        return ts.numerator == 4 and ts.denominator == 4
-
     def _tokenize(self, note_sequence, steps_per_quarter, quantize):
         """
         from magenta <note_sequence> return list of
@@ -347,141 +287,9 @@ class Drum_Dataset:
         - pitch is mapped using self.pitch_class_map
         - velocities are bucketted as per self.velocity_buckets
         """
-        d = [
-            (
-                self.pitch_class_map[n.pitch],
-                get_bucket_number(n.velocity, self.velocity_buckets),
-                n.quantized_start_step if quantize else n.start_time,
-            )
-            for n in note_sequence.notes
-            if n.pitch in self.pitch_class_map
-        ]
-
-        ticks_per_quarter = note_sequence.ticks_per_quarter
-        qpm = note_sequence.tempos[0].qpm  # quarters per minute
-        ticks_per_second = qpm * ticks_per_quarter / 60
-
-        filled = self._tokenize_w_ticks(
-            d,
-            ticks_per_second,
-            ticks_per_quarter,
-            steps_per_quarter,
-            quantize,
-            self.vocab,
-            self.vel_vocab,
-            self.time_steps_vocab,
-        )
-
-        return filled
-
-    def _tokenize_w_ticks(
-        self,
-        triples,
-        ticks_per_second,
-        ticks_per_quarter,
-        steps_per_quarter,
-        quantize,
-        pitch_vocab,
-        vel_vocab,
-        time_steps_vocab,
-    ):
-        """
-        From list of <triples> in the form:
-            [(pitch class, bucketed velocity, start time (seconds/timesteps)),...]
-        Return list of tokens matching pitch-velocity combination to tokens in <pitch_vocab>
-        and filling silence with time tokens in <time_steps_vocab>
-
-        Returns: list
-            sequence of tokens from the pitch and time_steps vocabularies
-        """
-
-        # Initalise final tokenised sequence
-        w_silence = []
-
-        # Initalise counter to keep track of consecutive pitches
-        # so that we can ensure they are appended to our
-        # final tokenised sequence in numerical order
-        consecutive_pitches = 0
-
-        # index, (pitch, velocity, start time)
-        for i, (x, y, z) in enumerate(triples):
-            if i == 0:
-                silence = z
-            else:
-                silence = z - triples[i - 1][2]  # z of previous element
-
-            if quantize:
-                ticks = silence * ticks_per_quarter / steps_per_quarter
-            else:
-                ticks = int(silence * ticks_per_second)
-
-            if ticks:
-                # make sure that any consecutive pitches in sequence
-                # are in numerical order so as to enforce an ordering
-                # rule for pitches that are commonly hit in unison
-                w_silence[-consecutive_pitches:] = sorted(
-                    w_silence[-consecutive_pitches:]
-                )
-
-                # Since silences are computed using time since last pitch class,
-                # every iteration in this loop is a pitch class.
-                # Hence we set consecutive pitch back to one
-                # (representing the pitch of this iteration, added just outside of this if-clause)
-                consecutive_pitches = 1
-
-                # Number of ticks to list of time tokens
-                time_tokens = self._convert_num_to_denominations(
-                    ticks, time_steps_vocab
-                )
-
-                # Add time tokens to final sequence before we add our pitch class
-                w_silence += [time_tokens]
-            else:
-                # Remember that every iteration is a pitch.
-                # If <ticks> is 0 then this pitch occurs
-                # simultaneously with the previous.
-                # We sort these numerically before adding the
-                # next stream of time tokens
-                consecutive_pitches += 1
-
-            # Triple to tokens...
-            #   Discard time since we have handled that with time tokens.
-            #   Look up pitch velocity combination for corresponding token.
-            pitch_tok = pitch_vocab[x]  # [pitch class]
-            vel_tok = vel_vocab[y]
-            w_silence.append([pitch_tok, vel_tok])
-
-        return [x for y in w_silence for x in y]
-
-    def _convert_num_to_denominations(self, num, time_vocab):
-        """
-        Convert <num> into sequence of time tokens in (<time_vocab>).
-        Tokens are selected so as to return a sequence of minimum length possible
-
-        Params
-        ======
-        num: int
-            Number of ticks to convert
-        time_vocab: d¡ct
-            {num_ticks: token}
-
-        Return
-        ======
-        list:
-            [tokens representing number]
-        """
-        # Start with largest demoninations
-        denominations = list(sorted(time_vocab.keys(), reverse=True))
-        seq = []
-        for d in denominations:
-            div = num / d
-            # If <num> can be divided by this number
-            # Create as many tokens as possible with this denomination
-            if div > 1:
-                floor = math.floor(div)
-                seq += floor * [time_vocab[d]]
-                num -= floor * d
-        return seq
+        return self.codec.encode_note_sequence(
+            note_sequence, steps_per_quarter, quantize
+        ).tolist()
 
     def _roundup(self, x, n):
         """
@@ -498,45 +306,101 @@ class Drum_Dataset:
 
 
 class Melody_Dataset(Dataset):
+    """
+    Melody dataset stored as one flat event tensor.
+
+    Every event of every song is one row in ``self.events``, holding the integer id of
+    each one-hot field in MELODY_EVENT_FIELDS. Songs are delimited by ``self.song_offsets``
+    and a training window is addressed only by the flat index of its first event in
+    ``self.window_starts``. Batches are gathered from a strided ``unfold`` view of the
+    event tensor with a single index op in ``__getitems__``, and expanded to one-hot
+    vectors by the collate function.
+    """
+
     def __init__(self, data):
-        self.data = data
         self.sequence_length = SEQUENCE_LENGHT_MELODY
+        self._flatten_songs(data)
         self._get_indices()
 
+    def _flatten_songs(self, data):
+        rows, start_times, lengths = [], [], []
+        self.song_names = []
+        for song in data:
+            lengths.append(len(song))
+            self.song_names.append(song[0][6][0] if song else "")
+            for event in song:
+                rows.append([field.index(1) for field in event[:6]])
+                start_times.append(event[6][1])
+
+        self.events = torch.tensor(rows, dtype=torch.uint8).reshape(
+            -1, len(MELODY_EVENT_FIELDS)
+        )
+        self.event_start_times = torch.tensor(start_times, dtype=torch.float64)
+        self.song_offsets = torch.zeros(len(lengths) + 1, dtype=torch.int64)
+        self.song_offsets[1:] = torch.cumsum(
+            torch.tensor(lengths, dtype=torch.int64), dim=0
+        )
+
     def _get_indices(self):
-        self.indices = []
-        for song in self.data:
-            for i in range(len(song) - (self.sequence_length * 2) + 1):
-                self.indices.append((song, i))
+        song_lengths = self.song_offsets[1:] - self.song_offsets[:-1]
+        num_windows = (song_lengths - self.sequence_length * 2 + 1).clamp(min=0)
+
+        song_ids = torch.repeat_interleave(torch.arange(len(num_windows)), num_windows)
+        first_window = torch.cumsum(num_windows, dim=0) - num_windows
+        position_in_song = torch.arange(int(num_windows.sum())) - first_window[song_ids]
+        self.window_starts = self.song_offsets[song_ids] + position_in_song
 
     def __len__(self):
-        return len(self.indices)
+        return len(self.window_starts)
 
     def __getitem__(self, idx):
-        song, start_idx = self.indices[idx]
+        start_idx = int(self.window_starts[idx])
+        events = self._decode_events(start_idx, start_idx + self.sequence_length + 1)
         # Return two sequences of length sequence_length. These corresponds to the input and target sequences
-        return (
-            song[start_idx : start_idx + self.sequence_length],
-            song[
-                start_idx + self.sequence_length : start_idx + self.sequence_length + 1
-            ],
-        )
+        return events[:-1], events[-1:]
 
+    def __getitems__(self, indices):
+        """
+        Gathers a whole batch of windows with one index op on a strided view of the
+        event tensor. Returns a tensor of field ids of shape
+        (batch, sequence_length + 1, len(MELODY_EVENT_FIELDS)), where the last event of
+        each window is the target.
+        """
+        windows = self.events.unfold(0, self.sequence_length + 1, 1)
+        starts = self.window_starts[torch.as_tensor(indices, dtype=torch.int64)]
+        return windows[starts].transpose(1, 2)
 
-class Melody_Dataset_Combined(Dataset):
-    def __init__(self, data, indices):
-        self.data = data
-        self.sequence_length = SEQUENCE_LENGHT_MELODY
-        self.indices = indices
+    def _decode_events(self, start, end):
+        """
+        Converts the rows start:end back to the list representation produced by
+        process_melody_and_chord. Used by the primer and evaluation code, not by training.
+        """
+        song_idx = int(
+            torch.searchsorted(self.song_offsets, torch.tensor(start), right=True) - 1
+        )
+        events = []
+        for row, start_time in zip(
+            self.events[start:end].long(), self.event_start_times[start:end].tolist()
+        ):
+            fields = [
+                F.one_hot(field_id, field_size).tolist()
+                for field_id, field_size in zip(row, MELODY_EVENT_FIELDS)
+            ]
+            fields.append([self.song_names[song_idx], start_time])
+            events.append(fields)
+        return events
 
-    def __len__(self):
-        return len(self.indices)
 
-    def __getitem__(self, idx):
-        song, start_idx = self.indices[idx]
-        return (
-            song[start_idx : start_idx + self.sequence_length],
-            song[
-                start_idx + self.sequence_length : start_idx + self.sequence_length + 1
-            ],
-        )
+class Melody_Dataset_Combined(Melody_Dataset):
+    """
+    A subset of the windows of a Melody_Dataset. The event tensor is shared with the
+    parent dataset, only the window start indices differ.
+    """
+
+    def __init__(self, dataset, window_starts):
+        self.sequence_length = dataset.sequence_length
+        self.events = dataset.events
+        self.event_start_times = dataset.event_start_times
+        self.song_names = dataset.song_names
+        self.song_offsets = dataset.song_offsets
+        self.window_starts = torch.as_tensor(window_starts, dtype=torch.int64)
@@ -0,0 +1,274 @@
+import numpy as np
+
+from .utils import split_range
+
+# Kinds of drum tokens, in Drum_Codec.token_kinds
+PAD_TOKEN = 0
+TIME_TOKEN = 1
+VELOCITY_TOKEN = 2
+INSTRUMENT_TOKEN = 3
+
+# Highest MIDI pitch
+MAX_PITCH = 127
+
+
+class Drum_Codec:
+    """
+    Converts drum hits to the tokens of the drum model and back.
+
+    The vocabs are compiled once into arrays indexed by token, pitch or velocity bucket, so
+    a whole sequence is tokenized or detokenized with a few array operations instead of a
+    dict or list lookup per hit.
+    """
+
+    def __init__(
+        self,
+        pitch_class_map: dict[int, int],
+        instrument_vocab: dict[int, int],
+        velocity_vocab: dict[int, int],
+        time_steps_vocab: dict[int, int],
+        velocity_buckets: list[float],
+    ):
+        """
+        Args:
+        ----------
+            pitch_class_map (dict[int, int]): MIDI pitch to instrument.
+            instrument_vocab (dict[int, int]): Instrument to token.
+            velocity_vocab (dict[int, int]): Velocity bucket to token.
+            time_steps_vocab (dict[int, int]): Number of ticks to token.
+            velocity_buckets (list[float]): Edges of the velocity buckets, from split_range.
+        """
+        vocab_size = (
+            max(
+                [
+                    *instrument_vocab.values(),
+                    *velocity_vocab.values(),
+                    *time_steps_vocab.values(),
+                ]
+            )
+            + 1
+        )
+
+        # Token -> kind, instrument, velocity bucket and ticks of silence
+        self.token_kinds = np.full(vocab_size, PAD_TOKEN, dtype=np.int8)
+        self.token_instruments = np.full(vocab_size, -1, dtype=np.int64)
+        self.token_velocity_buckets = np.full(vocab_size, -1, dtype=np.int64)
+        self.token_ticks = np.zeros(vocab_size, dtype=np.int64)
+        for instrument, token in instrument_vocab.items():
+            self.token_kinds[token] = INSTRUMENT_TOKEN
+            self.token_instruments[token] = instrument
+        for bucket, token in velocity_vocab.items():
+            self.token_kinds[token] = VELOCITY_TOKEN
+            self.token_velocity_buckets[token] = bucket
+        for ticks, token in time_steps_vocab.items():
+            self.token_kinds[token] = TIME_TOKEN
+            self.token_ticks[token] = ticks
+
+        # Pitch -> instrument, -1 for pitches without one
+        self.pitch_instruments = np.full(MAX_PITCH + 1, -1, dtype=np.int64)
+        for pitch, instrument in pitch_class_map.items():
+            self.pitch_instruments[pitch] = instrument
+
+        self.instrument_tokens = np.array(
+            [instrument_vocab[i] for i in range(len(instrument_vocab))], dtype=np.int64
+        )
+        self.velocity_tokens = np.array(
+            [velocity_vocab[i] for i in range(len(velocity_vocab))], dtype=np.int64
+        )
+        self.velocity_buckets = np.asarray(velocity_buckets, dtype=np.float64)
+
+        # Largest denominations first, so a silence takes as few time tokens as possible
+        denominations = sorted(time_steps_vocab, reverse=True)
+        self.denominations = np.array(denominations, dtype=np.int64)
+        self.denomination_tokens = np.array(
+            [time_steps_vocab[d] for d in denominations], dtype=np.int64
+        )
+
+        # Decoded velocities are drawn from 1-127, in the bucket of the velocity token
+        self.decode_velocity_edges = np.array(
+            split_range(1, 127, len(velocity_vocab)), dtype=np.float64
+        )
+        # Bucket of a hit that is not followed by a velocity token
+        self.default_velocity_bucket = len(velocity_vocab) // 2
+
+    def get_velocity_buckets(self, velocities: np.ndarray) -> np.ndarray:
+        """
+        Returns the index of the velocity bucket of every velocity, the first bucket whose
+        upper edge is at least the velocity.
+        """
+        velocities = np.asarray(velocities)
+        if velocities.size and (
+            velocities.min() < self.velocity_buckets[0]
+            or velocities.max() > self.velocity_buckets[-1]
+        ):
+            raise ValueError("Velocity is not in any velocity bucket")
+        return np.digitize(velocities, self.velocity_buckets[1:-1], right=True)
+
+    def get_time_token_counts(self, ticks: np.ndarray) -> np.ndarray:
+        """
+        Returns how many tokens of every denomination fill each silence, shape
+        (silences, denominations). Only denominations that fit more than once are used.
+        """
+        counts = np.zeros((len(ticks), len(self.denominations)), dtype=np.int64)
+        remaining = np.asarray(ticks, dtype=np.float64)
+        for idx, denomination in enumerate(self.denominations):
+            div = remaining / denomination
+            counts[:, idx] = np.where(div > 1, np.floor(div), 0)
+            remaining = remaining - counts[:, idx] * denomination
+        return counts
+
+    def encode(
+        self,
+        pitches: np.ndarray,
+        velocities: np.ndarray,
+        start_times: np.ndarray,
+        ticks_per_second: float,
+        ticks_per_quarter: int,
+        steps_per_quarter: int,
+        quantize: bool,
+    ) -> np.ndarray:
+        """
+        Tokenizes the hits of a sequence. Every hit becomes an instrument and a velocity
+        token, and the silence before it becomes time tokens. Hits without an instrument are
+        dropped.
+
+        Args:
+        ----------
+            pitches (np.ndarray): MIDI pitch of every hit.
+            velocities (np.ndarray): Velocity of every hit.
+            start_times (np.ndarray): Start of every hit, in steps if quantize else in seconds.
+            ticks_per_second (float): Ticks per second, used if not quantize.
+            ticks_per_quarter (int): Ticks per quarter note, used if quantize.
+            steps_per_quarter (int): Steps per quarter note, used if quantize.
+            quantize (bool): Whether the start times are quantized steps.
+
+        Returns:
+        ----------
+            np.ndarray: The tokens.
+        """
+        instruments = self.pitch_instruments[np.asarray(pitches, dtype=np.int64)]
+        keep = instruments >= 0
+        instruments = instruments[keep]
+        if len(instruments) == 0:
+            return np.zeros(0, dtype=np.int64)
+        buckets = self.get_velocity_buckets(np.asarray(velocities)[keep])
+        start_times = np.asarray(start_times, dtype=np.float64)[keep]
+
+        # Silence before every hit, the first hit counts from the start
+        silences = np.diff(start_times, prepend=0.0)
+        if quantize:
+            ticks = silences * ticks_per_quarter / steps_per_quarter
+        else:
+            ticks = np.trunc(silences * ticks_per_second)
+
+        # A group is a hit after a silence and the hits at the same time as it
+        starts_group = ticks != 0
+        groups = np.cumsum(starts_group)
+        group_time_counts = np.zeros(
+            (groups[-1] + 1, len(self.denominations)), dtype=np.int64
+        )
+        group_time_counts[groups[starts_group]] = self.get_time_token_counts(
+            ticks[starts_group]
+        )
+
+        # The hits of a group are sorted by token, so hits in unison always come in the
+        # same order. The last group of a sequence keeps the order of its hits.
+        pitch_tokens = self.instrument_tokens[instruments]
+        velocity_tokens = self.velocity_tokens[buckets]
+        in_last_group = groups == groups[-1]
+        order = np.lexsort(
+            (
+                np.where(in_last_group, 0, velocity_tokens),
+                np.where(in_last_group, 0, pitch_tokens),
+                np.where(in_last_group, np.arange(len(groups)), 0),
+                groups,
+            )
+        )
+        groups = groups[order]
+
+        # The time tokens of a group go before its first hit
+        first_of_group = np.ones(len(groups), dtype=bool)
+        first_of_group[1:] = groups[1:] != groups[:-1]
+        time_counts = group_time_counts[groups] * first_of_group[:, None]
+        time_tokens = np.repeat(
+            np.tile(self.denomination_tokens, len(groups)), time_counts.ravel()
+        )
+
+        hit_lengths = time_counts.sum(axis=1) + 2
+        hit_positions = np.cumsum(hit_lengths) - 2
+        tokens = np.empty(hit_lengths.sum(), dtype=np.int64)
+        is_time = np.ones(len(tokens), dtype=bool)
+        is_time[hit_positions] = False
+        is_time[hit_positions + 1] = False
+        tokens[is_time] = time_tokens
+        tokens[hit_positions] = pitch_tokens[order]
+        tokens[hit_positions + 1] = velocity_tokens[order]
+        return tokens
+
+    def encode_note_sequence(
+        self, note_sequence, steps_per_quarter: int, quantize: bool
+    ) -> np.ndarray:
+        """
+        Tokenizes the notes of a note_seq NoteSequence, see encode. The start of a note is its
+        quantized step if quantize, else its start time.
+        """
+        notes = note_sequence.notes
+        pitches = np.array([n.pitch for n in notes], dtype=np.int64)
+        velocities = np.array([n.velocity for n in notes], dtype=np.int64)
+        start_times = np.array(
+            [n.quantized_start_step if quantize else n.start_time for n in notes],
+            dtype=np.float64,
+        )
+
+        ticks_per_quarter = note_sequence.ticks_per_quarter
+        qpm = note_sequence.tempos[0].qpm  # quarters per minute
+        ticks_per_second = qpm * ticks_per_quarter / 60
+
+        return self.encode(
+            pitches,
+            velocities,
+            start_times,
+            ticks_per_second,
+            ticks_per_quarter,
+            steps_per_quarter,
+            quantize,
+        )
+
+    def decode(
+        self, tokens: list[int], pitch_classes: list[list[int]]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Detokenizes a sequence into its hits. The velocity of a hit is drawn at random from
+        the bucket of the velocity token after it. Padding tokens and an instrument token at
+        the end of the sequence are ignored.
+
+        Args:
+        ----------
+            tokens (list[int]): The tokens.
+            pitch_classes (list[list[int]]): The pitches of every instrument. One of them is
+                drawn at random per sequence.
+
+        Returns:
+        ----------
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The pitch, velocity and start in ticks
+                of every hit.
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        kinds = self.token_kinds[tokens]
+        silence_ticks = np.cumsum(self.token_ticks[tokens])
+
+        # The velocity of a hit always follows its instrument
+        hits = np.flatnonzero(kinds[:-1] == INSTRUMENT_TOKEN)
+        next_tokens = tokens[hits + 1]
+        buckets = np.where(
+            kinds[hits + 1] == VELOCITY_TOKEN,
+            self.token_velocity_buckets[next_tokens],
+            self.default_velocity_bucket,
+        )
+
+        these_pitches = np.array([np.random.choice(p) for p in pitch_classes])
+        pitches = these_pitches[self.token_instruments[tokens[hits]]]
+        velocities = np.random.uniform(
+            self.decode_velocity_edges[buckets], self.decode_velocity_edges[buckets + 1]
+        ).astype(np.int64)
+        return pitches, velocities, silence_ticks[hits]
@@ -1,13 +1,21 @@
 import os
-import pickle
+import hashlib
+import random
 
+import numpy as np
+import note_seq as ns
+from note_seq.sequences_lib import augment_note_sequence, quantize_note_sequence
 
-import tensorflow as tf
+from .datasets import Drum_Dataset, DRUM_SPLITS
+from .drum_codec import Drum_Codec
 
+from .utils import load_yaml, get_build_key, process_in_parallel
 
-from .datasets import Drum_Dataset
+# Bump when Drum_Dataset processing changes, to invalidate the cached dataset
+DRUM_PROCESSING_VERSION = 2
 
-from .utils import load_yaml
+# Names of DRUM_SPLITS in tensorflow datasets
+TFDS_SPLITS = {"train": "train", "test": "test", "valid": "validation"}
 
 
 def get_drum_dataset() -> Drum_Dataset:
@@ -52,6 +60,11 @@ def get_dataset(
     """
     Load groove data into custom dataset class
 
+    The tokens of all examples are stored as flat int16 arrays in an .npz file, keyed by
+    everything they depend on. If the file does not exist, every example is processed
+    once in a process pool, with the result of each example cached by its id, and the
+    file is written.
+
     Parameters
     -------
     dataset_name: str
@@ -70,41 +83,164 @@ def get_dataset(
     drum_dataset: Drum_Dataset
 
     """
-    fn = os.path.join(data_dir, dataset_name, "cache.pkl")
+    drum_dataset = Drum_Dataset(pitch_classes, time_steps_vocab)
+
+    # The cache file is keyed by everything the processed dataset depends on,
+    # so a change in the vocab or processing options produces a new dataset
+    build_config = (
+        DRUM_PROCESSING_VERSION,
+        pitch_classes,
+        time_steps_vocab,
+        processing_conf,
+    )
+    build_key = get_build_key(dataset_name, *build_config)
+    fn = os.path.join(data_dir, dataset_name, "cache_" + build_key[:16] + ".npz")
 
-    if tf.io.gfile.exists(fn):
-        with open(fn, "rb") as fp:
-            drum_dataset = pickle.load(fp)
+    if os.path.isfile(fn):
+        print("Drum dataset: cache hit, loading", fn)
+        with np.load(fn) as file:
+            arrays = {name: file[name] for name in file.files}
     else:
-        create_dir_if_not_exists(fn)
-
-        print("Producing dataset...")
-        drum_dataset = Drum_Dataset(
-            data_dir=data_dir,
-            dataset_name=dataset_name,
-            pitch_classes=pitch_classes,
-            time_steps_vocab=time_steps_vocab,
-            processing_conf=processing_conf,
+        print("Drum dataset: cache miss, producing dataset...")
+        arrays = build_drum_arrays(
+            dataset_name, drum_dataset.codec, processing_conf, build_config
         )
 
         print("Saving dataset...")
-        with open(fn, "wb") as fp:
-            pickle.dump(drum_dataset, fp, protocol=2)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        tmp_path = fn + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(tmp_path, fn)
 
+    drum_dataset.set_examples(arrays)
     return drum_dataset
 
 
-def create_dir_if_not_exists(path: str):
+def build_drum_arrays(
+    dataset_name: str, codec: Drum_Codec, processing_conf: dict, build_config: tuple
+) -> dict[str, np.ndarray]:
     """
-    If the directory at <path> does not exist, create it empty
+    Downloads the examples of all splits and tokenizes each of them once.
 
-    Parameters
-    ----
-    path: str
-        Path of where to create directory
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The tokens of all sequences, as flat int16 "tokens" with the start of each
+        sequence in "sequence_offsets", and per sequence its example and whether it is in
+        the token streams. Per example its id, split, type and primary style.
+    """
+    examples = []
+    for split_idx, split in enumerate(DRUM_SPLITS):
+        for features in download_midi(dataset_name, split):
+            examples.append((split_idx, features))
+
+    example_ids = [features["id"].decode() for _, features in examples]
+    task_args = [
+        (features["midi"], codec, processing_conf, get_example_seed(example_id))
+        for example_id, (_, features) in zip(example_ids, examples)
+    ]
+    cache_keys = [
+        get_build_key(build_config, example_id, hashlib.sha256(args[0]).hexdigest())
+        for example_id, args in zip(example_ids, task_args)
+    ]
+    results = process_in_parallel(
+        process_drum_example, task_args, cache_keys, "drum_examples"
+    )
+
+    sequences = [
+        (example_idx, tokens, in_stream)
+        for example_idx, example_sequences in enumerate(results)
+        for tokens, in_stream in example_sequences
+    ]
+    lengths = [len(tokens) for _, tokens, _ in sequences]
+    return {
+        "tokens": np.concatenate(
+            [np.zeros(0, dtype=np.int16)] + [tokens for _, tokens, _ in sequences]
+        ),
+        "sequence_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        "sequence_examples": np.array(
+            [example_idx for example_idx, _, _ in sequences], dtype=np.int64
+        ),
+        "sequence_in_stream": np.array(
+            [in_stream for _, _, in_stream in sequences], dtype=bool
+        ),
+        "example_ids": np.array(example_ids, dtype=str),
+        "example_splits": np.array([split for split, _ in examples], dtype=np.int8),
+        "example_types": np.array(
+            [features["type"] for _, features in examples], dtype=np.int8
+        ),
+        "example_styles": np.array(
+            [features["style"]["primary"] for _, features in examples], dtype=np.int8
+        ),
+    }
+
+
+def download_midi(dataset_name: str, split: str):
+    print(f"Downloading midi data: {dataset_name}, split: {split}")
+    tfds = import_tfds()
+    return tfds.as_numpy(
+        tfds.load(name=dataset_name, split=TFDS_SPLITS[split], try_gcs=True)
+    )
+
+
+def import_tfds():
+    """
+    Imports tensorflow_datasets when the Groove corpus has to be downloaded. Importing it
+    loads TensorFlow, which takes seconds and hundreds of MB, so it is not imported with
+    this module.
+    """
+    import tensorflow_datasets as tfds
+
+    return tfds
+
+
+def get_example_seed(example_id: str) -> int:
+    """
+    Seed of the stretch augmentation of an example, so a rebuilt example is the same.
+    """
+    return int(hashlib.sha256(example_id.encode()).hexdigest()[:8], 16)
 
+
+def process_drum_example(
+    midi: bytes, codec: Drum_Codec, processing_conf: dict, seed: int
+) -> list[tuple[np.ndarray, bool]]:
+    """
+    Tokenizes an example, and a faster (by 1%-10%) and a slower (by 1%-10%) stretch of it.
+
+    Returns
+    -------
+    list[tuple[np.ndarray, bool]]
+        The int16 tokens of each sequence, and whether it goes in the token streams: it is
+        in 4/4, has notes and lasts longer than a bar. The unstretched example is always
+        first, also when it does not go in the streams, the stretches only if they do.
     """
-    directory = os.path.dirname(path)
-    # Do not try and create directory if path is just a filename
-    if (not os.path.exists(directory)) and (directory != ""):
-        os.makedirs(directory)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    quantize = processing_conf["quantize"]
+    steps_per_quarter = processing_conf["steps_per_quarter"]
+
+    sequence = ns.midi_to_note_sequence(midi)
+    sequences = [
+        sequence,
+        augment_note_sequence(sequence, 0.9, 0.99, 0, 0),
+        augment_note_sequence(sequence, 1.01, 1.1, 0, 0),
+    ]
+    if quantize:
+        sequences = [quantize_note_sequence(s, steps_per_quarter) for s in sequences]
+
+    results = []
+    for idx, s in enumerate(sequences):
+        time_signature = s.time_signatures[0]
+        in_stream = (
+            time_signature.numerator == 4
+            and time_signature.denominator == 4
+            and len(s.notes) > 0
+            and s.notes[-1].quantized_end_step
+            > ns.steps_per_bar_in_quantized_sequence(s)
+        )
+        if idx == 0 or in_stream:
+            tokens = codec.encode_note_sequence(s, steps_per_quarter, quantize)
+            results.append((tokens.astype(np.int16), in_stream))
+    return results
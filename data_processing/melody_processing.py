@@ -1,4 +1,5 @@
 import os
+import bisect
 import pretty_midi
 from .datasets import Melody_Dataset, Melody_Dataset_Combined
 import torch
@@ -12,17 +13,39 @@ from config import (
     TEST_DATASET_PATH_MELODY,
     VAL_DATASET_PATH_MELODY,
     TIME_LEFT_ON_CHORD_SIZE_MELODY,
+    ACCUMULATED_TIME_SIZE_MELODY,
     TRAIN_DATASET_COMBINED_PATH_MELODY,
     VAL_DATASET_COMBINED_PATH_MELODY,
     CHORD_SIZE_MELODY,
 )
 
-from .utils import get_indices, split_indices
+from .utils import (
+    split_indices,
+    list_song_dirs,
+    process_songs_in_parallel,
+    get_song_keys,
+    get_build_key,
+    is_build_current,
+    write_manifest,
+)
+
+# Bump when process_melody_and_chord or the Melody_Dataset format changes, to invalidate cached songs and datasets
+MELODY_PROCESSING_VERSION = 3
+
+# Everything the processing of a single song depends on
+MELODY_SONG_CONFIG = (
+    MELODY_PROCESSING_VERSION,
+    PITCH_VECTOR_SIZE,
+    TIME_LEFT_ON_CHORD_SIZE_MELODY,
+    ACCUMULATED_TIME_SIZE_MELODY,
+    CHORD_SIZE_MELODY,
+)
 
 
 def get_melody_dataset(root_dir: str) -> None:
     """
     Retrieves the melody dataset from the specified root directory and saves it as separate train, test, and validation datasets.
+    The datasets are only rebuilt if the songs, the processing code or the config they depend on have changed.
 
     Args:
     ----------
@@ -32,21 +55,25 @@ def get_melody_dataset(root_dir: str) -> None:
     ----------
         None
     """
-
-    if not os.path.exists(TRAIN_DATASET_PATH_MELODY):
-        all_events_list = []
-        for split in ["train", "test", "val"]:
+    splits = ["train", "test", "val"]
+    song_dirs = [list_song_dirs([os.path.join(root_dir, split)]) for split in splits]
+    build_key = get_build_key(
+        MELODY_SONG_CONFIG,
+        SEQUENCE_LENGHT_MELODY,
+        [get_song_keys(dirs, MELODY_SONG_CONFIG) for dirs in song_dirs],
+    )
+    dataset_paths = [
+        TRAIN_DATASET_PATH_MELODY,
+        TEST_DATASET_PATH_MELODY,
+        VAL_DATASET_PATH_MELODY,
+    ]
+
+    if not is_build_current("melody", build_key, dataset_paths):
+        for split, path in zip(splits, dataset_paths):
             print("Processing", split, "-split")
             all_events = process_melody(root_dir, split)
-            all_events_list.append(all_events)
-
-        melody_dataset_train: Melody_Dataset = Melody_Dataset(all_events_list[0])
-        melody_dataset_test: Melody_Dataset = Melody_Dataset(all_events_list[1])
-        melody_dataset_val: Melody_Dataset = Melody_Dataset(all_events_list[2])
-
-        torch.save(melody_dataset_train, TRAIN_DATASET_PATH_MELODY)
-        torch.save(melody_dataset_test, TEST_DATASET_PATH_MELODY)
-        torch.save(melody_dataset_val, VAL_DATASET_PATH_MELODY)
+            torch.save(Melody_Dataset(all_events), path)
+        write_manifest("melody", build_key)
     get_combined_melody_dataset(root_dir)
 
 
@@ -63,26 +90,40 @@ def get_combined_melody_dataset(root_dir: str) -> None:
     ----------
         None
     """
+    song_dirs = list_song_dirs(
+        [os.path.join(root_dir, "train"), os.path.join(root_dir, "val")]
+    )
+    build_key = get_build_key(
+        MELODY_SONG_CONFIG,
+        SEQUENCE_LENGHT_MELODY,
+        get_song_keys(song_dirs, MELODY_SONG_CONFIG),
+    )
+    dataset_paths = [
+        TRAIN_DATASET_COMBINED_PATH_MELODY,
+        VAL_DATASET_COMBINED_PATH_MELODY,
+    ]
 
-    if not os.path.exists(TRAIN_DATASET_COMBINED_PATH_MELODY):
-        all_events_list = []
-
+    if not is_build_current("melody_combined", build_key, dataset_paths):
         all_events = process_melody(root_dir, "combined")
+        melody_dataset = Melody_Dataset(all_events)
 
-        all_indices = get_indices(all_events, SEQUENCE_LENGHT_MELODY)
-        train_indices, val_indices = split_indices(all_indices)
+        train_indices, val_indices = split_indices(
+            melody_dataset.window_starts.tolist()
+        )
 
         # Create dataset instances
-        melody_dataset_train = Melody_Dataset_Combined(all_events, train_indices)
-        melody_dataset_val = Melody_Dataset_Combined(all_events, val_indices)
+        melody_dataset_train = Melody_Dataset_Combined(melody_dataset, train_indices)
+        melody_dataset_val = Melody_Dataset_Combined(melody_dataset, val_indices)
 
         torch.save(melody_dataset_train, TRAIN_DATASET_COMBINED_PATH_MELODY)
         torch.save(melody_dataset_val, VAL_DATASET_COMBINED_PATH_MELODY)
+        write_manifest("melody_combined", build_key)
 
 
 def process_melody(root_dir: str, split) -> Melody_Dataset:
     """
     Process the melody and chord files in the given root directory.
+    Songs that have been processed before with the same content and config are read from the cache.
 
     Args:
         root_dir (str): The root directory containing the melody and chord files.
@@ -97,32 +138,41 @@ def process_melody(root_dir: str, split) -> Melody_Dataset:
         root_dirs.append(os.path.join(root_dir, "val"))
     else:
         root_dirs.append(os.path.join(root_dir, split))
-    num_files = 0
-    all_events: list[list[list[int], list[int], list[list[int]], list[bool]]] = []
-    for root_dir in root_dirs:
-        for directory in os.listdir(root_dir):
-            if ".DS_Store" in directory:
-                continue
-            for file in os.listdir(os.path.join(root_dir, directory)):
-                if ".mid" in file:
-                    midi_file: str = os.path.join(root_dir, directory, file)
-                if "chord_audio" in file:
-                    chord_file: str = os.path.join(root_dir, directory, file)
-                else:
-                    continue
-
-            list_of_events: list[
-                list[list[int], list[int], list[list[int]], list[bool]]
-            ] = process_melody_and_chord(midi_file, chord_file)
-
-            if list_of_events is not None:
-                all_events.append(list_of_events)
-                num_files += 1
-                print("Processed", num_files, "files")
+
+    song_dirs: list[str] = list_song_dirs(root_dirs)
+    song_events: list = process_songs_in_parallel(
+        process_melody_song, song_dirs, "melody", MELODY_SONG_CONFIG
+    )
+
+    all_events: list[list[list[int], list[int], list[list[int]], list[bool]]] = [
+        list_of_events for list_of_events in song_events if list_of_events is not None
+    ]
+    print("Processed", len(all_events), "files")
 
     return all_events
 
 
+def process_melody_song(
+    song_dir: str,
+) -> list[list[int], list[int], list[list[int]], list[bool]]:
+    """
+    Processes the melody and chord files of one song directory. Runs in a worker process.
+
+    Args:
+        song_dir (str): The directory containing the MIDI and chord_audio.txt files of the song.
+
+    Returns:
+        list: The events of the song, as returned by process_melody_and_chord.
+    """
+    for file in os.listdir(song_dir):
+        if ".mid" in file:
+            midi_file: str = os.path.join(song_dir, file)
+        if "chord_audio" in file:
+            chord_file: str = os.path.join(song_dir, file)
+
+    return process_melody_and_chord(midi_file, chord_file)
+
+
 def process_melody_and_chord(
     midi_file: str, chord_file: str
 ) -> list[list[int], list[int], list[list[int]], list[bool]]:
@@ -161,6 +211,7 @@ def process_melody_and_chord(
     # Tolerance for the duration of an eighth note
     sixteenth_note_tolerance: float = ticks_per_beat / 4
     tempo: int = int(pm.get_tempo_changes()[1][0])
+    chord_index: dict = index_chords(chord_list, tempo, ticks_per_beat)
     placement: list[str, int] = None
 
     current_tick: int = 0
@@ -200,7 +251,7 @@ def process_melody_and_chord(
         )
 
         current_chord_vector, next_chord_vector, time_left_current_chord = find_chord(
-            chord_list, tempo, ticks_per_beat, start_tick, note_end_seconds, pm
+            chord_index, tempo, start_tick, note_end_seconds
         )
         # Break if there is no corresponding chord
         if not current_chord_vector:
@@ -237,12 +288,10 @@ def process_melody_and_chord(
                     next_chord_vector_pause,
                     time_left_current_chord_pause,
                 ) = find_chord(
-                    chord_list,
+                    chord_index,
                     tempo,
-                    ticks_per_beat,
                     start_tick - rest_duration,
                     note.start,
-                    pm,
                 )
 
                 if current_chord_vector_pause:
@@ -332,58 +381,91 @@ def add_note(pitch: int):
     return pitch_vector
 
 
-def find_chord(chord_list, tempo, ticks_per_beat, start_tick, note_end_seconds, pm):
+def index_chords(chord_list: list, tempo: int, ticks_per_beat: int) -> dict:
+    """
+    Preprocesses the chords of a song once, so each note can look up its chord with a binary search.
+    The chord timings are converted to ticks and the chord strings are parsed to one-hot vectors up front.
+
+    Args:
+    ----------
+        chord_list (list): A list of tuples containing the timing and chord information, sorted by time.
+        tempo (int): The tempo of the music.
+        ticks_per_beat (int): The number of ticks per beat.
+
+    Returns:
+    ----------
+        dict: Start ticks, end ticks, end times in seconds, chord vectors (None for unparsable chords)
+            and a running count of "N" (no chord) entries.
+    """
+    chord_index = {
+        "start_ticks": [],
+        "end_ticks": [],
+        "end_seconds": [],
+        "chord_vectors": [],
+        "no_chord_count": [0],
+    }
+    for timing, chord in chord_list:
+        chord_index["start_ticks"].append(
+            seconds_to_ticks(timing[0], tempo, ticks_per_beat)
+        )
+        chord_index["end_ticks"].append(
+            seconds_to_ticks(timing[1], tempo, ticks_per_beat)
+        )
+        chord_index["end_seconds"].append(float(timing[1]))
+        try:
+            chord_index["chord_vectors"].append(get_chord_list(chord))
+        except (AttributeError, KeyError):
+            chord_index["chord_vectors"].append(None)
+        chord_index["no_chord_count"].append(
+            chord_index["no_chord_count"][-1] + ("N" in chord)
+        )
+    return chord_index
+
+
+def find_chord(chord_index, tempo, start_tick, note_end_seconds):
     """
     Finds the corresponding chord for a given start tick and calculates the time left for the current chord.
     Is used to get the current and next chord vectors, and the time left for the current chord.
 
+    If the tick is on the boundary between two chords, the later chord is used.
+
     Parameters:
     ----------
-    chord_list (list): A list of tuples containing the timing and chord information.
+    chord_index (dict): The chords of the song, as returned by index_chords.
     tempo (int): The tempo of the music.
-    ticks_per_beat (int): The number of ticks per beat.
     start_tick (int): The start tick of the note.
     note_end_seconds (float): The end time of the note in seconds.
-    pm (int): The number of pulses per metronome tick.
 
     Returns:
     ----------
     tuple: A tuple containing the current chord vector, next chord vector, and time left for the current chord.
     """
-
-    # Find the corresponding chord
-    current_chord_vector = None
-    next_chord_vector = None
-    time_left_current_chord = None
-    for j, (timing, chord) in enumerate(chord_list):
-        chord_start_time = seconds_to_ticks(timing[0], tempo, ticks_per_beat)
-        chord_end_time = seconds_to_ticks(timing[1], tempo, ticks_per_beat)
-        if chord_start_time <= start_tick and chord_end_time >= start_tick:
-            # Only save chord if there is a chord, and not the last chord
-            if "N" not in chord:
-                current_chord: str = chord
-                chord_end = float(chord_list[j][0][1])
-                time_left_current_chord: float = calculate_chord_quarters(
-                    note_end_seconds, chord_end, tempo, pm
-                )  # In half beats
-
-                try:
-                    current_chord_vector: list[int] = get_chord_list(chord_list[j][1])
-                    next_chord_vector: list[int] = get_chord_list(chord_list[j + 1][1])
-
-                except:
-                    return None, None, None
-
-                chord = next(
-                    (i for i, value in enumerate(current_chord) if value == 1), None
-                )
-            # If there is no chord played, or last chord
-            else:
-                return None, None, None
+    # Chords with start <= start_tick <= end
+    first = bisect.bisect_left(chord_index["end_ticks"], start_tick)
+    last = bisect.bisect_right(chord_index["start_ticks"], start_tick) - 1
+    if last < first:
+        return None, None, None
+
+    # If there is no chord played, or last chord
+    no_chord_count = chord_index["no_chord_count"]
+    if no_chord_count[last + 1] - no_chord_count[first] > 0:
+        return None, None, None
+    if last + 1 >= len(chord_index["chord_vectors"]):
+        return None, None, None
+
+    # Every matching chord and its successor must be a known chord
+    chord_vectors = chord_index["chord_vectors"][first : last + 2]
+    if any(chord_vector is None for chord_vector in chord_vectors):
+        return None, None, None
+    current_chord_vector, next_chord_vector = chord_vectors[-2:]
+
+    time_left_current_chord: float = calculate_chord_quarters(
+        note_end_seconds, chord_index["end_seconds"][last], tempo
+    )  # In half beats
 
     return (
-        current_chord_vector,
-        next_chord_vector,
+        list(current_chord_vector),
+        list(next_chord_vector),
         time_left_current_chord,
     )
 
@@ -403,8 +485,8 @@ def get_accumulated_time(note_start: int, tempo: int) -> list[int]:
     """
 
     note_start_beats = round(note_start * tempo / 60)
-    relative_bar = note_start_beats % 4
-    accumulated_time: list[int] = [0] * 4
+    relative_bar = note_start_beats % ACCUMULATED_TIME_SIZE_MELODY
+    accumulated_time: list[int] = [0] * ACCUMULATED_TIME_SIZE_MELODY
 
     accumulated_time[relative_bar] = 1
     return accumulated_time
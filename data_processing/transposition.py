@@ -0,0 +1,87 @@
+import torch
+
+from config import PITCH_VECTOR_SIZE, CHORD_SIZE_MELODY
+
+# Random shifts in half steps, one per sample. -5 to 6 reaches every key once.
+MIN_SHIFT = -5
+MAX_SHIFT = 6
+
+
+def get_random_shifts(batch_size: int) -> torch.Tensor:
+    """
+    Draws a transposition in half steps for every sample of a batch, shape (batch, 1).
+    """
+    return torch.randint(MIN_SHIFT, MAX_SHIFT + 1, (batch_size, 1))
+
+
+def transpose_pitch_classes(ids: torch.Tensor, shifts: torch.Tensor) -> torch.Tensor:
+    """
+    Shifts pitch class ids (0-11), e.g. chord roots or bass notes, modulo 12.
+    """
+    return (ids.long() + shifts) % 12
+
+
+def transpose_melody_batch(batch: torch.Tensor) -> torch.Tensor:
+    """
+    Transposes every window of a melody batch by a random number of half steps. The
+    pitches are shifted and folded back by an octave if they leave the PITCH_VECTOR_SIZE
+    range, rests are kept, and the roots of the current and next chord are shifted
+    modulo 12, keeping major or minor.
+
+    Args:
+    ----------
+        batch (torch.Tensor): The field ids returned by Melody_Dataset.__getitems__, shape (batch, sequence length + 1, number of fields).
+
+    Returns:
+    ----------
+        torch.Tensor: The transposed field ids, the window and its target by the same shift.
+    """
+    batch = batch.long()
+    shifts = get_random_shifts(len(batch))
+
+    pitches = batch[:, :, 0]
+    is_note = pitches < PITCH_VECTOR_SIZE
+    shifted = pitches + shifts
+    shifted = torch.where(shifted < 0, shifted + 12, shifted)
+    shifted = torch.where(shifted >= PITCH_VECTOR_SIZE, shifted - 12, shifted)
+    batch[:, :, 0] = torch.where(is_note, shifted, pitches)
+
+    # A chord id is 2 * root + 1 if minor, see FULL_CHORD_TO_INT
+    batch[:, :, 2:4] = (batch[:, :, 2:4] + 2 * shifts.unsqueeze(2)) % CHORD_SIZE_MELODY
+    return batch
+
+
+def transpose_bass_batch(batch: list) -> list:
+    """
+    Transposes every sample of a collated Bass_Dataset batch by a random number of half
+    steps, the input notes and the note of the label alike.
+    """
+    notes, durations, labels = batch
+    shifts = get_random_shifts(len(notes))
+    labels = labels.clone()
+    labels[:, 0] = transpose_pitch_classes(labels[:, 0], shifts.squeeze(1))
+    return [transpose_pitch_classes(notes, shifts), durations, labels]
+
+
+def transpose_chord_batch(batch: list, transpose_labels: bool = False) -> list:
+    """
+    Transposes every sample of a collated Chord_Dataset or Chord_Dataset_Bass batch by a
+    random number of half steps. Only the roots move, the chord types are kept.
+
+    Args:
+    ----------
+        batch (list): The inputs, with the root in column 0, and the labels.
+        transpose_labels (bool): Whether the labels start with a root too, as in Chord_Dataset_Bass.
+
+    Returns:
+    ----------
+        list: The transposed inputs and labels.
+    """
+    data, labels = batch
+    shifts = get_random_shifts(len(data))
+    data = data.clone()
+    data[:, :, 0] = transpose_pitch_classes(data[:, :, 0], shifts)
+    if transpose_labels:
+        labels = labels.clone()
+        labels[:, 0] = transpose_pitch_classes(labels[:, 0], shifts.squeeze(1))
+    return [data, labels]
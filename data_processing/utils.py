@@ -3,6 +3,17 @@ import os
 import yaml
 import shutil
 import random
+import pickle
+import time
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import (
+    NUM_WORKERS_PREPROCESSING,
+    PREPROCESSING_CACHE_DIR,
+    DATASET_MANIFEST_PATH,
+)
 
 def get_timed_notes(
     notes: list[list[str]], beats: list[list[int]]
@@ -77,9 +88,13 @@ def get_bucket_number(value, srange):
 
 
 class LMOrderedIterator(object):
-    def __init__(self, data, bsz, bptt, device="cpu", ext_len=None):
+    def __init__(
+        self, data, bsz, bptt, device="cpu", ext_len=None, rank=0, world_size=1
+    ):
         """
         data -- LongTensor -- the LongTensor is strictly ordered
+        rank, world_size -- int -- when training distributed, the data is divided into
+            bsz * world_size streams and this rank iterates over every world_size-th one
         """
         self.bsz = bsz
         self.bptt = bptt
@@ -87,14 +102,16 @@ class LMOrderedIterator(object):
 
         self.device = device
 
-        # Work out how cleanly we can divide the dataset into bsz parts.
-        self.n_step = data.size(0) // bsz
+        # Work out how cleanly we can divide the dataset into bsz parts per rank.
+        num_streams = bsz * world_size
+        self.n_step = data.size(0) // num_streams
 
         # Trim off any extra elements that wouldn't cleanly fit (remainders).
-        data = data.narrow(0, 0, self.n_step * bsz)
+        data = data.narrow(0, 0, self.n_step * num_streams)
 
-        # Evenly divide the data across the bsz batches.
-        self.data = data.view(bsz, -1).t().contiguous().to(device)
+        # Evenly divide the data across the bsz batches of every rank.
+        data = data.view(num_streams, -1)[rank::world_size]
+        self.data = data.t().contiguous().to(device)
 
         # Number of mini-batches
         self.n_batch = (self.n_step + self.bptt - 1) // self.bptt
@@ -160,12 +177,177 @@ def remove_file_from_dataset(directory: str):
         print(f"Error: {e.strerror}. Could not remove directory {directory}.")
 
 
-def get_indices(data, sequence_length):
-    indices = []
-    for song in data:
-        for i in range(len(song) - (sequence_length * 2) + 1):
-            indices.append((song, i))
-    return indices
+def list_song_dirs(root_dirs: list[str]) -> list[str]:
+    """
+    Lists the song directories in the given root directories, in a deterministic order.
+
+    Args:
+    ----------
+        root_dirs (list[str]): Directories containing one directory per song.
+
+    Returns:
+    ----------
+        list[str]: Sorted paths to the song directories.
+    """
+    song_dirs = []
+    for root_dir in root_dirs:
+        for directory in sorted(os.listdir(root_dir)):
+            if ".DS_Store" in directory:
+                continue
+            song_dirs.append(os.path.join(root_dir, directory))
+    return song_dirs
+
+
+def process_songs_in_parallel(
+    task, song_dirs: list[str], build_name: str, build_config: tuple
+) -> list:
+    """
+    Runs <task> on every song directory in a process pool, one task per song.
+
+    Every result is cached in PREPROCESSING_CACHE_DIR under a key made from the content
+    of the song's files and <build_config> (processing code version and the config the
+    task depends on). Only songs without a cached result are processed, which also
+    makes an interrupted build resume where it stopped. Results are returned in the
+    order of <song_dirs>, no matter in which order the workers finish.
+
+    Args:
+    ----------
+        task (callable): Picklable function taking a song directory and returning its processed data.
+        song_dirs (list[str]): The song directories to process.
+        build_name (str): Name of the build, used for the cache directory and the printouts.
+        build_config (tuple): Code version and config values the result of <task> depends on.
+
+    Returns:
+    ----------
+        list: The result of <task> for each song directory.
+    """
+    song_keys = get_song_keys(song_dirs, build_config)
+    return process_in_parallel(
+        task, [(song_dir,) for song_dir in song_dirs], song_keys, build_name
+    )
+
+
+def process_in_parallel(
+    task, task_args: list[tuple], cache_keys: list[str], build_name: str
+) -> list:
+    """
+    Runs task(*args) for every entry of <task_args> in a process pool, and caches every
+    result in PREPROCESSING_CACHE_DIR under its cache key. Only entries without a cached
+    result are processed. Results are returned in the order of <task_args>.
+
+    Args:
+    ----------
+        task (callable): Picklable function returning the processed data of one entry.
+        task_args (list[tuple]): The arguments of every task.
+        cache_keys (list[str]): The cache key of every task, unique per task.
+        build_name (str): Name of the build, used for the cache directory and the printouts.
+
+    Returns:
+    ----------
+        list: The result of <task> for each entry of <task_args>.
+    """
+    cache_dir = os.path.join(PREPROCESSING_CACHE_DIR, build_name)
+
+    results = {}
+    remaining = []
+    for args, cache_key in zip(task_args, cache_keys):
+        cache_path = os.path.join(cache_dir, cache_key + ".pkl")
+        if os.path.isfile(cache_path):
+            with open(cache_path, "rb") as file:
+                results[cache_key] = pickle.load(file)
+        else:
+            remaining.append((args, cache_key, cache_path))
+
+    print(f"{build_name}: {len(results)} cached, {len(remaining)} to process")
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=NUM_WORKERS_PREPROCESSING) as executor:
+        futures = {
+            executor.submit(task, *args): (cache_key, cache_path)
+            for args, cache_key, cache_path in remaining
+        }
+        for num_done, future in enumerate(as_completed(futures), start=1):
+            cache_key, cache_path = futures[future]
+            results[cache_key] = future.result()
+            save_pickle_atomic(cache_path, results[cache_key])
+
+            if num_done % 25 == 0 or num_done == len(remaining):
+                items_per_second = num_done / (time.time() - start)
+                print(
+                    f"{build_name}: processed {num_done}/{len(remaining)} "
+                    f"({items_per_second:.1f}/s)"
+                )
+
+    return [results[cache_key] for cache_key in cache_keys]
+
+
+def get_song_keys(song_dirs: list[str], build_config: tuple) -> list[str]:
+    """
+    Computes the cache key of each song directory: a hash of <build_config> and the
+    names and content of the files in the directory.
+    """
+    config_hash = hashlib.sha256(repr(build_config).encode())
+    song_keys = []
+    for song_dir in song_dirs:
+        hasher = config_hash.copy()
+        for file_name in sorted(os.listdir(song_dir)):
+            path = os.path.join(song_dir, file_name)
+            if file_name == ".DS_Store" or not os.path.isfile(path):
+                continue
+            hasher.update(file_name.encode())
+            with open(path, "rb") as file:
+                hasher.update(file.read())
+        song_keys.append(hasher.hexdigest())
+    return song_keys
+
+
+def get_build_key(*parts) -> str:
+    """
+    Hashes the code versions, config values and song keys a dataset was built from.
+    """
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def is_build_current(name: str, build_key: str, paths: list[str]) -> bool:
+    """
+    Returns True if all <paths> exist and the manifest says they were built with <build_key>.
+    """
+    manifest = read_manifest()
+    return manifest.get(name) == build_key and all(
+        os.path.exists(path) for path in paths
+    )
+
+
+def read_manifest() -> dict:
+    """
+    Reads the manifest with the build key of each dataset, or an empty dict if there is none.
+    """
+    if not os.path.isfile(DATASET_MANIFEST_PATH):
+        return {}
+    with open(DATASET_MANIFEST_PATH, "r") as file:
+        return json.load(file)
+
+
+def write_manifest(name: str, build_key: str) -> None:
+    """
+    Records that the dataset <name> was built with <build_key>.
+    """
+    manifest = read_manifest()
+    manifest[name] = build_key
+    os.makedirs(os.path.dirname(DATASET_MANIFEST_PATH), exist_ok=True)
+    with open(DATASET_MANIFEST_PATH, "w") as file:
+        json.dump(manifest, file, indent=4)
+
+
+def save_pickle_atomic(path: str, data) -> None:
+    """
+    Pickles <data> to <path> through a temporary file, so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        pickle.dump(data, file)
+    os.replace(tmp_path, path)
 
 
 def split_indices(indices, train_ratio=0.9, val_ratio=0.1):
@@ -176,4 +358,4 @@ def split_indices(indices, train_ratio=0.9, val_ratio=0.1):
 
     train_indices = indices[:train_end]
     val_indices = indices[train_end:val_end]
-    return train_indices, val_indices
\ No newline at end of file
+    return train_indices, val_indices
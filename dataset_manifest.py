@@ -0,0 +1,3 @@
+# The manifest of the built datasets, in a module of its own without torch, so main.py can
+# check which datasets are built without importing config.
+DATASET_MANIFEST_PATH = "data/dataset/manifest.json"  # Build key of each dataset
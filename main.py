@@ -1,14 +1,16 @@
 print("----loading imports----")
-import matplotlib.pyplot as plt
 import webbrowser
 import argparse
+import json
+import time
 import os
 
+# The agents, datasets and evaluation import torch and more, so they are imported when
+# used. The manifest path comes from dataset_manifest, as config imports torch too.
+from dataset_manifest import DATASET_MANIFEST_PATH
 
-from broadcaster.midi_app import start_broadcaster
-from agents import create_agents
-from utils import get_datasets
-from agents import eval_all_agents
+# Manifest entries of the primer datasets
+SERVING_DATASETS = ["melody", "bass_and_chord"]
 
 
 parser = argparse.ArgumentParser(description="Choose how to run the program")
@@ -69,6 +71,43 @@ parser.add_argument(
     help="evaluate the agents",
     default=False,
 )
+parser.add_argument(
+    "-s",
+    "--serve",
+    action="store_true",
+    help="Only serve, the server starts first and the models load in the background",
+    default=False,
+)
+
+
+def are_serving_datasets_built() -> bool:
+    """
+    Returns True if the manifest has an entry for every dataset serving needs. The songs
+    are not hashed again, so a dataset is trusted to be current once it is built.
+    """
+    if not os.path.isfile(DATASET_MANIFEST_PATH):
+        return False
+    with open(DATASET_MANIFEST_PATH, "r") as file:
+        manifest = json.load(file)
+    return all(name in manifest for name in SERVING_DATASETS)
+
+
+def serve():
+    """
+    Starts the broadcaster without training or evaluating, importing only the server.
+    The generation process builds the datasets if the manifest has none, and loads the
+    models, while the server already answers. /ready tells when the models are loaded.
+    """
+    from broadcaster.midi_app import start_broadcaster
+
+    start_broadcaster(build_datasets=not are_serving_datasets_built())
+    webbrowser.open("file://" + os.path.realpath("index.html"))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Exiting...")
 
 
 def main():
@@ -88,6 +127,15 @@ def main():
     None
     """
     args = parser.parse_args()
+    if args.serve:
+        serve()
+        return
+
+    import matplotlib.pyplot as plt
+    from broadcaster.midi_app import start_broadcaster
+    from agents import create_agents, eval_all_agents
+    from utils import get_datasets
+
     train_bass: bool = parser.parse_args().train_bass
     train_chord: bool = parser.parse_args().train_chord
     train_chord_non_coop: bool = parser.parse_args().train_chord_noncoop
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from statsmodels.stats.multitest import multipletests
+
+# Resamples drawn per task. The chunks and their seeds do not depend on the number of
+# workers, so the results are the same no matter how many processes are used.
+RESAMPLE_CHUNK_SIZE = 1000
+
+
+def compare_groups(
+    group1,
+    group2,
+    paired: bool = True,
+    num_resamples: int = 10000,
+    confidence: float = 0.95,
+    correction: str = "bonferroni",
+    seed: int = 0,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Compares the mean of every metric of two groups with a bootstrap confidence interval
+    of the difference and a permutation test, for all metrics at once.
+
+    Every resample is a row of a count matrix (how often each sample is drawn, or the sign
+    or group each sample gets), so the resampled means of all metrics are one matrix
+    product per chunk of resamples instead of a loop over resamples and metrics.
+
+    Args:
+    ----------
+        group1: The first group, a dict of metric name to per-sample values or a
+            DataFrame with a column per metric.
+        group2: The second group, with the same metrics.
+        paired (bool): Whether sample i of both groups belongs together. Paired groups are
+            resampled together and permuted by flipping the sign of the differences,
+            otherwise the samples are resampled per group and permuted between groups.
+        num_resamples (int): Number of bootstrap resamples and of permutations.
+        confidence (float): Confidence level of the intervals.
+        correction (str): Multiple-comparison correction over the metrics, any method of
+            statsmodels' multipletests, e.g. "bonferroni", "holm" or "fdr_bh".
+        seed (int): Seed of the resamples.
+        workers (int): Processes used when there is more than one chunk of resamples.
+
+    Returns:
+    ----------
+        pd.DataFrame: Per metric, the means, the difference, its confidence interval, and
+            the permutation p-value before and after correction.
+    """
+    metrics, samples1 = get_sample_matrix(group1)
+    metrics2, samples2 = get_sample_matrix(group2)
+    if metrics != metrics2:
+        raise ValueError(f"The groups have different metrics: {metrics} and {metrics2}")
+    if paired and len(samples1) != len(samples2):
+        raise ValueError(
+            f"Paired groups need the same number of samples, got {len(samples1)} and {len(samples2)}"
+        )
+
+    if paired:
+        differences = samples1 - samples2
+        observed = differences.mean(axis=0)
+        task_data = (differences,)
+    else:
+        observed = samples1.mean(axis=0) - samples2.mean(axis=0)
+        task_data = (samples1, samples2)
+
+    bootstrap, permutation = run_resamples(
+        paired, task_data, num_resamples, seed, workers
+    )
+
+    alpha = 1 - confidence
+    ci_low, ci_high = np.quantile(bootstrap, [alpha / 2, 1 - alpha / 2], axis=0)
+    # The observed split counts as one of the permutations, so p is never 0
+    extreme = (np.abs(permutation) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (extreme + 1) / (num_resamples + 1)
+    reject, p_adjusted, _, _ = multipletests(p_values, alpha=alpha, method=correction)
+
+    return pd.DataFrame(
+        {
+            "Metric": metrics,
+            "Mean 1": samples1.mean(axis=0),
+            "Mean 2": samples2.mean(axis=0),
+            "Difference": observed,
+            "CI Low": ci_low,
+            "CI High": ci_high,
+            "P-Value": p_values,
+            "Adjusted P-Value": p_adjusted,
+            "Significant": reject,
+        }
+    )
+
+
+def get_sample_matrix(group) -> tuple[list[str], np.ndarray]:
+    """
+    Stacks the metrics of a group into a (samples, metrics) float matrix.
+    """
+    if isinstance(group, pd.DataFrame):
+        return list(group.columns), group.to_numpy(dtype=np.float64)
+
+    metrics = list(group)
+    columns = [
+        np.asarray(group[metric], dtype=np.float64).ravel() for metric in metrics
+    ]
+    if len({len(column) for column in columns}) > 1:
+        raise ValueError("All metrics of a group need the same number of samples")
+    return metrics, np.stack(columns, axis=1)
+
+
+def run_resamples(
+    paired: bool, task_data: tuple, num_resamples: int, seed: int, workers: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Splits the resamples in chunks, each with its own seed, and runs them in a process
+    pool if there is more than one chunk and worker.
+
+    Returns:
+    ----------
+        tuple[np.ndarray, np.ndarray]: The bootstrap and permutation mean differences,
+            each of shape (num_resamples, metrics).
+    """
+    chunk_sizes = [
+        min(RESAMPLE_CHUNK_SIZE, num_resamples - start)
+        for start in range(0, num_resamples, RESAMPLE_CHUNK_SIZE)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    task = resample_paired if paired else resample_unpaired
+    args = [
+        (*task_data, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)
+    ]
+
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as executor:
+            chunks = list(executor.map(task, *zip(*args)))
+    else:
+        chunks = [task(*task_args) for task_args in args]
+
+    bootstrap = np.concatenate([chunk[0] for chunk in chunks])
+    permutation = np.concatenate([chunk[1] for chunk in chunks])
+    return bootstrap, permutation
+
+
+def resample_paired(
+    differences: np.ndarray, num_resamples: int, seed: np.random.SeedSequence
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bootstraps the mean of the paired differences and permutes them by random sign flips.
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = len(differences)
+
+    counts = rng.multinomial(
+        num_samples, np.full(num_samples, 1 / num_samples), size=num_resamples
+    )
+    bootstrap = counts @ differences / num_samples
+
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(num_resamples, num_samples))
+    permutation = signs @ differences / num_samples
+    return bootstrap, permutation
+
+
+def resample_unpaired(
+    samples1: np.ndarray,
+    samples2: np.ndarray,
+    num_resamples: int,
+    seed: np.random.SeedSequence,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bootstraps the difference of the means of two independent groups, and permutes the
+    samples between the groups.
+    """
+    rng = np.random.default_rng(seed)
+    num1, num2 = len(samples1), len(samples2)
+
+    counts1 = rng.multinomial(num1, np.full(num1, 1 / num1), size=num_resamples)
+    counts2 = rng.multinomial(num2, np.full(num2, 1 / num2), size=num_resamples)
+    bootstrap = counts1 @ samples1 / num1 - counts2 @ samples2 / num2
+
+    # Every row puts a random num1 of the pooled samples in the first group
+    pooled = np.concatenate([samples1, samples2])
+    ranks = rng.random((num_resamples, num1 + num2)).argsort(axis=1).argsort(axis=1)
+    in_group1 = (ranks < num1).astype(np.float64)
+    permutation = in_group1 @ pooled / num1 - (1 - in_group1) @ pooled / num2
+    return bootstrap, permutation
@@ -0,0 +1,82 @@
+# Measures how long a drum example takes to process and a generated drum loop to detokenize.
+# Run from the repository root: python -m script.benchmark_drum_codec --requests 1000
+import argparse
+import time
+import numpy as np
+
+from agents.drum.utils import tokens_to_note_sequence
+from data_processing import get_drum_dataset, load_yaml
+from data_processing.drum_processing import download_midi, process_drum_example
+
+from config import DRUM_MAPPING
+
+parser = argparse.ArgumentParser(description="Benchmark drum tokenization")
+parser.add_argument(
+    "--sequences",
+    type=int,
+    help="Training examples to process, all if not set",
+    default=None,
+)
+parser.add_argument("--requests", type=int, help="Loops to detokenize", default=1000)
+parser.add_argument("--tokens", type=int, help="Tokens per generated loop", default=128)
+
+
+def benchmark_tokenize(drum_dataset, num_sequences: int) -> None:
+    """
+    Processes training examples one after the other, the per-example work of building the
+    dataset: parsing, stretching, quantizing and tokenizing. Downloading is not timed.
+    """
+    conf: dict = load_yaml("config/bumblebeat/params.yaml")
+    dataset = download_midi(conf["data"]["dataset"], "train")
+    midis = [features["midi"] for features in dataset][:num_sequences]
+
+    start = time.perf_counter()
+    num_tokens = sum(
+        len(tokens)
+        for midi in midis
+        for tokens, _ in process_drum_example(
+            midi, drum_dataset.codec, conf["processing"], 0
+        )
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"Process: {len(midis)} examples, {num_tokens} tokens in {elapsed:.2f}s "
+        f"({len(midis) / elapsed:.1f} examples/s on one process)"
+    )
+
+
+def benchmark_detokenize(drum_dataset, num_requests: int, num_tokens: int) -> None:
+    """
+    Detokenizes loops of num_tokens tokens cut from the training stream, like a generated
+    loop of play_drum_from_style.
+    """
+    stream = drum_dataset.train_beat.numpy()
+    starts = np.random.default_rng(0).integers(
+        0, len(stream) - num_tokens, num_requests
+    )
+    pitch_classes = DRUM_MAPPING["SIMPLIFIED_PITCHES"]
+
+    latencies = []
+    for loop_start in starts:
+        tokens = stream[loop_start : loop_start + num_tokens].tolist()
+        start = time.perf_counter()
+        tokens_to_note_sequence(tokens, drum_dataset.codec, pitch_classes, 60)
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies) * 1000
+    print(
+        f"Detokenize: {num_requests} loops of {num_tokens} tokens, "
+        f"mean {latencies.mean():.3f} ms, p50 {np.percentile(latencies, 50):.3f} ms, "
+        f"p95 {np.percentile(latencies, 95):.3f} ms"
+    )
+
+
+def main():
+    args = parser.parse_args()
+    drum_dataset = get_drum_dataset()
+    benchmark_tokenize(drum_dataset, args.sequences)
+    benchmark_detokenize(drum_dataset, args.requests, args.tokens)
+
+
+if __name__ == "__main__":
+    main()
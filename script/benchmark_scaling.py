@@ -0,0 +1,95 @@
+# Measures how training the bass agent scales with the number of data-parallel processes.
+# Run from the repository root: python -m script.benchmark_scaling --ranks 1 2 4 8
+import argparse
+import copy
+import time
+import torch
+import torch.distributed as dist
+
+from agents.create_agents import create_bass_agent
+from agents.bass.train_bass import get_loss
+from agents.distributed import launch, wrap_model, get_world_size, is_distributed
+from agents.training_data import create_dataloader, to_device
+from agents.mixed_precision import create_optimizer
+
+from config import BATCH_SIZE_BASS, LEARNING_RATE_BASS, TRAIN_DATASET_PATH_BASS, DEVICE
+
+parser = argparse.ArgumentParser(description="Benchmark distributed training")
+parser.add_argument(
+    "--ranks",
+    type=int,
+    nargs="+",
+    help="Numbers of processes to benchmark",
+    default=[1, 2, 4, 8],
+)
+parser.add_argument(
+    "--batches",
+    type=int,
+    help="Batches trained on by each process, after one warm-up batch",
+    default=50,
+)
+
+
+def benchmark_rank(model, dataset, num_batches: int) -> float:
+    """
+    Trains the model on num_batches batches of this rank.
+
+    Returns:
+    ----------
+        float: The number of samples trained on per second, over all ranks.
+    """
+    train_model = wrap_model(model)
+    optimizer = create_optimizer(
+        torch.optim.Adam, model.parameters(), lr=LEARNING_RATE_BASS
+    )
+    dataloader = create_dataloader(dataset, BATCH_SIZE_BASS)
+
+    batches = iter(dataloader)
+    elapsed = 0.0
+    # The first batch warms up the loader workers and the process group
+    for batch_idx in range(num_batches + 1):
+        batch = next(batches, None)
+        if batch is None:
+            batches = iter(dataloader)
+            batch = next(batches)
+        if is_distributed():
+            dist.barrier()
+        start = time.perf_counter()
+
+        optimizer.zero_grad()
+        loss = get_loss(train_model, to_device(batch))
+        loss.backward()
+        optimizer.step()
+
+        if batch_idx > 0:
+            elapsed += time.perf_counter() - start
+
+    return num_batches * BATCH_SIZE_BASS * get_world_size() / elapsed
+
+
+def main():
+    args = parser.parse_args()
+
+    model = create_bass_agent().to(DEVICE)
+    dataset = torch.load(TRAIN_DATASET_PATH_BASS)
+
+    results = []
+    for world_size in args.ranks:
+        samples_per_second = launch(
+            benchmark_rank, world_size, copy.deepcopy(model), dataset, args.batches
+        )
+        results.append((world_size, samples_per_second))
+        print(f"{world_size} processes: {samples_per_second:.1f} samples/s")
+
+    # Scaling efficiency against the first entry, per process
+    base = results[0][1] / results[0][0]
+    print(f"{'Processes':>9} {'Samples/s':>10} {'Speedup':>8} {'Efficiency':>10}")
+    for world_size, samples_per_second in results:
+        speedup = samples_per_second / base
+        print(
+            f"{world_size:>9} {samples_per_second:>10.1f} {speedup:>8.2f} {speedup / world_size:>10.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
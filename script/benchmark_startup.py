@@ -0,0 +1,86 @@
+# Measures how long the imports of main.py take, with python -X importtime.
+# Run from the repository root: python -m script.benchmark_startup --runs 5
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+# A line of -X importtime: self and cumulative microseconds, and the indented module name
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Heavy packages main.py should not import at startup
+LAZY_PACKAGES = ["tensorflow", "tensorflow_datasets"]
+
+parser = argparse.ArgumentParser(description="Benchmark the imports of main.py")
+parser.add_argument(
+    "--runs",
+    type=int,
+    help="Times main.py is imported, each in a new process",
+    default=5,
+)
+parser.add_argument(
+    "--top", type=int, help="Number of slowest direct imports to print", default=15
+)
+
+
+def get_import_times(module: str) -> tuple[dict[str, int], list[tuple[int, str]]]:
+    """
+    Imports <module> in a new Python process with -X importtime.
+
+    Returns:
+    ----------
+        tuple[dict[str, int], list[tuple[int, str]]]: The cumulative import time in
+            microseconds of every imported module, keyed by its name, and the time and name
+            of every module <module> imports directly.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr}")
+
+    times = {}
+    children, module_children = [], []
+    # A module is printed after the modules it imports, one indent level deeper
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        times[name] = int(cumulative)
+        level = (len(indent) - 1) // 2
+        if level == 0:
+            if name == module:
+                module_children = children
+            children = []
+        elif level == 1:
+            children.append((int(cumulative), name))
+    return times, module_children
+
+
+def main():
+    args = parser.parse_args()
+    runs = [get_import_times("main") for _ in range(args.runs)]
+
+    totals = [times["main"] / 1e6 for times, _ in runs]
+    print(
+        f"import main: median {statistics.median(totals):.2f}s, "
+        f"min {min(totals):.2f}s, max {max(totals):.2f}s over {args.runs} runs"
+    )
+
+    # The first run may include cold caches, the last one is used for the breakdown
+    times, children = runs[-1]
+    print(f"{'Seconds':>8}  Import of main.py")
+    for time, name in sorted(children, reverse=True)[: args.top]:
+        print(f"{time / 1e6:>8.3f}  {name}")
+
+    for package in LAZY_PACKAGES:
+        state = "imported" if package in times else "not imported"
+        print(f"{package}: {state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+# Hyperparameter sweep over the config of an agent, with the trials trained in parallel.
+# Run from the repository root: python -m script.sweep melody config/sweeps/melody.json
+#
+# The search space is a JSON object mapping config constants to the values to try, e.g.
+# {"LEARNING_RATE_MELODY": [0.0001, 0.0005], "HIDDEN_SIZE_LSTM_MELODY": [128, 256]}.
+# Every trial runs in a new process that sets its values in config before the agents are
+# imported, so the modules importing the constants see the values of the trial.
+# Constants that other constants are derived from, the derived ones and the ones fixed by
+# the built datasets cannot be swept.
+import os
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import statistics
+import traceback
+import multiprocessing as mp
+
+import torch
+
+import config
+from config import SEED, DEVICE
+
+AGENTS = ["bass", "chord", "chord_non_coop", "chord_bass", "melody", "melody_non_coop"]
+
+# Config constants other constants are computed from when config is imported, and those
+# computed constants. Setting one in a trial would leave the others at their old values.
+# The constants fixed by the built datasets are included, a trial trains on the datasets
+# as they were built.
+DERIVED_CONSTANTS = {
+    "SEQUENCE_LENGHT_MELODY",
+    "SEQUENCE_LENGTH_CHORD",
+    "SEQUENCE_LENGTH_BASS",
+    "ACCUMULATED_TIME_SIZE_MELODY",
+    "TOTAL_INPUT_SIZE_MELODY",
+    "PITCH_VECTOR_SIZE",
+    "PITCH_SIZE_MELODY",
+    "DURATION_SIZE_MELODY",
+    "TIME_LEFT_ON_CHORD_SIZE_MELODY",
+    "CHORD_SIZE_MELODY",
+    "INPUT_SIZE_MELODY",
+    "INPUT_SIZE_MELODY_NC",
+    "ROOT_VOCAB_SIZE_CHORD",
+    "CHORD_VOCAB_SIZE_CHORD",
+    "TOTAL_CHORD_INPUT_SIZE",
+    "NOTE_TO_INT",
+    "INT_TO_NOTE",
+    "CHORD_TO_INT",
+    "INT_TO_CHORD",
+    "VERSION",
+    "MODEL_PATH_DRUM",
+}
+
+parser = argparse.ArgumentParser(description="Run a hyperparameter sweep for an agent")
+parser.add_argument("agent", choices=AGENTS, help="The agent to train")
+parser.add_argument(
+    "space", help="JSON file with the values to try per config constant"
+)
+parser.add_argument(
+    "--trials",
+    type=int,
+    help="Number of combinations to sample from the space, all combinations if not set",
+    default=None,
+)
+parser.add_argument(
+    "--workers", type=int, help="Trials trained at the same time", default=2
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    help="Torch threads per trial, defaults to the cores divided by the workers",
+    default=None,
+)
+parser.add_argument(
+    "--warmup-epochs",
+    type=int,
+    help="Epochs every trial trains before it can be pruned",
+    default=3,
+)
+parser.add_argument(
+    "--min-trials",
+    type=int,
+    help="Trials that need to have reached an epoch before trials are pruned at it",
+    default=3,
+)
+parser.add_argument(
+    "--output", help="CSV file of the results", default="results/sweeps/{agent}.csv"
+)
+
+
+class Median_Pruner:
+    """
+    Stops a trial when its validation loss is worse than the median of the other trials at
+    the same epoch. The validation losses of all trials are shared through a manager dict.
+    """
+
+    def __init__(self, history, trial: int, warmup_epochs: int, min_trials: int):
+        self.history = history
+        self.trial: int = trial
+        self.warmup_epochs: int = warmup_epochs
+        self.min_trials: int = min_trials
+        self.pruned: bool = False
+
+    def __call__(self, val_loss_list: list[float]) -> bool:
+        """
+        Args:
+        ----------
+            val_loss_list (list[float]): The validation losses of the trial so far, one per epoch.
+
+        Returns:
+        ----------
+            bool: True if the trial should stop.
+        """
+        self.history[self.trial] = list(val_loss_list)
+        epoch = len(val_loss_list) - 1
+        if epoch < self.warmup_epochs:
+            return False
+
+        other_losses = [
+            losses[epoch]
+            for trial, losses in self.history.items()
+            if trial != self.trial and len(losses) > epoch
+        ]
+        if len(other_losses) < self.min_trials:
+            return False
+
+        self.pruned = val_loss_list[-1] > statistics.median(other_losses)
+        return self.pruned
+
+
+def get_trials(space: dict, num_trials: int = None) -> list[dict]:
+    """
+    Args:
+    ----------
+        space (dict): The values to try per config constant.
+        num_trials (int): Number of combinations to sample, all combinations if None.
+
+    Returns:
+    ----------
+        list[dict]: The values of the config constants of every trial.
+    """
+    unknown = [name for name in space if not hasattr(config, name)]
+    if unknown:
+        raise ValueError(f"Unknown config constants: {', '.join(unknown)}")
+    derived = [name for name in space if name in DERIVED_CONSTANTS]
+    if derived:
+        raise ValueError(
+            f"Config constants that are derived, derived from or fixed by the built datasets cannot be swept: {', '.join(derived)}"
+        )
+
+    names = list(space)
+    trials = [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+    if num_trials is not None and num_trials < len(trials):
+        trials = random.Random(SEED).sample(trials, num_trials)
+    return trials
+
+
+def run_sweep(
+    agent: str,
+    trials: list[dict],
+    workers: int,
+    threads: int,
+    warmup_epochs: int,
+    min_trials: int,
+    output_path: str,
+) -> list[dict]:
+    """
+    Trains the trials in parallel worker processes and writes a row per trial to output_path,
+    sorted by the best validation loss.
+
+    Returns:
+    ----------
+        list[dict]: The results of the trials.
+    """
+    checkpoint_dir = os.path.join(os.path.dirname(output_path), "checkpoints_" + agent)
+    results = []
+    context = mp.get_context("spawn")
+    with context.Manager() as manager:
+        history = manager.dict()
+        # A new process per trial, so each trial imports the agents with its own config
+        with context.Pool(
+            workers,
+            initializer=init_worker,
+            initargs=(threads,),
+            maxtasksperchild=1,
+        ) as pool:
+            trial_args = [
+                (
+                    agent,
+                    trial,
+                    values,
+                    history,
+                    warmup_epochs,
+                    min_trials,
+                    checkpoint_dir,
+                )
+                for trial, values in enumerate(trials)
+            ]
+            for result in pool.imap_unordered(run_trial_args, trial_args):
+                results.append(result)
+                print(
+                    f"Trial {result['trial']} {result['state']}: best validation loss {result['best_val_loss']}"
+                )
+
+    results.sort(key=lambda result: result["best_val_loss"])
+    save_results(results, list(trials[0]) if trials else [], output_path)
+    return results
+
+
+def init_worker(threads: int) -> None:
+    torch.set_num_threads(threads)
+
+
+def run_trial_args(args: tuple) -> dict:
+    return run_trial(*args)
+
+
+def run_trial(
+    agent: str,
+    trial: int,
+    values: dict,
+    history,
+    warmup_epochs: int,
+    min_trials: int,
+    checkpoint_dir: str,
+) -> dict:
+    """
+    Trains one trial in a worker process. Only the losses are kept, the trained model is not saved.
+
+    Returns:
+    ----------
+        dict: The values of the trial, its state (complete, pruned or failed), the number of
+            epochs trained, the best validation loss and the training time.
+    """
+    for name, value in values.items():
+        setattr(config, name, value)
+    # One process per trial, already in parallel, and a loader worker would exceed the thread budget
+    config.NUM_TRAINING_PROCESSES = 1
+    config.NUM_WORKERS_TRAINING = 0
+
+    result = {"trial": trial, **values}
+    start = time.perf_counter()
+    try:
+        trainer = create_trainer(agent)
+        trainer.checkpoint_path = os.path.join(
+            checkpoint_dir, f"trial_{get_trial_key(values)}.pt"
+        )
+        trainer.snapshot_frequency = None
+        pruner = Median_Pruner(history, trial, warmup_epochs, min_trials)
+        trainer.epoch_callback = pruner
+
+        _, val_loss_list = trainer.fit()
+        result["state"] = "pruned" if pruner.pruned else "complete"
+        result["epochs"] = len(val_loss_list)
+        result["best_val_loss"] = min(val_loss_list)
+    except Exception:
+        traceback.print_exc()
+        result["state"] = "failed"
+        result["epochs"] = 0
+        result["best_val_loss"] = float("inf")
+    result["seconds"] = round(time.perf_counter() - start, 1)
+    return result
+
+
+def get_trial_key(values: dict) -> str:
+    """
+    Hashes the values of a trial, so a trial only resumes the checkpoint of a trial with the same values.
+    """
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def create_trainer(agent: str):
+    """
+    Creates the model and Trainer of an agent, like create_agents does for training.
+    """
+    # Imported here, after the config of the trial is set
+    from agents.create_agents import (
+        create_bass_agent,
+        create_chord_agent,
+        create_melody_agent,
+    )
+    from agents.bass import create_bass_trainer
+    from agents.chord import create_chord_trainer
+    from agents.melody import create_melody_trainer
+
+    if agent == "bass":
+        return create_bass_trainer(create_bass_agent().to(DEVICE))
+    if agent.startswith("chord"):
+        model = create_chord_agent(
+            agent == "chord", agent == "chord_non_coop", agent == "chord_bass"
+        )
+        return create_chord_trainer(model.to(DEVICE))
+    model = create_melody_agent(agent == "melody", agent == "melody_non_coop")
+    return create_melody_trainer(model.to(DEVICE))
+
+
+def save_results(results: list[dict], names: list[str], output_path: str) -> None:
+    """
+    Writes the results as CSV and prints them as a table.
+    """
+    columns = ["trial", *names, "state", "epochs", "best_val_loss", "seconds"]
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+    print(" ".join(f"{column:>14}" for column in columns))
+    for result in results:
+        print(" ".join(f"{str(result[column]):>14}" for column in columns))
+    print(f"Results saved to {output_path}")
+
+
+def main():
+    args = parser.parse_args()
+    with open(args.space) as file:
+        space = json.load(file)
+
+    trials = get_trials(space, args.trials)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    print(
+        f"Sweeping {len(trials)} trials of the {args.agent} agent, {args.workers} at a time with {threads} threads each"
+    )
+    run_sweep(
+        args.agent,
+        trials,
+        args.workers,
+        threads,
+        args.warmup_epochs,
+        args.min_trials,
+        args.output.format(agent=args.agent),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,146 +1,272 @@
-# converts all midi files in the current folder
-import music21
-import mido
+# Transposes every POP909 song in 4/4 to C major or A minor, per key region of key_audio.txt.
+# Run from the repository root: python -m script.transpose
+#
+# For each song <song>/<song>.mid is written to <output>/<song>/C_<song>.mid, with the
+# transposed chord_audio.txt and a copy of beat_audio.txt next to it. Songs whose outputs
+# are newer than their inputs are skipped, so re-running only processes new or changed songs.
 import os
+import time
 import shutil
-import pretty_midi
-
-from transpose_chord import transpose_chord
-
-
-def get_key(path):
-    key = []
-    key_timing = []
-    # Check if key_audio.txt exists
-    with open(path, "r") as file:
-        for line in file:
-            components = line.split()
-            # Extract the key (string after the two numbers)
-            key.append(components[2])
-            key_timing.append((components[0], components[1]))
-    return key, key_timing
-
-
-def check_time_signature(midi_file):
-    pm = pretty_midi.PrettyMIDI(midi_file)
-
-    for time_signature in pm.time_signature_changes:
-        numerator = time_signature.numerator
-        denominator = time_signature.denominator
-
-        if not (
-            (numerator == 4 and denominator == 4)
-            or (numerator == 1 and denominator == 4)
-        ):
-            return False  # Found a time signature that is not 4/4 or 1/4
-
-    return True  # All time signatures are either 4/4 or 1/4
-
-
-def transpose_to_c_major(midi_file):
-    majors = dict(
-        [
-            ("A-", 4),
-            ("A", 3),
-            ("A#", 2),
-            ("B-", 2),
-            ("B", 1),
-            ("C", 0),
-            ("C#", -1),
-            ("D-", -1),
-            ("D", -2),
-            ("D#", -3),
-            ("E-", -3),
-            ("E", -4),
-            ("F", -5),
-            ("F#", 6),
-            ("G-", 6),
-            ("G", 5),
-            ("G#", 4),
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import mido
+import numpy as np
+
+from script.transpose_chord import (
+    get_transposed_chords,
+    get_key_segments,
+    get_segments,
+    flat_to_sharp_key,
+)
+
+NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Tempo of a MIDI file until its first set_tempo message, in microseconds per beat
+DEFAULT_TEMPO = 500000
+
+# Time signatures (numerator, denominator) a song may contain
+TIME_SIGNATURES = {(4, 4), (1, 4)}
+
+parser = argparse.ArgumentParser(description="Transpose POP909 to C major / A minor")
+parser.add_argument("--input", help="The POP909 directory", default="data/POP909")
+parser.add_argument(
+    "--output",
+    help="Directory of the transposed songs",
+    default="data/POP909/transposed",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="Songs transposed at the same time",
+    default=os.cpu_count(),
+)
+parser.add_argument(
+    "--force", action="store_true", help="Transpose songs that are up to date too"
+)
+
+
+def check_time_signature(mid: mido.MidiFile) -> bool:
+    """
+    Returns True if all time signatures of the song are 4/4 or 1/4.
+    """
+    for track in mid.tracks:
+        for msg in track:
+            if (
+                msg.type == "time_signature"
+                and (msg.numerator, msg.denominator) not in TIME_SIGNATURES
+            ):
+                return False
+    return True
+
+
+def get_half_steps(key: str) -> int:
+    """
+    Returns the half steps from a key of key_audio.txt, e.g. "Eb:min", to C major or
+    A minor, between -5 and 6.
+    """
+    root, mode = flat_to_sharp_key(key).split(":")
+    if mode == "maj":
+        target = "C"
+    elif mode == "min":
+        target = "A"
+    else:
+        raise ValueError(f"Unknown key mode {mode} in key {key}")
+    half_steps = (NOTES.index(target) - NOTES.index(root)) % 12
+    return half_steps - 12 if half_steps > 6 else half_steps
+
+
+def transpose_midi(
+    mid: mido.MidiFile, key_starts: np.ndarray, half_steps: np.ndarray
+) -> None:
+    """
+    Shifts every note by the half steps of the key region its note-on falls in. The
+    note-off of a note gets the shift of its note-on, also when the note crosses into
+    the next region.
+
+    Args:
+    ----------
+        mid (mido.MidiFile): The song, changed in place.
+        key_starts (np.ndarray): The start of each key region in seconds, sorted.
+        half_steps (np.ndarray): The half steps of each key region.
+    """
+    tempo_map = get_tempo_map(mid)
+    for track in mid.tracks:
+        note_indices = [
+            idx
+            for idx, msg in enumerate(track)
+            if msg.type == "note_on" or msg.type == "note_off"
         ]
+        if not note_indices:
+            continue
+
+        if len(half_steps) == 1:
+            shifts = np.full(len(note_indices), half_steps[0])
+        else:
+            ticks = np.cumsum([msg.time for msg in track])[note_indices]
+            seconds = ticks_to_seconds(ticks, *tempo_map, mid.ticks_per_beat)
+            shifts = half_steps[get_segments(key_starts, seconds)]
+
+        open_notes: dict[tuple[int, int], list[int]] = {}
+        for idx, shift in zip(note_indices, shifts.tolist()):
+            msg = track[idx]
+            note = (msg.channel, msg.note)
+            if msg.type == "note_on" and msg.velocity > 0:
+                open_notes.setdefault(note, []).append(shift)
+            elif open_notes.get(note):
+                shift = open_notes[note].pop(0)
+            msg.note += shift
+
+
+def get_tempo_map(mid: mido.MidiFile) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns the tick, time in seconds and tempo of every tempo change of the song,
+    starting with the default tempo at tick 0.
+    """
+    changes = sorted(
+        (tick, msg.tempo)
+        for track in mid.tracks
+        for tick, msg in zip(np.cumsum([msg.time for msg in track]).tolist(), track)
+        if msg.type == "set_tempo"
     )
-    minors = dict(
-        [
-            ("A-", 1),
-            ("A", 0),
-            ("A#", -1),
-            ("B-", -1),
-            ("B", -2),
-            ("C", -3),
-            ("C#", -4),
-            ("D-", -4),
-            ("D", -5),
-            ("D#", 6),
-            ("E-", 6),
-            ("E", 5),
-            ("F", 4),
-            ("F#", 3),
-            ("G-", 3),
-            ("G", 2),
-            ("G#", 1),
-        ]
+    tempo_ticks = np.array([0] + [tick for tick, _ in changes], dtype=np.int64)
+    tempos = np.array([DEFAULT_TEMPO] + [tempo for _, tempo in changes], np.float64)
+    seconds_per_tick = tempos / (1e6 * mid.ticks_per_beat)
+    tempo_seconds = np.concatenate(
+        [[0.0], np.cumsum(np.diff(tempo_ticks) * seconds_per_tick[:-1])]
     )
+    return tempo_ticks, tempo_seconds, tempos
 
-    key_path = midi_file[:-8] + "/key_audio.txt"
-    key, key_timing = get_key(key_path)
 
-    if check_time_signature(midi_file) == False:
-        return 0
+def ticks_to_seconds(
+    ticks: np.ndarray,
+    tempo_ticks: np.ndarray,
+    tempo_seconds: np.ndarray,
+    tempos: np.ndarray,
+    ticks_per_beat: int,
+) -> np.ndarray:
+    """
+    Converts absolute ticks to seconds with the tempo map of get_tempo_map.
+    """
+    change = np.searchsorted(tempo_ticks, ticks, side="right") - 1
+    return tempo_seconds[change] + (ticks - tempo_ticks[change]) * tempos[change] / (
+        1e6 * ticks_per_beat
+    )
 
-    if len(key) > 1:
-        return 1
 
-    mid = mido.MidiFile(midi_file)
+def get_song_paths(song_dir: str, output_dir: str) -> tuple[dict, dict]:
+    """
+    Returns the input and output files of a song, keyed by their role.
+    """
+    song = os.path.basename(song_dir)
+    inputs = {
+        "midi": os.path.join(song_dir, song + ".mid"),
+        "key": os.path.join(song_dir, "key_audio.txt"),
+        "chord": os.path.join(song_dir, "chord_audio.txt"),
+        "beat": os.path.join(song_dir, "beat_audio.txt"),
+    }
+    song_output_dir = os.path.join(output_dir, song)
+    outputs = {
+        "midi": os.path.join(song_output_dir, "C_" + song + ".mid"),
+        "chord": os.path.join(song_output_dir, "chord_audio.txt"),
+        "beat": os.path.join(song_output_dir, "beat_audio.txt"),
+    }
+    return inputs, outputs
 
-    for i in range(len(key)):
-        key_tonic_name = key[i][0]
-        key_mode = key[i][-3:]
-        start = float(key_timing[i][0])
-        end = float(key_timing[i][1])
 
-        if key_mode == "maj":
-            halfSteps = majors[key_tonic_name]
+def is_up_to_date(inputs: dict, outputs: dict) -> bool:
+    """
+    Returns True if all outputs exist and are newer than all inputs.
+    """
+    if not all(os.path.isfile(path) for path in outputs.values()):
+        return False
+    newest_input = max(os.path.getmtime(path) for path in inputs.values())
+    return min(os.path.getmtime(path) for path in outputs.values()) >= newest_input
 
-        elif key_mode == "min":
-            halfSteps = minors[key_tonic_name]
-        else:
-            print(key_mode)
-            exit()
 
-        # Load the MIDI file
+def transpose_song(song_dir: str, output_dir: str, force: bool = False) -> str:
+    """
+    Transposes the MIDI and chords of a song, per key region if the song changes key, and
+    copies its beats to output_dir. The MIDI file is parsed once, and every output is
+    written through a temporary file. The MIDI is written last, so an interrupted song is
+    not up to date and is transposed again.
 
-        for i, track in enumerate(mid.tracks):
-            for msg in track:
-                if msg.type == "note_on" or msg.type == "note_off":
-                    msg.note += halfSteps
+    Returns:
+    ----------
+        str: What was done with the song.
+    """
+    inputs, outputs = get_song_paths(song_dir, output_dir)
+    if not force and is_up_to_date(inputs, outputs):
+        return "up to date"
 
-    new_dir = f"data/POP909/transposed/{midi_file.split('/')[-1]}"
+    mid = mido.MidiFile(inputs["midi"])
+    if not check_time_signature(mid):
+        return "skipped, not in 4/4"
 
-    new_dir = new_dir[:-4]
-    if not os.path.exists(new_dir):
-        os.mkdir(new_dir)
-    mid.save(new_dir + f"/C_{midi_file.split('/')[-1]}")
+    key_starts, keys = get_key_segments(song_dir)
+    transpose_midi(mid, key_starts, np.array([get_half_steps(key) for key in keys]))
 
-    transpose_chord(midi_file[:-8])  # , start, end, key_tonic_name, key_mode)
-    move_beat(midi_file[:-8])
-    return 0
+    os.makedirs(os.path.dirname(outputs["midi"]), exist_ok=True)
+    write_atomic(outputs["chord"], "".join(get_transposed_chords(song_dir)))
+    copy_atomic(inputs["beat"], outputs["beat"])
+    tmp_path = outputs["midi"] + ".tmp"
+    with open(tmp_path, "wb") as file:
+        mid.save(file=file)
+    os.replace(tmp_path, outputs["midi"])
+    return "transposed" if len(keys) == 1 else "transposed, changes key"
 
 
-def move_beat(mid_dir):
-    from_path = mid_dir + "/beat_audio.txt"
-    to_path = f"data/POP909/transposed/{mid_dir.split('/')[-1]}"
+def write_atomic(path: str, text: str) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
 
-    shutil.copy(
-        mid_dir + "/beat_audio.txt", f"data/POP909/transposed/{mid_dir.split('/')[-1]}"
-    )
 
+def copy_atomic(source: str, path: str) -> None:
+    tmp_path = path + ".tmp"
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def get_song_dirs(input_dir: str, output_dir: str) -> list[str]:
+    """
+    Returns the song directories of POP909, the numbered directories with a MIDI file.
+    """
+    song_dirs = []
+    for directory in sorted(os.listdir(input_dir)):
+        song_dir = os.path.join(input_dir, directory)
+        if os.path.abspath(song_dir) == os.path.abspath(output_dir):
+            continue
+        if os.path.isfile(os.path.join(song_dir, directory + ".mid")):
+            song_dirs.append(song_dir)
+    return song_dirs
+
+
+def main():
+    args = parser.parse_args()
+    song_dirs = get_song_dirs(args.input, args.output)
+
+    counts: dict[str, int] = {}
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(transpose_song, song_dir, args.output, args.force): song_dir
+            for song_dir in song_dirs
+        }
+        for num_done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            counts[result] = counts.get(result, 0) + 1
+
+            if num_done % 100 == 0 or num_done == len(song_dirs):
+                print(
+                    f"Processed {num_done}/{len(song_dirs)} songs "
+                    f"({num_done / (time.time() - start):.1f} songs/s)"
+                )
+
+    for result, count in sorted(counts.items()):
+        print(f"{result}: {count}")
 
-total = 0
-for idx, directory in enumerate(os.listdir("data/POP909/")):
-    if ".DS_Store" in directory:
-        continue
-    for file in os.listdir(os.path.join("data/POP909/", directory)):
-        if ".mid" in file:
-            total += transpose_to_c_major(os.path.join("data/POP909/", directory, file))
 
-        # print("Working.. " + str(idx / 909 * 100) + "%", end="\r")
+if __name__ == "__main__":
+    main()
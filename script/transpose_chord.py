@@ -1,69 +1,101 @@
 import os
 import shutil
+import numpy as np
 
 
 def transpose_chord(directory):
-    for file in os.listdir(directory):
-        chords: list[tuple(str, str)] = []
-        all_chords: list[list[tuple(str, str)]] = []
-        chord_start_list: list[str] = []
-        chord_end_list: list[str] = []
-        if file == "chord_audio.txt":
-            key = get_key(directory, "key_audio.txt")
-            if len(key) > 1:
-                # root_dir = "/".join(directory.split("/")[:2])
-                # song_name = directory.split("/")[-1]
-                # dir_path = os.path.join(root_dir, "transposed", song_name)
-                # try:
-                #     shutil.rmtree(dir_path)
-                # except OSError as e:
-                #     print(e)
-                return
-
-            with open(os.path.join(directory, file), "r") as file:
-                for idx, line in enumerate(file):
-                    components = line.split()
-                    if components[2] == "N":
-                        continue
-                    chord_start = str(components[0])
-                    chord_end = str(components[1])
-
-                    chord_start_list.append(chord_start)
-                    chord_end_list.append(chord_end)
-
-                    root, version = components[2].split(":")
-
-                    chords.append((root, version))
-
-                chords = flat_to_sharp(chords)
-
-                key = flat_to_sharp_key(key[0])
-
-                if key[-1] == "j" and key != "C:maj":
-                    chords = transpose_chord_major(chords, key)
-
-                if key[-1] == "n" and key != "A:min":
-                    chords = transpose_chord_minor(chords, key)
-
-                all_notes = [
-                    [start, end, f"{chord[0]}:{chord[1]}"]
-                    for start, end, chord in zip(
-                        chord_start_list, chord_end_list, chords
-                    )
-                ]
-
-                # Specify the filename
-                root_dir = "/".join(directory.split("/")[:2])
-                song_name = directory.split("/")[-1]
-
-                filename = os.path.join(
-                    root_dir, "transposed", song_name, "chord_audio.txt"
-                )
-                if os.path.exists(os.path.join(root_dir, "transposed", song_name)):
-                    # Write to a file
-                    with open(filename, "w") as file:
-                        for note in all_notes:
-                            file.write(" ".join(note) + "\n")
+    if not os.path.isfile(os.path.join(directory, "chord_audio.txt")):
+        return
+    lines = get_transposed_chords(directory)
+
+    # Specify the filename
+    root_dir = "/".join(directory.split("/")[:2])
+    song_name = directory.split("/")[-1]
+
+    filename = os.path.join(root_dir, "transposed", song_name, "chord_audio.txt")
+    if os.path.exists(os.path.join(root_dir, "transposed", song_name)):
+        # Write to a file
+        with open(filename, "w") as file:
+            file.writelines(lines)
+
+
+def get_transposed_chords(directory):
+    """
+    Reads chord_audio.txt of a song and transposes the chords to C major or A minor. A
+    song that changes key is transposed per key region of key_audio.txt, each chord from
+    the key in effect where it starts.
+
+    Args:
+    ----------
+        directory (str): The directory of the song.
+
+    Returns:
+    ----------
+        list[str]: The lines of the transposed chord file.
+    """
+    key_starts, keys = get_key_segments(directory)
+
+    chords: list[tuple(str, str)] = []
+    chord_start_list: list[str] = []
+    chord_end_list: list[str] = []
+    with open(os.path.join(directory, "chord_audio.txt"), "r") as file:
+        for line in file:
+            components = line.split()
+            if components[2] == "N":
+                continue
+            chord_start_list.append(str(components[0]))
+            chord_end_list.append(str(components[1]))
+
+            root, version = components[2].split(":")
+            chords.append((root, version))
+
+    chords = flat_to_sharp(chords)
+    segments = get_segments(key_starts, np.array(chord_start_list, dtype=np.float64))
+
+    for segment, key in enumerate(keys):
+        indices = np.flatnonzero(segments == segment)
+        segment_chords = [chords[idx] for idx in indices]
+        key = flat_to_sharp_key(key)
+
+        if key[-1] == "j" and key != "C:maj":
+            segment_chords = transpose_chord_major(segment_chords, key)
+
+        if key[-1] == "n" and key != "A:min":
+            segment_chords = transpose_chord_minor(segment_chords, key)
+
+        for idx, chord in zip(indices, segment_chords):
+            chords[idx] = chord
+
+    return [
+        f"{start} {end} {chord[0]}:{chord[1]}\n"
+        for start, end, chord in zip(chord_start_list, chord_end_list, chords)
+    ]
+
+
+def get_key_segments(directory):
+    """
+    Reads the key regions of key_audio.txt, sorted by their start.
+
+    Returns:
+    ----------
+        tuple[np.ndarray, list[str]]: The start of each region in seconds and its key, e.g. "Eb:min".
+    """
+    starts, keys = [], []
+    with open(os.path.join(directory, "key_audio.txt"), "r") as file:
+        for line in file:
+            components = line.split()
+            starts.append(float(components[0]))
+            keys.append(components[2])
+    order = np.argsort(starts, kind="stable")
+    return np.array(starts, dtype=np.float64)[order], [keys[idx] for idx in order]
+
+
+def get_segments(key_starts, times):
+    """
+    Returns the index of the key region each time in seconds falls in. Times before the
+    first region belong to the first region.
+    """
+    return np.clip(np.searchsorted(key_starts, times, side="right") - 1, 0, None)
 
 
 def flat_to_sharp(chords):
@@ -1,3 +1,4 @@
+import sys
 import pandas as pd
 import re
 
@@ -12,6 +13,17 @@ from scipy.stats import friedmanchisquare
 from scipy.stats import wilcoxon
 from statsmodels.stats.multitest import multipletests
 
+sys.path.append("..")
+from resampling import compare_groups
+
+METRICS = [
+    "Harmony",
+    "Rhythm",
+    "Musical Intention",
+    "Subjective Evaluation",
+    "Average",
+]
+
 SONG_MAPPING = {
     1: ["bad", "high", "1"],
     2: ["good", "high", "1"],
@@ -40,102 +52,91 @@ SONG_MAPPING = {
     25: ["good", "high", "3"],
 }
 
-answers = []
-
-good = []
-bad = []
-
-good_high = []
-good_mid = []
-good_low = []
-
-bad_high = []
-bad_mid = []
-bad_low = []
-
-high = []
-mid = []
-low = []
-
-pro = []
-non_pro = []
-
-male = []
-female = []
-
-interested = []
-non_interested = []
-
-interested_non_pro = []
-
-
-def get_data():
-    df = pd.read_csv("data/responses.csv")
-    for idx, row in df.iterrows():
-        elements = row[3:7].tolist()
-        answers.append(elements)
-    df = df.iloc[:, 7:]
-
-    for idx, start_col in enumerate(range(0, len(df.columns), 4)):
-        if idx == 18:
-            continue
-        end_col = start_col + 4
-        df_subset = df.iloc[:, start_col:end_col]
-        extract_first_number = lambda x: int(re.search(r"\d+", x).group())
-
-        result_lists = []
-        for index, row in df_subset.iterrows():
-
-            # Extract and convert numeric values
-            numeric_values = [extract_first_number(cell) for cell in row]
-            # Calculate average
-            avg_value = sum(numeric_values) / len(numeric_values)
-            # Append average to the list of values
-            row_list = numeric_values + [avg_value]
-
-            if int(answers[index][3][0]) > 2:
-                pro.append(row_list)
-            else:
-                non_pro.append(row_list)
-
-            if int(answers[index][1][0]) == 1:
-                male.append(row_list)
-            else:
-                female.append(row_list)
-
-            if int(answers[index][2][0]) > 3:
-                interested.append(row_list)
-            else:
-                non_interested.append(row_list)
-
-            if int(answers[index][2][0]) > 3 and int(answers[index][3][0]) < 3:
-                interested_non_pro.append(row_list)
-
-            if SONG_MAPPING[idx + 1][0] == "good":
-                good.append(row_list)
-                if SONG_MAPPING[idx + 1][1] == "high":
-                    good_high.append(row_list)
-                    high.append(row_list)
-                elif SONG_MAPPING[idx + 1][1] == "mid":
-                    good_mid.append(row_list)
-                    mid.append(row_list)
-                else:
-                    good_low.append(row_list)
-                    low.append(row_list)
-            else:
-                bad.append(row_list)
-                if SONG_MAPPING[idx + 1][1] == "high":
-                    bad_high.append(row_list)
-                    high.append(row_list)
-                elif SONG_MAPPING[idx + 1][1] == "mid":
-                    bad_mid.append(row_list)
-                    mid.append(row_list)
-                else:
-                    bad_low.append(row_list)
-                    low.append(row_list)
-
-
-def get_results(printers, print_pro, print_interest, print_gender, print_age):
+# Song 19 was left out of the analysis
+EXCLUDED_SONGS = [19]
+
+# Categories of the participant answers, as numbered in the survey
+GENDERS = {1: "male", 2: "female"}
+
+
+def get_data(path: str = "data/responses.csv") -> pd.DataFrame:
+    """
+    Reads the survey responses into a long-format table with one row per participant and
+    song: the rating of each metric, their average, the song's communication (good or
+    bad), creativity level and variation from SONG_MAPPING, and the participant's answers.
+
+    Args:
+    ----------
+        path (str): The CSV export of the survey, one row per participant with the four
+            participant questions followed by the four ratings of every song.
+
+    Returns:
+    ----------
+        pd.DataFrame: The ratings, ordered by song and then participant.
+    """
+    df = pd.read_csv(path)
+    num_participants = len(df)
+
+    participants = pd.DataFrame(
+        {
+            "age": df.iloc[:, 3].str.extract(r"\((.*)\)", expand=False).str.strip(),
+            "gender": pd.Categorical(
+                get_first_number(df.iloc[:, 4]).map(GENDERS),
+                categories=list(GENDERS.values()),
+            ),
+            "interest": get_first_number(df.iloc[:, 5]),
+            "experience": get_first_number(df.iloc[:, 6]),
+        }
+    )
+    participants["pro"] = participants["experience"] > 2
+    participants["interested"] = participants["interest"] > 3
+
+    # (participants, songs * metrics) -> (songs * participants, metrics)
+    num_metrics = len(METRICS) - 1
+    ratings = df.iloc[:, 7:].apply(get_first_number).to_numpy()
+    num_songs = ratings.shape[1] // num_metrics
+    ratings = ratings.reshape(num_participants, num_songs, num_metrics)
+    ratings = ratings.transpose(1, 0, 2).reshape(-1, num_metrics)
+
+    data = pd.DataFrame(ratings, columns=METRICS[:-1])
+    data["Average"] = data[METRICS[:-1]].mean(axis=1)
+    data["song"] = np.repeat(np.arange(1, num_songs + 1), num_participants)
+    data["participant"] = np.tile(np.arange(num_participants), num_songs)
+    data = data[~data["song"].isin(EXCLUDED_SONGS)].reset_index(drop=True)
+
+    songs = pd.DataFrame.from_dict(
+        SONG_MAPPING, orient="index", columns=["coms", "creativity", "variation"]
+    )
+    songs["coms"] = pd.Categorical(songs["coms"], categories=["good", "bad"])
+    songs["creativity"] = pd.Categorical(
+        songs["creativity"], categories=["low", "mid", "high"], ordered=True
+    )
+    return data.join(songs, on="song").join(participants, on="participant")
+
+
+def get_first_number(column: pd.Series) -> pd.Series:
+    """
+    Extracts the number an answer starts with, e.g. 3 from "3 (Neutral)".
+    """
+    return column.astype(str).str.extract(r"(\d+)", expand=False).astype(int)
+
+
+def get_ratings(data: pd.DataFrame, **conditions) -> np.ndarray:
+    """
+    Selects the ratings of the rows matching all conditions, e.g.
+    get_ratings(data, coms="good", creativity="high").
+
+    Returns:
+    ----------
+        np.ndarray: One row per participant and song, one column per metric in METRICS.
+    """
+    mask = np.ones(len(data), dtype=bool)
+    for column, value in conditions.items():
+        mask &= (data[column] == value).to_numpy()
+    return data.loc[mask, METRICS].to_numpy()
+
+
+def get_results(data, printers, print_pro, print_interest, print_gender, print_age):
     strings = [
         "Harmony scores",
         "Rhythm scores",
@@ -143,105 +144,83 @@ def get_results(printers, print_pro, print_interest, print_gender, print_age):
         "Subjective evaluation scores",
         "Average scores",
     ]
-    for idx, text in enumerate(strings):
+    by_coms = data.groupby("coms", observed=True)[METRICS].mean()
+    by_creativity = data.groupby("creativity", observed=True)[METRICS].mean()
+    by_both = data.groupby(["creativity", "coms"], observed=True)[METRICS].mean()
+    for idx, (metric, text) in enumerate(zip(METRICS, strings)):
         if printers[idx]:
             print(f"--------------{text}--------------")
-            row_averages = [row[idx] for row in good]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("good average score:", overall_average)
-
-            row_averages = [row[idx] for row in bad]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("bad average score:", overall_average)
-            print()
-
-            row_averages = [row[idx] for row in high]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("high average score:", overall_average)
-
-            row_averages = [row[idx] for row in mid]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("mid average score:", overall_average)
-
-            row_averages = [row[idx] for row in low]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("low average score:", overall_average)
+            for coms in ["good", "bad"]:
+                print(f"{coms} average score:", by_coms.loc[coms, metric])
             print()
 
-            row_averages = [row[idx] for row in good_high]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("good_high average score:", overall_average)
-
-            row_averages = [row[idx] for row in bad_high]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("bad_high average score:", overall_average)
-            print()
-
-            row_averages = [row[idx] for row in good_mid]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("good_mid average score:", overall_average)
-
-            row_averages = [row[idx] for row in bad_mid]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("bad_mid average score:", overall_average)
+            for creativity in ["high", "mid", "low"]:
+                print(
+                    f"{creativity} average score:",
+                    by_creativity.loc[creativity, metric],
+                )
             print()
 
-            row_averages = [row[idx] for row in good_low]
-            overall_average = sum(row_averages) / len(row_averages)
-            print("good_low average score:", overall_average)
-
-            row_averages = [row[idx] for row in bad_low]
-            overall_average = sum(row_averages) / len(row_averages)
-
-            print("bad_low average score:", overall_average)
-            print()
+            for creativity in ["high", "mid", "low"]:
+                for coms in ["good", "bad"]:
+                    print(
+                        f"{coms}_{creativity} average score:",
+                        by_both.loc[(creativity, coms), metric],
+                    )
+                print()
             print()
 
     if print_pro:
         print("--------------Pro--------------")
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in pro]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Pro {text} average score:", overall_average)
-        print()
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in non_pro]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Non_pro {text} average score:", overall_average)
-        print()
+        print_group_means(
+            data, data["pro"], [(True, "Pro"), (False, "Non_pro")], strings
+        )
 
     if print_interest:
         print("--------------Interest--------------")
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in interested]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Interested {text} average score:", overall_average)
-        print()
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in non_interested]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Not interested {text} average score:", overall_average)
-        print()
+        print_group_means(
+            data,
+            data["interested"],
+            [(True, "Interested"), (False, "Not interested")],
+            strings,
+        )
 
     if print_gender:
         print("--------------Gender--------------")
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in male]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Male {text} average score:", overall_average)
-        print()
-        for idx, text in enumerate(strings):
-            row_averages = [row[idx] for row in female]
-            overall_average = sum(row_averages) / len(row_averages)
-            print(f"Female {text} average score:", overall_average)
-        print()
+        print_group_means(
+            data, data["gender"], [("male", "Male"), ("female", "Female")], strings
+        )
+
+    if print_age:
+        print("--------------Age--------------")
+        ages = sorted(data["age"].unique())
+        print_group_means(data, data["age"], [(age, age) for age in ages], strings)
 
     print("--------------Interested_non_pro--------------")
-    for idx, text in enumerate(strings):
-        row_averages = [row[idx] for row in interested_non_pro]
-        overall_average = sum(row_averages) / len(row_averages)
-        print(f"Interested non pro {text} average score:", overall_average)
-    print()
+    print_group_means(
+        data,
+        data["interested"] & (data["experience"] < 3),
+        [(True, "Interested non pro")],
+        strings,
+    )
+
+
+def print_group_means(data, groups, labels, strings):
+    """
+    Prints the average score of every metric per group.
+
+    Args:
+    ----------
+        data (pd.DataFrame): The table from get_data.
+        groups (pd.Series): The group of each row.
+        labels (list[tuple]): The groups to print, as (group, label) pairs.
+        strings (list[str]): The name of each metric in METRICS.
+    """
+    means = data.groupby(groups, observed=True)[METRICS].mean()
+    for group, label in labels:
+        for metric, text in zip(METRICS, strings):
+            print(f"{label} {text} average score:", means.loc[group, metric])
+        print()
 
 
 def plot_figures(good, bad, title):
@@ -260,6 +239,7 @@ def plot_figures(good, bad, title):
             titles[i] = titles[i] + "*"
 
     print(p_values_df)
+    print(resampling_test(good, bad))
     good_df = pd.DataFrame(
         good,
         columns=titles,
@@ -344,6 +324,19 @@ def statistical_test(group1, group2, type):
     return results_df
 
 
+def resampling_test(group1, group2, correction="bonferroni"):
+    """
+    Bootstrap confidence intervals of the difference of the mean ratings and permutation
+    tests, for all metrics at once, corrected for the number of metrics. Runs in this
+    process, as the survey is small and this script has no __main__ guard.
+    """
+    return compare_groups(
+        pd.DataFrame(group1, columns=METRICS),
+        pd.DataFrame(group2, columns=METRICS),
+        correction=correction,
+    )
+
+
 def shapiro_wilk_test(data):
     for i in range(len(data)):
 
@@ -361,7 +354,7 @@ def shapiro_wilk_test(data):
     print()
 
 
-def largest_difference():
+def largest_difference(good, bad):
     good_df = pd.DataFrame(
         good,
         columns=[
@@ -497,27 +490,36 @@ print_interest = False
 print_gender = False
 print_age = False
 
-get_data()
-# get_results(printers, print_pro, print_interest, print_gender, print_age)
+data = get_data()
+good = get_ratings(data, coms="good")
+bad = get_ratings(data, coms="bad")
+# get_results(data, printers, print_pro, print_interest, print_gender, print_age)
 
-# friedman_test(list(zip(*bad_high)), list(zip(*bad_mid)), list(zip(*bad_low)))
+# friedman_test(
+#     list(zip(*get_ratings(data, coms="bad", creativity="high"))),
+#     list(zip(*get_ratings(data, coms="bad", creativity="mid"))),
+#     list(zip(*get_ratings(data, coms="bad", creativity="low"))),
+# )
 
-# wilcoxon_test(list(zip(*good_high)), list(zip(*good_mid)), list(zip(*good_low)))
+# wilcoxon_test(
+#     list(zip(*get_ratings(data, coms="good", creativity="high"))),
+#     list(zip(*get_ratings(data, coms="good", creativity="mid"))),
+#     list(zip(*get_ratings(data, coms="good", creativity="low"))),
+# )
 
-# shapiro_wilk_test(list(zip(*good_low)))
-# shapiro_wilk_test(list(zip(*good_mid)))
-# shapiro_wilk_test(list(zip(*good_high)))
+# shapiro_wilk_test(list(zip(*get_ratings(data, coms="good", creativity="low"))))
+# shapiro_wilk_test(list(zip(*get_ratings(data, coms="good", creativity="mid"))))
+# shapiro_wilk_test(list(zip(*get_ratings(data, coms="good", creativity="high"))))
 
-# print(t_test(pro, non_pro))
-# print()
-# t_test(good_mid, bad_mid)
-# print()
-# t_test(good_high, bad_high)
+# print(statistical_test(get_ratings(data, pro=True), get_ratings(data, pro=False), "t"))
 
-# largest_difference()
+# largest_difference(good, bad)
 plot_figures(good, bad, "Survey Results, All Samples")
 
 
-# plot_figures(good_high, bad_high, "Survey Results, High Creativity")
-# plot_figures(good_mid, bad_mid, "Survey Results, Medium Creativity")
-# plot_figures(good_low, bad_low, "Survey Results, Low Creativity")
+# for creativity, name in [("high", "High"), ("mid", "Medium"), ("low", "Low")]:
+#     plot_figures(
+#         get_ratings(data, coms="good", creativity=creativity),
+#         get_ratings(data, coms="bad", creativity=creativity),
+#         f"Survey Results, {name} Creativity",
+#     )